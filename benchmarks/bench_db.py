@@ -0,0 +1,137 @@
+"""
+Query latency of the hot-path queries before and after the schema migrations.
+
+Builds a throw-away database with the base schema only, fills it with synthetic
+data, times every query, then runs the migrations and times them again.
+
+Usage:
+    python benchmarks/bench_db.py [--users 100000] [--runs 20]
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('BOT_TOKEN', '0:benchmark')  # config.py refuses to load without a token
+
+import database  # noqa: E402
+
+NOW = datetime(2025, 1, 15, 12, 0, 0)
+
+QUERIES = [
+    ("get_user_channels",
+     'SELECT channel_id FROM channels WHERE user_id = ?', lambda n: (random.randint(1, n),)),
+    ("pending payment requests",
+     "SELECT * FROM payment_requests WHERE status = 'pending' ORDER BY created_at DESC", lambda n: ()),
+    ("all payment requests (latest 50)",
+     'SELECT * FROM payment_requests ORDER BY created_at DESC LIMIT 50', lambda n: ()),
+    ("due scheduled posts",
+     'SELECT job_id FROM scheduled_posts WHERE scheduled_time_utc <= ? ORDER BY scheduled_time_utc LIMIT 100',
+     lambda n: ((NOW - timedelta(days=1)).isoformat(),)),
+    ("new users this week",
+     'SELECT COUNT(*) FROM users WHERE created_at > ?', lambda n: ((NOW - timedelta(days=7)).isoformat(),)),
+    ("premium users",
+     'SELECT COUNT(*) FROM users WHERE is_premium = 1', lambda n: ()),
+    ("premium channels",
+     '''SELECT channel_id, user_id, premium_until, created_at FROM channel_premium
+        WHERE is_premium = 1 AND premium_until > ? ORDER BY premium_until ASC''', lambda n: (NOW.isoformat(),)),
+    ("top users",
+     '''SELECT u.user_id, u.language_code, s.total_posts_sent, s.posts_sent_this_month
+        FROM users u LEFT JOIN user_stats s ON u.user_id = s.user_id
+        WHERE s.total_posts_sent > 0 ORDER BY s.total_posts_sent DESC LIMIT 10''', lambda n: ()),
+]
+
+
+async def populate(db, users: int):
+    """Fills the base schema with synthetic rows."""
+    def iso(days_ago: float) -> str:
+        return (NOW - timedelta(days=days_ago)).isoformat()
+
+    await db.executemany(
+        'INSERT INTO users (user_id, language_code, is_premium, premium_until, created_at) VALUES (?, ?, ?, ?, ?)',
+        ((u, random.choice(['fa', 'en']), int(random.random() < 0.03),
+          iso(-30) if random.random() < 0.03 else None, iso(random.uniform(0, 700)))
+         for u in range(1, users + 1))
+    )
+    await db.executemany(
+        'INSERT INTO user_stats (user_id, posts_sent_this_month, total_posts_sent) VALUES (?, ?, ?)',
+        ((u, random.randint(0, 10), random.randint(0, 500)) for u in range(1, users + 1))
+    )
+    channel_rows = [(-1000000000000 - i, random.randint(1, users)) for i in range(int(users * 1.5))]
+    await db.executemany('INSERT OR IGNORE INTO channels (channel_id, user_id) VALUES (?, ?)', channel_rows)
+    await db.executemany(
+        'INSERT OR IGNORE INTO channel_premium (channel_id, user_id, is_premium, premium_until) VALUES (?, ?, ?, ?)',
+        ((c, u, int(random.random() < 0.05), iso(random.uniform(-90, 90))) for c, u in channel_rows)
+    )
+    await db.executemany(
+        '''INSERT INTO payment_requests (user_id, channel_id, channel_title, duration_months, amount, status, created_at)
+           VALUES (?, ?, ?, ?, ?, ?, ?)''',
+        ((random.randint(1, users), -1, 'bench', 1, 100000,
+          random.choices(['pending', 'approved', 'rejected'], [1, 15, 4])[0], iso(random.uniform(0, 700)))
+         for _ in range(users // 5))
+    )
+    await db.executemany(
+        '''INSERT INTO scheduled_posts (job_id, user_id, post_chat_id, post_message_id, target_channel_id, caption, scheduled_time_utc)
+           VALUES (?, ?, ?, ?, ?, ?, ?)''',
+        ((f"job-{i}", random.randint(1, users), 1, i, -1, None, iso(random.uniform(-30, 30)))
+         for i in range(users // 2))
+    )
+    await db.commit()
+
+
+async def time_queries(db, users: int, runs: int) -> dict:
+    """Returns the median latency in milliseconds of every query."""
+    results = {}
+    for name, sql, params in QUERIES:
+        samples = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            cursor = await db.execute(sql, params(users))
+            await cursor.fetchall()
+            samples.append((time.perf_counter() - started) * 1000)
+        results[name] = statistics.median(samples)
+    return results
+
+
+async def main(users: int, runs: int):
+    random.seed(42)
+    database.DB_NAME = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    await database.open_pool()
+    try:
+        async with database.get_db() as db:
+            await database.create_tables(db)
+            await db.commit()
+
+            started = time.perf_counter()
+            await populate(db, users)
+            print(f"Populated {users} users in {time.perf_counter() - started:.1f}s ({database.DB_NAME})")
+
+            before = await time_queries(db, users, runs)
+
+            started = time.perf_counter()
+            # Only the index migration: later ones move rows out of the legacy tables queried here
+            await database.run_migrations(db, target=1)
+            print(f"Migrations applied in {time.perf_counter() - started:.2f}s\n")
+
+            after = await time_queries(db, users, runs)
+    finally:
+        await database.close_db()
+
+    print(f"{'query':<34} {'before ms':>10} {'after ms':>10} {'speedup':>8}")
+    for name, _, _ in QUERIES:
+        speedup = before[name] / after[name] if after[name] else float('inf')
+        print(f"{name:<34} {before[name]:>10.3f} {after[name]:>10.3f} {speedup:>7.1f}x")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--runs', type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(main(args.users, args.runs))
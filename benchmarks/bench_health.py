@@ -0,0 +1,111 @@
+"""
+Channel health audit: how long one full sweep over N registered channels takes.
+
+The bot is replaced by an in-process object whose get_chat_member sleeps for a
+simulated Bot API round trip; a fraction of channels report the bot as removed
+or demoted. Each run registers N channels in a fresh database and times one
+sweep. A sweep is bound by the rate budget (N / rate) or by round trips
+(N * RTT / concurrency), whichever is slower, plus the auditor's own database
+work, which the last column isolates.
+
+Usage:
+    python benchmarks/bench_health.py [--channels 50000] [--rates 20 100000] [--concurrency 8 64] [--rtt-ms 80]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('BOT_TOKEN', '0:benchmark')  # config.py refuses to load without a token
+
+import database  # noqa: E402
+from aiogram.exceptions import TelegramForbiddenError  # noqa: E402
+from aiogram.methods import GetChatMember  # noqa: E402
+from utils.channel_health import ChannelHealthAuditor  # noqa: E402
+
+
+class SimulatedBot:
+    """Just enough of aiogram's Bot for the auditor."""
+
+    id = 1
+
+    def __init__(self, rtt: float, bad_rate: float):
+        self.rtt = rtt
+        self.bad_rate = bad_rate
+        self.calls = 0
+
+    async def get_chat_member(self, chat_id, user_id):
+        self.calls += 1
+        await asyncio.sleep(self.rtt)
+        roll = random.random()
+        if roll < self.bad_rate / 2:
+            method = GetChatMember(chat_id=chat_id, user_id=user_id)
+            raise TelegramForbiddenError(method=method, message="Forbidden: bot was kicked from the channel chat")
+        if roll < self.bad_rate:
+            return type('ChatMember', (), {'status': 'administrator', 'can_post_messages': False})()
+        return type('ChatMember', (), {'status': 'administrator', 'can_post_messages': True})()
+
+
+async def run(channels: int, rate: float, concurrency: int, rtt: float, bad_rate: float, batch_size: int):
+    database.DB_NAME = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    await database.init_db()
+    try:
+        async with database.get_db() as db:
+            await db.executemany('INSERT INTO channels (channel_id, user_id) VALUES (?, ?)',
+                                 [(-1000000000000 - i, i % 5000 + 1) for i in range(channels)])
+            await db.commit()
+
+        bot = SimulatedBot(rtt, bad_rate)
+        auditor = ChannelHealthAuditor()
+        # Driven batch by batch instead of through start(), so the sweep is timed alone
+        auditor.start(bot, rate=rate, concurrency=concurrency, batch_size=batch_size)
+        await auditor.stop()
+        started = time.perf_counter()
+        while await auditor.audit_batch() == batch_size:
+            pass
+        sweep = time.perf_counter() - started
+        summary = await database.get_channel_health_summary()
+
+        started = time.perf_counter()
+        ids = await database.get_channels_due_for_audit(database.utc_timestamp(delay=60), batch_size)
+        scan_ms = (time.perf_counter() - started) * 1000
+        started = time.perf_counter()
+        await database.save_channel_health_batch([(channel_id, 'ok', None) for channel_id in ids])
+        save_ms = (time.perf_counter() - started) * 1000
+    finally:
+        await database.close_db()
+
+    bound = max(channels / rate, channels * rtt / concurrency)
+    print(f"rate={rate:<8g} concurrency={concurrency:<4} sweep: {sweep:8.1f}s ({bound:8.1f}s bound, "
+          f"{channels / sweep:6.0f} checks/s)   calls={bot.calls}   {summary}   "
+          f"db per batch of {batch_size}: scan {scan_ms:.1f}ms + save {save_ms:.1f}ms")
+
+
+async def main(args):
+    random.seed(42)
+    logging.disable(logging.WARNING)
+    print(f"{args.channels} channels, simulated RTT {args.rtt_ms}ms, {args.bad_rate:.1%} unhealthy, "
+          f"batches of {args.batch_size}")
+    for rate in args.rates:
+        if args.channels / rate > args.max_seconds:
+            print(f"rate={rate:<8g} skipped: a sweep takes at least {args.channels / rate / 60:.0f} minutes")
+            continue
+        for concurrency in args.concurrency:
+            await run(args.channels, rate, concurrency, args.rtt_ms / 1000, args.bad_rate, args.batch_size)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--channels', type=int, default=50000)
+    parser.add_argument('--rates', type=float, nargs='+', default=[100000])
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[8, 64, 512])
+    parser.add_argument('--rtt-ms', type=float, default=80)
+    parser.add_argument('--bad-rate', type=float, default=0.02)
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--max-seconds', type=float, default=600, help="skip rates whose sweep would take longer")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,87 @@
+"""
+Delivery ledger: cost of a batched ledger insert as the table grows, and of the stats queries.
+
+Rows are written like the outbox flush writes them (one transaction per batch,
+ids ascending) for `--channels` channels. The insert time of a batch is
+reported at every `--report-every` rows, so any slowdown from the indexes as
+the table grows shows up. At the end the per-channel stats and percentile
+queries are timed.
+
+Usage:
+    python benchmarks/bench_ledger.py [--rows 2000000] [--batch 500] [--channels 50000]
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('BOT_TOKEN', '0:benchmark')  # config.py refuses to load without a token
+
+import database  # noqa: E402
+
+INSERT = '''
+    INSERT OR IGNORE INTO deliveries (id, batch_id, user_id, post_chat_id, post_message_id, channel_id, message_id,
+                                      status, error_code, attempts, enqueued_at, finished_at, latency_ms)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+
+async def timed(label: str, coro):
+    started = time.perf_counter()
+    result = await coro
+    print(f"  {label:<44} {(time.perf_counter() - started) * 1000:8.1f}ms")
+    return result
+
+
+async def main(args):
+    random.seed(42)
+    database.DB_NAME = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    await database.init_db()
+    print(f"{args.rows} ledger rows in batches of {args.batch}, {args.channels} channels")
+    try:
+        next_id, window = 1, []
+        finished_at = database.utc_timestamp()
+        while next_id <= args.rows:
+            batch = []
+            for _ in range(args.batch):
+                channel = random.randrange(args.channels)
+                failed = random.random() < 0.02
+                batch.append((next_id, f"post-{next_id // 10}", channel % 5000, 1, next_id // 10, -1000000000000 - channel,
+                               None if failed else next_id, 'failed' if failed else 'sent',
+                               'TelegramForbiddenError' if failed else None, 1, finished_at, finished_at,
+                               None if failed else int(random.expovariate(1 / 400))))
+                next_id += 1
+            started = time.perf_counter()
+            async with database.get_db() as db:
+                await db.executemany(INSERT, batch)
+                await db.commit()
+            window.append(time.perf_counter() - started)
+            if (next_id - 1) % args.report_every < args.batch:
+                print(f"  at {next_id - 1:>9} rows: insert of {args.batch} rows {sum(window) / len(window) * 1000:6.2f}ms avg "
+                      f"({args.batch / (sum(window) / len(window)):8.0f} rows/s)")
+                window = []
+
+        since = database.utc_timestamp(delay=-86400)
+        channel = -1000000000000 - 7
+        await timed("stats, one channel", database.get_channel_delivery_stats(since, channel))
+        await timed("latency percentiles, one channel", database.get_channel_latency_percentiles(channel, since))
+        await timed("stats, worst 10 of all channels", database.get_channel_delivery_stats(since))
+        async with database.get_db() as db:
+            await timed("copies of one post (edit/delete lookup)", (await db.execute(
+                'SELECT channel_id, message_id FROM deliveries WHERE post_chat_id = ? AND post_message_id = ?', (1, 12345)
+            )).fetchall())
+    finally:
+        await database.close_db()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=2000000)
+    parser.add_argument('--batch', type=int, default=500)
+    parser.add_argument('--channels', type=int, default=50000)
+    parser.add_argument('--report-every', type=int, default=500000)
+    asyncio.run(main(parser.parse_args()))
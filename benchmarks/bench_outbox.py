@@ -0,0 +1,105 @@
+"""
+Outbox throughput: enqueue, claim and deliver N queued channel posts.
+
+The bot is replaced by an in-process object whose copy_message sleeps for a
+simulated Bot API round trip, so the numbers show the outbox's own overhead
+(claim queries, result flushes) and how well the worker pool overlaps RTTs.
+A fraction of sends can be made to fail to exercise the retry/failed paths.
+
+Usage:
+    python benchmarks/bench_outbox.py [--deliveries 10000] [--workers 8 32] [--rtt-ms 50] [--fail-rate 0.01]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('BOT_TOKEN', '0:benchmark')  # config.py refuses to load without a token
+
+import database  # noqa: E402
+from aiogram.exceptions import TelegramForbiddenError  # noqa: E402
+from aiogram.methods import CopyMessage  # noqa: E402
+from utils.outbox import OutboxWorker  # noqa: E402
+
+
+class SimulatedBot:
+    """Just enough of aiogram's Bot for the outbox worker."""
+
+    def __init__(self, rtt: float, fail_rate: float):
+        self.rtt = rtt
+        self.fail_rate = fail_rate
+        self.copies = 0
+        self.reports = 0
+
+    async def copy_message(self, chat_id, from_chat_id, message_id, **kwargs):
+        await asyncio.sleep(self.rtt)
+        if random.random() < self.fail_rate:
+            method = CopyMessage(chat_id=chat_id, from_chat_id=from_chat_id, message_id=message_id)
+            raise TelegramForbiddenError(method=method, message="Forbidden: bot was kicked from the channel chat")
+        self.copies += 1
+        return type('MessageId', (), {'message_id': self.copies})()
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.reports += 1
+
+
+async def run(deliveries: int, workers: int, rtt: float, fail_rate: float, channels_per_post: int):
+    database.DB_NAME = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    await database.init_db()
+    try:
+        started = time.perf_counter()
+        posts = deliveries // channels_per_post
+        for post in range(posts):
+            targets = [-1000000000000 - (post * channels_per_post + i) for i in range(channels_per_post)]
+            await database.enqueue_outbox(f"post-{post}", post % 1000 + 1, 1, post, targets, "caption")
+        enqueue_time = time.perf_counter() - started
+
+        started = time.perf_counter()
+        claimed = await database.claim_outbox_batch(100, 60, 'bench')
+        claim_ms = (time.perf_counter() - started) * 1000
+        await database.requeue_outbox_leases(claimed_by='bench')
+
+        bot = SimulatedBot(rtt, fail_rate)
+        worker = OutboxWorker()
+        started = time.perf_counter()
+        worker.start(bot, workers=workers)
+        while True:
+            counts = await database.get_outbox_stats()
+            if not counts.get('pending') and not counts.get('sending'):
+                break
+            await asyncio.sleep(0.05)
+        drain_time = time.perf_counter() - started
+        await worker.stop()
+        counts = await database.get_outbox_stats()
+    finally:
+        await database.close_db()
+
+    print(f"workers={workers:<4} enqueue {posts * channels_per_post} rows: {enqueue_time:6.2f}s   "
+          f"claim(100): {claim_ms:5.2f}ms ({len(claimed)} rows)   "
+          f"drain: {drain_time:6.2f}s = {deliveries / drain_time:7.0f} deliveries/s   "
+          f"sent={counts.get('sent', 0)} failed={counts.get('failed', 0)} reports={bot.reports}")
+
+
+async def main(args):
+    random.seed(42)
+    logging.disable(logging.ERROR)  # the simulated failures would flood the output
+    print(f"{args.deliveries} deliveries, {args.channels_per_post} channels per post, "
+          f"simulated RTT {args.rtt_ms}ms, fail rate {args.fail_rate:.1%}")
+    print(f"sequential sends would take ~{args.deliveries * args.rtt_ms / 1000:.0f}s")
+    for workers in args.workers:
+        await run(args.deliveries, workers, args.rtt_ms / 1000, args.fail_rate, args.channels_per_post)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--deliveries', type=int, default=10000)
+    parser.add_argument('--workers', type=int, nargs='+', default=[8, 32, 128])
+    parser.add_argument('--rtt-ms', type=float, default=50)
+    parser.add_argument('--fail-rate', type=float, default=0.01)
+    parser.add_argument('--channels-per-post', type=int, default=10)
+    asyncio.run(main(parser.parse_args()))
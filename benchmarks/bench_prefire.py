@@ -0,0 +1,104 @@
+"""
+Send-time lateness of scheduled posts with and without the pre-fire warm-up.
+
+Schedules N posts through APScheduler, bunched into a few busy seconds the way
+posts pile up at popular times, and delivers them with the outbox worker and
+a simulated bot. For every delivery the lateness is the time between the
+post's scheduled_time_utc and the start of its copy_message call; p50/p99 are
+reported for each lead time (0 = the rows are read and queued at fire time).
+
+Usage:
+    python benchmarks/bench_prefire.py [--posts 300] [--leads 0 5] [--workers 256] [--rtt-ms 50]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('BOT_TOKEN', '0:benchmark')  # config.py refuses to load without a token
+
+import config  # noqa: E402
+import database  # noqa: E402
+from apscheduler.schedulers.asyncio import AsyncIOScheduler  # noqa: E402
+from bench_outbox import SimulatedBot  # noqa: E402
+from utils.outbox import outbox_worker  # noqa: E402
+from utils.scheduler import schedule_post_job  # noqa: E402
+
+
+class TimingBot(SimulatedBot):
+    """Records when each copy_message call starts, per post."""
+
+    def __init__(self, rtt: float):
+        super().__init__(rtt, fail_rate=0)
+        self.started = []
+
+    async def copy_message(self, chat_id, from_chat_id, message_id, **kwargs):
+        self.started.append((message_id, time.time()))
+        return await super().copy_message(chat_id, from_chat_id, message_id, **kwargs)
+
+
+def percentile(samples: list, q: float) -> float:
+    return samples[min(len(samples) - 1, int(len(samples) * q))]
+
+
+async def run(posts: int, lead: float, workers: int, rtt: float, channels_per_post: int, busy_seconds: int):
+    config.PREFIRE_LEAD_SECONDS = lead
+    database.DB_NAME = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    await database.init_db()
+    bot = TimingBot(rtt)
+    scheduler = AsyncIOScheduler(timezone="Asia/Tehran")
+    try:
+        outbox_worker.start(bot, workers=workers)
+        scheduler.start()
+
+        # Every post lands on one of a few whole seconds, starting after the lead time has passed
+        first = datetime.now(timezone.utc).replace(microsecond=0) + timedelta(seconds=lead + 3)
+        due = {}
+        for post in range(posts):
+            run_date = first + timedelta(seconds=random.randrange(busy_seconds))
+            batch_id = str(uuid.uuid4())
+            targets = [-1000000000000 - (post * channels_per_post + i) for i in range(channels_per_post)]
+            await database.add_scheduled_batch(batch_id, post % 1000 + 1, 1, post, targets, "caption",
+                                               run_date.isoformat())
+            schedule_post_job(scheduler, batch_id, run_date, bot)
+            due[post] = run_date.timestamp()
+
+        expected = posts * channels_per_post
+        deadline = time.time() + lead + busy_seconds + 60
+        while len(bot.started) < expected and time.time() < deadline:
+            await asyncio.sleep(0.05)
+    finally:
+        scheduler.shutdown(wait=False)
+        await outbox_worker.stop()
+        await database.close_db()
+
+    lateness = sorted((started - due[message_id]) * 1000 for message_id, started in bot.started)
+    print(f"lead={lead:>4.0f}s  {len(lateness)}/{expected} deliveries   lateness p50 {percentile(lateness, 0.5):6.0f} ms   "
+          f"p99 {percentile(lateness, 0.99):6.0f} ms   max {lateness[-1]:6.0f} ms")
+
+
+async def main(args):
+    random.seed(42)
+    logging.disable(logging.WARNING)
+    print(f"{args.posts} posts x {args.channels_per_post} channels over {args.busy_seconds} busy seconds, "
+          f"{args.workers} senders, simulated RTT {args.rtt_ms}ms")
+    for lead in args.leads:
+        await run(args.posts, lead, args.workers, args.rtt_ms / 1000, args.channels_per_post, args.busy_seconds)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--posts', type=int, default=300)
+    parser.add_argument('--leads', type=float, nargs='+', default=[0, 5])
+    parser.add_argument('--workers', type=int, default=256)
+    parser.add_argument('--rtt-ms', type=float, default=50)
+    parser.add_argument('--channels-per-post', type=int, default=3)
+    parser.add_argument('--busy-seconds', type=int, default=3)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,93 @@
+"""
+Startup cost of re-registering pending scheduled posts after a restart.
+
+Fills `scheduled_batches` with N posts (a share of them already past due), then
+times the bulk load, the APScheduler job registration, scheduler start-up and
+the throttled catch-up of the past-due posts into the outbox.
+
+Usage:
+    python benchmarks/bench_rehydrate.py [--posts 100000] [--past-due 0.1]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('BOT_TOKEN', '0:benchmark')  # config.py refuses to load without a token
+
+import database  # noqa: E402
+from apscheduler.schedulers.asyncio import AsyncIOScheduler  # noqa: E402
+from utils.scheduler import catch_up_past_due_posts, rehydrate_scheduled_posts  # noqa: E402
+
+
+async def populate(posts: int, past_due: float, channels_per_post: int):
+    now = datetime.now(timezone.utc)
+    batches, targets = [], []
+    for i in range(posts):
+        if random.random() < past_due:
+            when = now - timedelta(minutes=random.uniform(1, 600))
+        else:
+            when = now + timedelta(minutes=random.uniform(10, 60 * 24 * 30))
+        batch_id = str(uuid.uuid4())
+        batches.append((batch_id, random.randint(1, 20000), 1, i, None, when.isoformat()))
+        targets += [(batch_id, -1000000000000 - random.randint(0, 5000)) for _ in range(channels_per_post)]
+    async with database.get_db() as db:
+        await db.executemany(
+            '''INSERT INTO scheduled_batches (batch_id, user_id, post_chat_id, post_message_id, caption, scheduled_time_utc)
+               VALUES (?, ?, ?, ?, ?, ?)''', batches
+        )
+        await db.executemany(
+            'INSERT OR IGNORE INTO scheduled_batch_targets (batch_id, target_channel_id) VALUES (?, ?)', targets
+        )
+        await db.commit()
+
+
+async def main(posts: int, past_due: float, batch_size: int, channels_per_post: int):
+    random.seed(42)
+    logging.disable(logging.INFO)
+    database.DB_NAME = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    await database.init_db()
+    try:
+        await populate(posts, past_due, channels_per_post)
+        print(f"{posts} pending scheduled posts ({channels_per_post} channels each), ~{past_due:.0%} past due")
+
+        scheduler = AsyncIOScheduler(timezone="Asia/Tehran")
+        started = time.perf_counter()
+        stats = await rehydrate_scheduled_posts(scheduler, bot=None)
+        rehydrated = time.perf_counter()
+        scheduler.start()
+        await asyncio.sleep(0)
+        running = time.perf_counter()
+
+        print(f"bulk load query:          {stats['query_ms']:8.0f} ms ({stats['pending']} rows)")
+        print(f"job registration:         {stats['register_ms']:8.0f} ms ({stats['registered']} jobs)")
+        print(f"scheduler start:          {(running - rehydrated) * 1000:8.0f} ms")
+        print(f"total startup:            {(running - started) * 1000:8.0f} ms")
+
+        # The background catch-up started by rehydrate uses the configured pacing; time it without the pauses
+        started = time.perf_counter()
+        caught_up = await catch_up_past_due_posts(datetime.now(timezone.utc).isoformat(), batch_size, interval=0)
+        elapsed = time.perf_counter() - started
+        outbox = await database.get_outbox_stats()
+        print(f"catch-up into outbox:     {elapsed * 1000:8.0f} ms ({caught_up} posts in batches of {batch_size}, "
+              f"{elapsed / max(1, caught_up / batch_size) * 1000:.1f} ms/batch, {outbox.get('pending', 0)} deliveries queued)")
+        scheduler.shutdown(wait=False)
+    finally:
+        await database.close_db()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--posts', type=int, default=100000)
+    parser.add_argument('--past-due', type=float, default=0.1)
+    parser.add_argument('--batch-size', type=int, default=200)
+    parser.add_argument('--channels-per-post', type=int, default=3)
+    args = parser.parse_args()
+    asyncio.run(main(args.posts, args.past_due, args.batch_size, args.channels_per_post))
@@ -0,0 +1,130 @@
+"""
+Memory and startup cost of the two scheduled post dispatchers.
+
+Fills `scheduled_batches` with N future posts and loads them once with
+APScheduler (one in-memory job per post) and once with the paged dispatcher
+(only posts due within the window), measuring Python heap growth with
+tracemalloc and the time until each is ready. A small set of posts due in the
+next seconds is then fired by the paged dispatcher to show its lateness.
+Load times include tracemalloc's own overhead, which is large for APScheduler.
+
+Usage:
+    python benchmarks/bench_scheduler.py [--posts 100000 300000] [--window 3600] [--near 200]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('BOT_TOKEN', '0:benchmark')  # config.py refuses to load without a token
+
+import database  # noqa: E402
+from apscheduler.schedulers.asyncio import AsyncIOScheduler  # noqa: E402
+from utils.scheduler import PagedDispatcher, rehydrate_scheduled_posts  # noqa: E402
+
+
+async def insert_posts(times: list) -> dict:
+    rows, targets = {}, []
+    for i, when in enumerate(times):
+        batch_id = str(uuid.uuid4())
+        rows[batch_id] = (batch_id, random.randint(1, 20000), 1, i, None, when.isoformat())
+        targets.append((batch_id, -1000000000000 - random.randint(0, 5000)))
+    async with database.get_db() as db:
+        await db.executemany(
+            '''INSERT INTO scheduled_batches (batch_id, user_id, post_chat_id, post_message_id, caption, scheduled_time_utc)
+               VALUES (?, ?, ?, ?, ?, ?)''', rows.values()
+        )
+        await db.executemany(
+            'INSERT INTO scheduled_batch_targets (batch_id, target_channel_id) VALUES (?, ?)', targets
+        )
+        await db.commit()
+    return {batch_id: datetime.fromisoformat(row[5]).timestamp() for batch_id, row in rows.items()}
+
+
+async def populate(posts: int, near: int) -> dict:
+    """Spreads `posts` over the next 30 days, then adds `near` posts due 2-5 seconds from now."""
+    now = datetime.now(timezone.utc)
+    await insert_posts([now + timedelta(minutes=random.uniform(10, 60 * 24 * 30)) for _ in range(posts)])
+    # Taken after the bulk insert so the near posts are still in the future when the dispatcher starts
+    now = datetime.now(timezone.utc)
+    return await insert_posts([now + timedelta(seconds=random.uniform(2, 5)) for _ in range(near)])
+
+
+async def measure_apscheduler() -> tuple:
+    scheduler = AsyncIOScheduler(timezone="Asia/Tehran")
+    tracemalloc.start()
+    started = time.perf_counter()
+    stats = await rehydrate_scheduled_posts(scheduler, bot=None)
+    scheduler.start()
+    elapsed = time.perf_counter() - started
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    scheduler.shutdown(wait=False)
+    return elapsed, memory, stats['registered']
+
+
+async def measure_paged(window: float, page_size: int, near_times: dict) -> tuple:
+    dispatcher = PagedDispatcher()
+    tracemalloc.start()
+    started = time.perf_counter()
+    dispatcher.start(bot=None, window=window, page_size=page_size)
+    while dispatcher.pages == 0:
+        await asyncio.sleep(0.001)
+    elapsed = time.perf_counter() - started
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    held = len(dispatcher._heap)
+
+    # Fire the near-future posts and record how late each one left the heap
+    lateness = []
+    remaining = set(near_times)
+    deadline = time.time() + 10
+    while remaining and time.time() < deadline:
+        await asyncio.sleep(0.01)
+        fired = remaining - {batch_id for _, _, batch_id in dispatcher._heap}
+        for batch_id in fired:
+            lateness.append((time.time() - near_times[batch_id]) * 1000)
+        remaining -= fired
+    await dispatcher.stop()
+    return elapsed, memory, held, lateness
+
+
+async def main(args):
+    random.seed(42)
+    logging.disable(logging.WARNING)
+    for posts in args.posts:
+        for backend in ('apscheduler', 'paged'):
+            database.DB_NAME = os.path.join(tempfile.mkdtemp(), 'bench.db')
+            await database.init_db()
+            try:
+                near_times = await populate(posts, args.near if backend == 'paged' else 0)
+                if backend == 'apscheduler':
+                    elapsed, memory, held = await measure_apscheduler()
+                    extra = ''
+                else:
+                    elapsed, memory, held, lateness = await measure_paged(args.window, args.page_size, near_times)
+                    lateness.sort()
+                    extra = (f"   fired {len(lateness)}/{args.near}: p50 {statistics.median(lateness):.0f}ms "
+                             f"p99 {lateness[int(len(lateness) * 0.99) - 1]:.0f}ms late" if lateness else '')
+            finally:
+                await database.close_db()
+            print(f"{posts:>7} posts  {backend:<12} ready in {elapsed * 1000:7.0f} ms   "
+                  f"heap +{memory / 1024 / 1024:7.1f} MiB   {held:>7} posts in memory{extra}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--posts', type=int, nargs='+', default=[100000, 300000])
+    parser.add_argument('--window', type=float, default=3600)
+    parser.add_argument('--page-size', type=int, default=5000)
+    parser.add_argument('--near', type=int, default=200)
+    asyncio.run(main(parser.parse_args()))
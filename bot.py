@@ -5,10 +5,19 @@ from aiogram import Bot, Dispatcher
 from aiogram.fsm.storage.memory import MemoryStorage
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 
-from config import BOT_TOKEN
+from config import BOT_TOKEN, INSTANCE_ID, LEADER_LEASE_SECONDS, METRICS_PORT, SCHEDULER_BACKEND
 import database
-from handlers import general, footer, channels, broadcasting, premium, channel_premium, user_management, payment_management
-from utils.scheduler import send_scheduled_post
+from handlers import general, footer, channels, broadcasting, premium, channel_premium, user_management, payment_management, recurring, dead_letters, sent_posts
+from middlewares.user_context import user_context_middleware
+from utils.scheduler import post_dispatcher, rehydrate_scheduled_posts
+from utils.ratelimit import RateLimitMiddleware, rate_limiter
+from utils.retry import retry_middleware
+from utils.outbox import outbox_worker
+from utils.recurrence import recurring_dispatcher
+from utils.leader import leader_lease
+from utils.channel_meta import channel_meta_refresher
+from utils.channel_health import channel_health_auditor
+from utils.metrics import instrument_scheduler, metrics_server
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -21,6 +30,10 @@ async def main():
     # Initialize bot, storage and dispatcher
     storage = MemoryStorage()
     bot = Bot(token=BOT_TOKEN, parse_mode="HTML")
+    # Failed requests are retried (outermost), and every send, copy and edit
+    # waits for the global and per-chat rate limits, retries included
+    bot.session.middleware(retry_middleware)
+    bot.session.middleware(RateLimitMiddleware(rate_limiter))
 
     # Initialize the scheduler
     scheduler = AsyncIOScheduler(timezone="Asia/Tehran")
@@ -28,6 +41,9 @@ async def main():
     # Pass scheduler to the dispatcher so it's available in handlers
     dp = Dispatcher(storage=storage, scheduler=scheduler)
 
+    # Resolve the sender's profile once per update and inject it as `user_ctx`
+    dp.update.outer_middleware(user_context_middleware)
+
     # Include routers from handler modules
     dp.include_router(general.router)
     dp.include_router(footer.router)
@@ -36,18 +52,54 @@ async def main():
     dp.include_router(channel_premium.router)  # New channel premium system
     dp.include_router(user_management.router)  # User management handlers
     dp.include_router(payment_management.router)  # Payment management handlers
+    dp.include_router(recurring.router)  # Recurring post list
+    dp.include_router(dead_letters.router)  # Failed deliveries for developers
+    dp.include_router(sent_posts.router)  # Editing and deleting posts that went out
     dp.include_router(broadcasting.router)
 
     # Initialize the database
     await database.init_db()
 
-    # Start the scheduler
-    scheduler.start()
+    # Every replica sends from the shared outbox; claims are row-level, so no delivery goes out twice
+    outbox_worker.start(bot)
+    await metrics_server.start(METRICS_PORT)
+
+    try:
+        # Only the leader polls and runs the schedulers; a standby replica waits here to take over.
+        # A leader that loses its lease stops polling and exits, and comes back as a standby.
+        await leader_lease.acquire(INSTANCE_ID, LEADER_LEASE_SECONDS)
+        leader_lease.keep_alive(lambda: asyncio.create_task(dp.stop_polling()))
+
+        # Jobs live in memory only: re-register pending scheduled posts, then start the scheduler.
+        # With the paged backend only the next window of posts is held in memory instead.
+        if SCHEDULER_BACKEND == 'paged':
+            post_dispatcher.start(bot)
+        else:
+            await rehydrate_scheduled_posts(scheduler, bot)
+        instrument_scheduler(scheduler)
+        scheduler.start()
 
-    # Start polling
-    await bot.delete_webhook(drop_pending_updates=True)
-    await dp.start_polling(bot)
+        # Start the recurring post rules and the channel title and admin-rights checks
+        recurring_dispatcher.start(bot)
+        channel_meta_refresher.start(bot)
+        channel_health_auditor.start(bot)
 
+        # Start polling
+        await bot.delete_webhook(drop_pending_updates=True)
+        await dp.start_polling(bot)
+    finally:
+        await channel_health_auditor.stop()
+        await channel_meta_refresher.stop()
+        await recurring_dispatcher.stop()
+        await post_dispatcher.stop()
+        if scheduler.running:
+            scheduler.shutdown(wait=False)
+        # Hand the schedulers over right away instead of after the lease expires
+        await leader_lease.release()
+        await outbox_worker.stop()
+        await metrics_server.stop()
+        # Close the shared database connections on shutdown
+        await database.close_db()
 
 if __name__ == '__main__':
     asyncio.run(main())
\ No newline at end of file
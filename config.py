@@ -1,4 +1,5 @@
 import os
+import socket
 from dotenv import load_dotenv
 
 # Load environment variables from a .env file
@@ -16,9 +17,67 @@ if not BOT_TOKEN:
 # Developer ID for special privileges
 DEVELOPER_ID = int(os.getenv("DEVELOPER_ID", "0"))
 
+# Database settings
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "4"))  # Long-lived SQLite connections shared by all handlers
+USAGE_FLUSH_INTERVAL = float(os.getenv("USAGE_FLUSH_INTERVAL", "2"))  # Seconds between post counter flushes
+USAGE_FLUSH_MAX_PENDING = int(os.getenv("USAGE_FLUSH_MAX_PENDING", "200"))  # Flush early once this many counters are pending
+
+# User profile cache (language, footer, premium and developer flags)
+USER_CACHE_MAX_ENTRIES = int(os.getenv("USER_CACHE_MAX_ENTRIES", "100000"))
+USER_CACHE_MAX_MB = int(os.getenv("USER_CACHE_MAX_MB", "64"))  # Approximate memory budget
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "600"))  # Seconds before a profile is re-read
+CHANNEL_META_CACHE_MAX_ENTRIES = int(os.getenv("CHANNEL_META_CACHE_MAX_ENTRIES", "100000"))
+CHANNEL_META_CACHE_TTL = float(os.getenv("CHANNEL_META_CACHE_TTL", "600"))  # Seconds before channel metadata is re-read from the database
+ALBUM_CACHE_MAX_ENTRIES = int(os.getenv("ALBUM_CACHE_MAX_ENTRIES", "10000"))  # Posts whose album parts (or lack of them) are kept in memory
+ALBUM_CACHE_TTL = float(os.getenv("ALBUM_CACHE_TTL", "3600"))  # Seconds before a post's album parts are re-read from the database
+CHANNEL_META_MAX_AGE = float(os.getenv("CHANNEL_META_MAX_AGE", "86400"))  # Channel titles older than this are refreshed with get_chat
+CHANNEL_META_REFRESH_INTERVAL = float(os.getenv("CHANNEL_META_REFRESH_INTERVAL", "300"))  # Seconds between background refresh passes
+CHANNEL_META_REFRESH_BATCH = int(os.getenv("CHANNEL_META_REFRESH_BATCH", "50"))  # Most get_chat calls per refresh pass
+CHANNEL_AUDIT_INTERVAL = float(os.getenv("CHANNEL_AUDIT_INTERVAL", "21600"))  # Seconds between admin-rights checks of each channel
+CHANNEL_AUDIT_RATE = float(os.getenv("CHANNEL_AUDIT_RATE", "20"))  # Most get_chat_member calls per second
+CHANNEL_AUDIT_CONCURRENCY = int(os.getenv("CHANNEL_AUDIT_CONCURRENCY", "8"))  # get_chat_member calls in flight at once
+CHANNEL_AUDIT_BATCH = int(os.getenv("CHANNEL_AUDIT_BATCH", "500"))  # Channels checked and saved per batch
+CHANNEL_AUDIT_RECHECK_AGE = float(os.getenv("CHANNEL_AUDIT_RECHECK_AGE", "600"))  # A failed check this old is repeated before posts to the channel are skipped
+
+# Sending settings
+FANOUT_CONCURRENCY = int(os.getenv("FANOUT_CONCURRENCY", "8"))  # Parallel sends per broadcast
+ALBUM_WINDOW = float(os.getenv("ALBUM_WINDOW", "1.5"))  # Seconds without a new part before an incoming album counts as complete
+ALBUM_MAX_PENDING_PER_USER = int(os.getenv("ALBUM_MAX_PENDING_PER_USER", "2"))  # Albums of one user buffered at once; parts of more are dropped
+RATE_LIMIT_GLOBAL = float(os.getenv("RATE_LIMIT_GLOBAL", "25"))  # Messages per second across all chats and replicas
+RATE_LIMIT_PER_CHAT = float(os.getenv("RATE_LIMIT_PER_CHAT", "1"))  # Messages per second to one private chat
+RATE_LIMIT_PER_GROUP_PER_MINUTE = float(os.getenv("RATE_LIMIT_PER_GROUP_PER_MINUTE", "20"))  # Messages per minute to one channel/group
+SEND_MAX_ATTEMPTS = int(os.getenv("SEND_MAX_ATTEMPTS", "5"))  # Tries per request on flood control or network errors
+SEND_RETRY_BASE_DELAY = float(os.getenv("SEND_RETRY_BASE_DELAY", "1"))  # First backoff in seconds, doubled on every retry
+SEND_RETRY_MAX_DELAY = float(os.getenv("SEND_RETRY_MAX_DELAY", "30"))
+SEND_MAX_RETRY_AFTER = float(os.getenv("SEND_MAX_RETRY_AFTER", "300"))  # Give up when Telegram asks us to wait longer than this
+
+# Outbox (durable queue of channel deliveries)
+OUTBOX_WORKERS = int(os.getenv("OUTBOX_WORKERS", "8"))  # Concurrent channel sends
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "100"))  # Deliveries claimed per query
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "1"))  # Seconds between polls when idle
+OUTBOX_LEASE_SECONDS = float(os.getenv("OUTBOX_LEASE_SECONDS", "900"))  # A claimed delivery is requeued if not finished by then
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "3"))
+OUTBOX_RETRY_BASE_DELAY = float(os.getenv("OUTBOX_RETRY_BASE_DELAY", "60"))  # Seconds before the first requeue, doubled each time
+OUTBOX_RETENTION_DAYS = float(os.getenv("OUTBOX_RETENTION_DAYS", "7"))  # Finished deliveries are kept this long
+
+# Scheduler settings
+SCHEDULE_CATCHUP_BATCH_SIZE = int(os.getenv("SCHEDULE_CATCHUP_BATCH_SIZE", "200"))  # Past-due posts queued per batch after a restart
+SCHEDULE_CATCHUP_INTERVAL = float(os.getenv("SCHEDULE_CATCHUP_INTERVAL", "5"))  # Seconds between catch-up batches
+SCHEDULER_BACKEND = os.getenv("SCHEDULER_BACKEND", "apscheduler")  # 'apscheduler' or 'paged' for very large backlogs
+SCHEDULER_WINDOW_SECONDS = float(os.getenv("SCHEDULER_WINDOW_SECONDS", "3600"))  # Paged dispatcher: how far ahead posts are loaded
+SCHEDULER_PAGE_SIZE = int(os.getenv("SCHEDULER_PAGE_SIZE", "5000"))  # Paged dispatcher: most posts held in memory
+PREFIRE_LEAD_SECONDS = float(os.getenv("PREFIRE_LEAD_SECONDS", "30"))  # Stage scheduled posts this early so only API calls remain at send time (0 = off)
+SCHEDULE_JITTER_SECONDS = int(os.getenv("SCHEDULE_JITTER_SECONDS", "60"))  # Most a post is delayed to spread a crowded second (0 = off)
+SCHEDULE_BUSY_SLOT_DELIVERIES = int(os.getenv("SCHEDULE_BUSY_SLOT_DELIVERIES", "1000"))  # Warn in the time picker above this many deliveries per minute
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))  # Serve Prometheus metrics on this port at /metrics (0 = off)
+INSTANCE_ID = os.getenv("INSTANCE_ID") or f"{socket.gethostname()}:{os.getpid()}"  # Names this replica in leases and outbox claims
+LEADER_LEASE_SECONDS = float(os.getenv("LEADER_LEASE_SECONDS", "30"))  # A standby replica takes over this long after the leader stops renewing
+REPLICAS = int(os.getenv("REPLICAS", "1"))  # Replicas sending with this bot token; each gets 1/REPLICAS of the global and per-channel rates
+
 # Premium system settings
 FREE_USER_POST_LIMIT = 10  # Posts per month for free users
 FREE_CHANNEL_POST_LIMIT = 10  # Posts per month for free channels
+USAGE_PERIOD_CALENDAR = os.getenv("USAGE_PERIOD_CALENDAR", "gregorian")  # Monthly quota calendar: 'gregorian' or 'jalali'
 
 # Payment settings
 PAYMENT_CARD_NUMBER = os.getenv("PAYMENT_CARD_NUMBER", "6104-3375-4131-2433")  # شماره کارت توسعه‌دهنده
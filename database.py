@@ -1,17 +1,158 @@
+import asyncio
+import time
 import aiosqlite
 import logging
-from typing import List, Tuple, Optional
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, NamedTuple, Tuple, Optional
 import jdatetime
 from datetime import datetime, timedelta
 from pytz import timezone
 
+from utils.cache import TTLCache
+
 DB_NAME = 'data/bot.db'
 
+
+# --- Connection Pool ---
+class ConnectionPool:
+    """A fixed-size pool of long-lived aiosqlite connections shared by the whole bot."""
+
+    def __init__(self, db_name: str, size: int):
+        self.db_name = db_name
+        self.size = size
+        self._queue: Optional[asyncio.Queue] = None
+        self._connections: List[aiosqlite.Connection] = []
+        # Metrics
+        self.acquisitions = 0
+        self.waits = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    async def open(self):
+        """Opens all connections of the pool."""
+        self._queue = asyncio.Queue()
+        for _ in range(self.size):
+            db = await aiosqlite.connect(self.db_name)
+            await configure_connection(db)
+            self._connections.append(db)
+            self._queue.put_nowait(db)
+        logging.info(f"Database pool opened with {self.size} connections to {self.db_name}")
+
+    async def close(self):
+        """Closes all connections of the pool."""
+        for db in self._connections:
+            try:
+                await db.close()
+            except Exception as e:
+                logging.error(f"Error closing database connection: {e}")
+        self._connections = []
+        self._queue = None
+        logging.info("Database pool closed.")
+
+    @asynccontextmanager
+    async def acquire(self):
+        """Borrows a connection and returns it to the pool when the block exits."""
+        started = time.perf_counter()
+        if self._queue.empty():
+            self.waits += 1
+        db = await self._queue.get()
+        waited = time.perf_counter() - started
+        self.acquisitions += 1
+        self.total_wait += waited
+        self.max_wait = max(self.max_wait, waited)
+        try:
+            yield db
+        finally:
+            # Never hand a half-finished transaction to the next borrower
+            try:
+                if db.in_transaction:
+                    await db.rollback()
+            except Exception as e:
+                logging.error(f"Error rolling back pooled connection: {e}")
+            self._queue.put_nowait(db)
+
+    def stats(self) -> dict:
+        """Returns pool size and wait-time metrics."""
+        available = self._queue.qsize() if self._queue else 0
+        return {
+            'size': self.size,
+            'available': available,
+            'in_use': self.size - available if self._queue else 0,
+            'acquisitions': self.acquisitions,
+            'waits': self.waits,
+            'avg_wait_ms': (self.total_wait / self.acquisitions * 1000) if self.acquisitions else 0.0,
+            'max_wait_ms': self.max_wait * 1000,
+        }
+
+
+_pool: Optional[ConnectionPool] = None
+_pool_lock = asyncio.Lock()
+
+async def open_pool():
+    """Opens the shared connection pool (idempotent)."""
+    global _pool
+    from config import DB_POOL_SIZE
+
+    async with _pool_lock:
+        if _pool is None:
+            pool = ConnectionPool(DB_NAME, DB_POOL_SIZE)
+            await pool.open()
+            _pool = pool
+
+async def close_db():
+    """Flushes buffered counters and closes the shared connection pool. Called on shutdown."""
+    global _pool
+    await usage_buffer.stop()
+    async with _pool_lock:
+        if _pool is not None:
+            await _pool.close()
+            _pool = None
+
+# Per-update round-trip counter (a one-item list so tasks spawned by the handler share it)
+_round_trips: ContextVar[Optional[list]] = ContextVar('db_round_trips', default=None)
+
+@contextmanager
+def count_round_trips():
+    """Counts get_db() borrows made inside the block (and in tasks it spawns)."""
+    counter = [0]
+    token = _round_trips.set(counter)
+    try:
+        yield counter
+    finally:
+        _round_trips.reset(token)
+
+@asynccontextmanager
+async def get_db():
+    """Borrows a connection from the shared pool, opening the pool on first use."""
+    if _pool is None:
+        await open_pool()
+    counter = _round_trips.get()
+    if counter is not None:
+        counter[0] += 1
+    async with _pool.acquire() as db:
+        yield db
+
+def get_pool_stats() -> dict:
+    """Returns the connection pool metrics, or an empty dict if the pool is closed."""
+    return _pool.stats() if _pool else {}
+
 def get_tehran_time():
     """Get current time in Tehran timezone."""
     tehran_tz = timezone('Asia/Tehran')
     return datetime.now(tehran_tz)
 
+def utc_timestamp(dt: Optional[datetime] = None, delay: float = 0) -> str:
+    """
+    UTC time as 'YYYY-MM-DD HH:MM:SS' (SQLite's own datetime format). The fixed
+    width makes text comparison order by time, so the column can be indexed.
+    """
+    if dt is None:
+        dt = datetime.now(timezone('UTC'))
+    elif dt.tzinfo is not None:
+        dt = dt.astimezone(timezone('UTC'))
+    return (dt + timedelta(seconds=delay)).strftime('%Y-%m-%d %H:%M:%S')
+
 def format_persian_date(dt):
     """Convert datetime to Persian date string."""
     if isinstance(dt, str):
@@ -31,121 +172,691 @@ def format_persian_date(dt):
     jalali_date = jdatetime.datetime.fromgregorian(datetime=dt)
     return jalali_date.strftime('%Y/%m/%d %H:%M')
 
-async def init_db():
-    """Initializes the database and creates tables if they don't exist."""
-    async with aiosqlite.connect(DB_NAME) as db:
-        await db.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                user_id INTEGER PRIMARY KEY,
-                language_code TEXT,
-                footer_text TEXT,
-                is_premium INTEGER DEFAULT 0,
-                premium_until TEXT,
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        await db.execute('''
-            CREATE TABLE IF NOT EXISTS channels (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                channel_id INTEGER NOT NULL,
-                user_id INTEGER NOT NULL,
-                FOREIGN KEY (user_id) REFERENCES users (user_id),
-                UNIQUE (channel_id, user_id)
-            )
-        ''')
-        await db.execute('''
-            CREATE TABLE IF NOT EXISTS scheduled_posts (
-                job_id TEXT PRIMARY KEY,
-                user_id INTEGER NOT NULL,
-                post_chat_id INTEGER NOT NULL,
-                post_message_id INTEGER NOT NULL,
-                target_channel_id INTEGER NOT NULL,
-                caption TEXT,
-                scheduled_time_utc TEXT NOT NULL,
-                FOREIGN KEY (user_id) REFERENCES users (user_id)
-            )
-        ''')
-        await db.execute('''
-            CREATE TABLE IF NOT EXISTS user_stats (
-                user_id INTEGER PRIMARY KEY,
-                posts_sent_this_month INTEGER DEFAULT 0,
-                last_reset_date TEXT DEFAULT CURRENT_TIMESTAMP,
-                total_posts_sent INTEGER DEFAULT 0,
-                FOREIGN KEY (user_id) REFERENCES users (user_id)
-            )
-        ''')
-        # New tables for channel-based premium system
-        await db.execute('''
-            CREATE TABLE IF NOT EXISTS channel_premium (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                channel_id INTEGER NOT NULL,
-                user_id INTEGER NOT NULL,
-                is_premium INTEGER DEFAULT 0,
-                premium_until TEXT,
-                posts_sent_this_month INTEGER DEFAULT 0,
-                last_reset_date TEXT DEFAULT CURRENT_TIMESTAMP,
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users (user_id),
-                UNIQUE (channel_id, user_id)
-            )
-        ''')
-        await db.execute('''
-            CREATE TABLE IF NOT EXISTS payment_requests (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                channel_id INTEGER NOT NULL,
-                channel_title TEXT NOT NULL,
-                duration_months INTEGER NOT NULL,
-                amount INTEGER NOT NULL,
-                status TEXT DEFAULT 'pending',
-                receipt_message_id INTEGER,
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-                processed_at TEXT,
-                FOREIGN KEY (user_id) REFERENCES users (user_id)
+def get_usage_period(dt: Optional[datetime] = None) -> str:
+    """
+    Returns the usage counter period (month bucket) for the given time, Tehran time by default.
+    Gregorian periods look like '2025-01', Jalali ones like 'j1403-10' (see USAGE_PERIOD_CALENDAR).
+    """
+    from config import USAGE_PERIOD_CALENDAR
+
+    dt = dt or get_tehran_time()
+    if USAGE_PERIOD_CALENDAR == 'jalali':
+        return jdatetime.datetime.fromgregorian(datetime=dt).strftime('j%Y-%m')
+    return dt.strftime('%Y-%m')
+
+# --- Schema & Migrations ---
+# Per-connection settings applied to every pooled connection when it is opened.
+# WAL lets readers run alongside the single writer; NORMAL sync is safe under WAL.
+SQLITE_PRAGMAS = [
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA cache_size=-16000',      # ~16 MB page cache per connection
+    'PRAGMA mmap_size=134217728',    # 128 MB memory-mapped I/O
+    'PRAGMA temp_store=MEMORY',
+    'PRAGMA busy_timeout=5000',
+]
+
+async def configure_connection(db):
+    """Applies SQLITE_PRAGMAS to a freshly opened connection."""
+    for pragma in SQLITE_PRAGMAS:
+        await db.execute(pragma)
+
+async def create_tables(db):
+    """Creates the base tables if they don't exist (schema version 0)."""
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            language_code TEXT,
+            footer_text TEXT,
+            is_premium INTEGER DEFAULT 0,
+            premium_until TEXT,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS channels (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            channel_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            FOREIGN KEY (user_id) REFERENCES users (user_id),
+            UNIQUE (channel_id, user_id)
+        )
+    ''')
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS scheduled_posts (
+            job_id TEXT PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            post_chat_id INTEGER NOT NULL,
+            post_message_id INTEGER NOT NULL,
+            target_channel_id INTEGER NOT NULL,
+            caption TEXT,
+            scheduled_time_utc TEXT NOT NULL,
+            FOREIGN KEY (user_id) REFERENCES users (user_id)
+        )
+    ''')
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS user_stats (
+            user_id INTEGER PRIMARY KEY,
+            posts_sent_this_month INTEGER DEFAULT 0,
+            last_reset_date TEXT DEFAULT CURRENT_TIMESTAMP,
+            total_posts_sent INTEGER DEFAULT 0,
+            FOREIGN KEY (user_id) REFERENCES users (user_id)
+        )
+    ''')
+    # New tables for channel-based premium system
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS channel_premium (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            channel_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            is_premium INTEGER DEFAULT 0,
+            premium_until TEXT,
+            posts_sent_this_month INTEGER DEFAULT 0,
+            last_reset_date TEXT DEFAULT CURRENT_TIMESTAMP,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (user_id),
+            UNIQUE (channel_id, user_id)
+        )
+    ''')
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS payment_requests (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            channel_id INTEGER NOT NULL,
+            channel_title TEXT NOT NULL,
+            duration_months INTEGER NOT NULL,
+            amount INTEGER NOT NULL,
+            status TEXT DEFAULT 'pending',
+            receipt_message_id INTEGER,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            processed_at TEXT,
+            FOREIGN KEY (user_id) REFERENCES users (user_id)
+        )
+    ''')
+
+USAGE_SCOPE_USER = 'user'        # id = users.user_id
+USAGE_SCOPE_CHANNEL = 'channel'  # id = channel_premium.id (quota is per channel and owner)
+
+async def _migrate_usage_counters(db):
+    """
+    Creates usage_counters and seeds the current period from the legacy
+    posts_sent_this_month columns, which are no longer written afterwards.
+    """
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS usage_counters (
+            scope TEXT NOT NULL,
+            id INTEGER NOT NULL,
+            period TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (scope, id, period)
+        ) WITHOUT ROWID
+    ''')
+    # Monthly totals across all users/channels for the stats screens
+    await db.execute('CREATE INDEX IF NOT EXISTS idx_usage_counters_period ON usage_counters (scope, period, count)')
+
+    # Every registered channel needs a channel_premium row to carry its counter
+    tehran_time = get_tehran_time()
+    await db.execute('''
+        INSERT OR IGNORE INTO channel_premium (channel_id, user_id, created_at, last_reset_date)
+        SELECT channel_id, user_id, ?, ? FROM channels
+    ''', (tehran_time.isoformat(), tehran_time.isoformat()))
+
+    current_month = tehran_time.strftime('%Y-%m')
+    period = get_usage_period(tehran_time)
+    await db.execute('''
+        INSERT OR IGNORE INTO usage_counters (scope, id, period, count)
+        SELECT ?, user_id, ?, posts_sent_this_month FROM user_stats
+        WHERE posts_sent_this_month > 0 AND substr(last_reset_date, 1, 7) = ?
+    ''', (USAGE_SCOPE_USER, period, current_month))
+    await db.execute('''
+        INSERT OR IGNORE INTO usage_counters (scope, id, period, count)
+        SELECT ?, id, ?, posts_sent_this_month FROM channel_premium
+        WHERE posts_sent_this_month > 0 AND substr(last_reset_date, 1, 7) = ?
+    ''', (USAGE_SCOPE_CHANNEL, period, current_month))
+
+# Ordered, append-only list of (version, description, step).
+# A step is either a list of SQL statements or an async callable taking the connection.
+MIGRATIONS = [
+    (1, "hot-path indexes", [
+        # get_user_channels / channel counts per user (covering)
+        'CREATE INDEX IF NOT EXISTS idx_channels_user ON channels (user_id, channel_id)',
+        # get_pending_payment_requests, payment stats by status
+        'CREATE INDEX IF NOT EXISTS idx_payment_requests_status ON payment_requests (status, created_at)',
+        # get_all_payment_requests ORDER BY created_at
+        'CREATE INDEX IF NOT EXISTS idx_payment_requests_created ON payment_requests (created_at)',
+        # scheduled posts by fire time
+        'CREATE INDEX IF NOT EXISTS idx_scheduled_posts_time ON scheduled_posts (scheduled_time_utc)',
+        # new users this week, /activeusers ordering
+        'CREATE INDEX IF NOT EXISTS idx_users_created_at ON users (created_at)',
+        # premium user counts
+        'CREATE INDEX IF NOT EXISTS idx_users_premium ON users (is_premium, premium_until)',
+        # /premiumchannels and premium channel counts
+        'CREATE INDEX IF NOT EXISTS idx_channel_premium_active ON channel_premium (is_premium, premium_until)',
+        # /topusers ORDER BY total_posts_sent
+        'CREATE INDEX IF NOT EXISTS idx_user_stats_total ON user_stats (total_posts_sent)',
+    ]),
+    (2, "month-bucketed usage counters", _migrate_usage_counters),
+    (3, "outbox for channel deliveries", [
+        '''
+        CREATE TABLE IF NOT EXISTS outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            batch_id TEXT NOT NULL,
+            user_id INTEGER NOT NULL,
+            post_chat_id INTEGER NOT NULL,
+            post_message_id INTEGER NOT NULL,
+            target_channel_id INTEGER NOT NULL,
+            caption TEXT,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at TEXT NOT NULL,
+            lease_until TEXT,
+            sent_message_id INTEGER,
+            last_error TEXT,
+            created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            updated_at TEXT
+        )
+        ''',
+        # claim_outbox_batch: the next due pending deliveries
+        "CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox (next_attempt_at) WHERE status = 'pending'",
+        # requeue_expired_outbox_leases
+        "CREATE INDEX IF NOT EXISTS idx_outbox_lease ON outbox (lease_until) WHERE status = 'sending'",
+        # batch summaries and pruning
+        'CREATE INDEX IF NOT EXISTS idx_outbox_batch ON outbox (batch_id, status)',
+        'CREATE INDEX IF NOT EXISTS idx_outbox_updated ON outbox (updated_at)',
+    ]),
+    (4, "one scheduled batch per post", [
+        '''
+        CREATE TABLE IF NOT EXISTS scheduled_batches (
+            batch_id TEXT PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            post_chat_id INTEGER NOT NULL,
+            post_message_id INTEGER NOT NULL,
+            caption TEXT,
+            scheduled_time_utc TEXT NOT NULL,
+            created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS scheduled_batch_targets (
+            batch_id TEXT NOT NULL,
+            target_channel_id INTEGER NOT NULL,
+            PRIMARY KEY (batch_id, target_channel_id)
+        ) WITHOUT ROWID
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_scheduled_batches_time ON scheduled_batches (scheduled_time_utc)',
+        # Legacy one-row-per-channel posts become single-channel batches under their old job id
+        '''
+        INSERT OR IGNORE INTO scheduled_batches (batch_id, user_id, post_chat_id, post_message_id, caption, scheduled_time_utc)
+        SELECT job_id, user_id, post_chat_id, post_message_id, caption, scheduled_time_utc FROM scheduled_posts
+        ''',
+        '''
+        INSERT OR IGNORE INTO scheduled_batch_targets (batch_id, target_channel_id)
+        SELECT job_id, target_channel_id FROM scheduled_posts
+        ''',
+        'DELETE FROM scheduled_posts',
+    ]),
+    (5, "keyset index for paging scheduled batches", [
+        'CREATE INDEX IF NOT EXISTS idx_scheduled_batches_time_id ON scheduled_batches (scheduled_time_utc, batch_id)',
+        'DROP INDEX IF EXISTS idx_scheduled_batches_time',
+    ]),
+    (6, "recurring post rules", [
+        '''
+        CREATE TABLE IF NOT EXISTS recurring_posts (
+            rule_id TEXT PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            post_chat_id INTEGER NOT NULL,
+            post_message_id INTEGER NOT NULL,
+            caption TEXT,
+            kind TEXT NOT NULL,
+            time_of_day TEXT NOT NULL,
+            weekdays TEXT,
+            month_day INTEGER,
+            next_fire_utc TEXT NOT NULL,
+            last_fired_utc TEXT,
+            created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS recurring_post_targets (
+            rule_id TEXT NOT NULL,
+            target_channel_id INTEGER NOT NULL,
+            PRIMARY KEY (rule_id, target_channel_id)
+        ) WITHOUT ROWID
+        ''',
+        # the dispatcher's due scan and next wake-up
+        'CREATE INDEX IF NOT EXISTS idx_recurring_posts_next ON recurring_posts (next_fire_utc)',
+        # a user's rule list
+        'CREATE INDEX IF NOT EXISTS idx_recurring_posts_user ON recurring_posts (user_id)',
+    ]),
+    (7, "dead letters for deliveries that ran out of attempts", [
+        '''
+        CREATE TABLE IF NOT EXISTS dead_letters (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            outbox_id INTEGER,
+            batch_id TEXT NOT NULL,
+            user_id INTEGER NOT NULL,
+            post_chat_id INTEGER NOT NULL,
+            post_message_id INTEGER NOT NULL,
+            target_channel_id INTEGER NOT NULL,
+            caption TEXT,
+            error_class TEXT NOT NULL,
+            error_kind TEXT NOT NULL,
+            last_error TEXT,
+            attempts INTEGER NOT NULL,
+            failed_at TEXT NOT NULL
+        )
+        ''',
+        # summary and bulk retry per error class
+        'CREATE INDEX IF NOT EXISTS idx_dead_letters_class ON dead_letters (error_class, failed_at)',
+        'CREATE INDEX IF NOT EXISTS idx_dead_letters_failed ON dead_letters (failed_at)',
+    ]),
+    (8, "leases and outbox claims for running several replicas", [
+        '''
+        CREATE TABLE IF NOT EXISTS leases (
+            name TEXT PRIMARY KEY,
+            holder TEXT NOT NULL,
+            expires_at TEXT NOT NULL,
+            acquired_at TEXT NOT NULL,
+            renewed_at TEXT NOT NULL
+        )
+        ''',
+        # the replica that leased a 'sending' delivery, so a restart only requeues its own
+        'ALTER TABLE outbox ADD COLUMN claimed_by TEXT',
+        # finished batches already reported to their owner, so two replicas finishing one batch report it once
+        '''
+        CREATE TABLE IF NOT EXISTS outbox_reports (
+            batch_id TEXT PRIMARY KEY,
+            reported_at TEXT NOT NULL
+        )
+        ''',
+    ]),
+    (9, "channel metadata for rendering channel screens without get_chat", [
+        '''
+        CREATE TABLE IF NOT EXISTS channel_meta (
+            channel_id INTEGER PRIMARY KEY,
+            title TEXT,
+            username TEXT,
+            type TEXT,
+            updated_at TEXT NOT NULL
+        )
+        ''',
+        # the refresher's scan for stale entries
+        'CREATE INDEX IF NOT EXISTS idx_channel_meta_updated ON channel_meta (updated_at)',
+    ]),
+    (10, "channel health from the background admin-rights audit", [
+        '''
+        CREATE TABLE IF NOT EXISTS channel_health (
+            channel_id INTEGER PRIMARY KEY,
+            status TEXT NOT NULL,
+            checked_at TEXT NOT NULL,
+            failures INTEGER NOT NULL DEFAULT 0,
+            last_error TEXT
+        )
+        ''',
+        # the auditor's scan for channels due for a check
+        'CREATE INDEX IF NOT EXISTS idx_channel_health_checked ON channel_health (checked_at)',
+        # fan-out and developer screens only look for unhealthy channels
+        "CREATE INDEX IF NOT EXISTS idx_channel_health_bad ON channel_health (status) WHERE status NOT IN ('ok', 'unknown')",
+    ]),
+    (11, "delivery ledger kept after the outbox is pruned", [
+        '''
+        CREATE TABLE IF NOT EXISTS deliveries (
+            id INTEGER PRIMARY KEY,
+            batch_id TEXT NOT NULL,
+            user_id INTEGER NOT NULL,
+            post_chat_id INTEGER NOT NULL,
+            post_message_id INTEGER NOT NULL,
+            channel_id INTEGER NOT NULL,
+            message_id INTEGER,
+            status TEXT NOT NULL,
+            error_code TEXT,
+            attempts INTEGER NOT NULL,
+            enqueued_at TEXT NOT NULL,
+            finished_at TEXT NOT NULL,
+            latency_ms INTEGER
+        )
+        ''',
+        # Rows arrive in outbox id order, so inserts append to the table; only two
+        # indexes are kept. Per-channel success rates and latency percentiles read
+        # this one alone (covering)...
+        'CREATE INDEX IF NOT EXISTS idx_deliveries_channel ON deliveries (channel_id, finished_at, status, latency_ms)',
+        # ...and editing or deleting a sent post finds its copies through this one
+        'CREATE INDEX IF NOT EXISTS idx_deliveries_post ON deliveries (post_chat_id, post_message_id)',
+        # finished deliveries still in the outbox
+        '''
+        INSERT OR IGNORE INTO deliveries (id, batch_id, user_id, post_chat_id, post_message_id, channel_id, message_id,
+                                          status, error_code, attempts, enqueued_at, finished_at)
+        SELECT id, batch_id, user_id, post_chat_id, post_message_id, target_channel_id, sent_message_id,
+               status, NULL, attempts, created_at, updated_at
+        FROM outbox WHERE status IN ('sent', 'failed')
+        ''',
+    ]),
+    (12, "channel copies deleted through the bot", [
+        'ALTER TABLE deliveries ADD COLUMN deleted_at TEXT',
+    ]),
+    (13, "album posts sent as one media group", [
+        '''
+        CREATE TABLE IF NOT EXISTS album_items (
+            post_chat_id INTEGER NOT NULL,
+            post_message_id INTEGER NOT NULL,
+            position INTEGER NOT NULL,
+            media_type TEXT NOT NULL,
+            file_id TEXT NOT NULL,
+            caption TEXT,
+            PRIMARY KEY (post_chat_id, post_message_id, position)
+        )
+        ''',
+        # The other channel messages of an album copy, comma separated; message_id is its first one
+        'ALTER TABLE deliveries ADD COLUMN album_message_ids TEXT',
+    ]),
+]
+
+async def get_schema_version(db) -> int:
+    """Returns the highest applied migration version."""
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_at TEXT
+        )
+    ''')
+    cursor = await db.execute('SELECT COALESCE(MAX(version), 0) FROM schema_version')
+    return (await cursor.fetchone())[0]
+
+async def run_migrations(db, target: Optional[int] = None):
+    """
+    Applies every migration newer than the stored schema version (up to
+    `target` when given), each in its own transaction.
+    """
+    current = await get_schema_version(db)
+    await db.commit()
+
+    for version, description, step in MIGRATIONS:
+        if version <= current or (target is not None and version > target):
+            continue
+        try:
+            await db.execute('BEGIN')
+            if callable(step):
+                await step(db)
+            else:
+                for sql in step:
+                    await db.execute(sql)
+            await db.execute(
+                'INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)',
+                (version, description, get_tehran_time().isoformat())
             )
-        ''')
+            await db.commit()
+            logging.info(f"Applied database migration {version}: {description}")
+        except Exception:
+            await db.rollback()
+            logging.error(f"Database migration {version} ({description}) failed")
+            raise
+
+    # Refresh planner statistics so the new indexes are picked up
+    await db.execute('PRAGMA optimize')
+
+async def init_db():
+    """Opens the connection pool, creates tables and applies pending migrations."""
+    await open_pool()
+    async with get_db() as db:
+        await create_tables(db)
         await db.commit()
+        await run_migrations(db)
+    usage_buffer.start()
     logging.info("Database initialized with all tables including channel premium system.")
 
+# --- Usage Counter Buffer ---
+async def _get_channel_premium_ids(db, keys) -> Dict[Tuple[int, int], int]:
+    """Maps (channel_id, user_id) pairs to their channel_premium row id; pairs without a row are left out."""
+    keys = list(keys)
+    ids = {}
+    for start in range(0, len(keys), 400):  # two parameters per pair, under SQLite's 999 limit
+        chunk = keys[start:start + 400]
+        cursor = await db.execute(
+            f"SELECT channel_id, user_id, id FROM channel_premium WHERE (channel_id, user_id) IN (VALUES {','.join(['(?, ?)'] * len(chunk))})",
+            [value for key in chunk for value in key]
+        )
+        ids.update({(channel_id, user_id): row_id for channel_id, user_id, row_id in await cursor.fetchall()})
+    return ids
+
+class UsageCounterBuffer:
+    """
+    Write-behind accumulator for post counters. Increments are coalesced in memory
+    and written in one transaction when USAGE_FLUSH_MAX_PENDING keys are pending,
+    every USAGE_FLUSH_INTERVAL seconds, and on shutdown. Quota reads add the
+    unflushed deltas (see pending_delta) so limits stay exact.
+    """
+
+    def __init__(self):
+        # (scope, key, period) -> delta; key is user_id or (channel_id, user_id)
+        self.pending: Dict[tuple, int] = {}
+        # Channel counters with no channel_premium row to count against, already logged
+        self.orphaned: set = set()
+        self.inflight: Dict[tuple, int] = {}
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        # Metrics
+        self.flushes = 0
+        self.flushed_increments = 0
+
+    def pending_delta(self, scope: str, key, period: str) -> int:
+        """Returns increments for a counter that are not yet committed."""
+        counter = (scope, key, period)
+        return self.pending.get(counter, 0) + self.inflight.get(counter, 0)
+
+    async def add(self, scope: str, key, period: str):
+        """Buffers one increment, flushing right away when the size threshold is reached."""
+        from config import USAGE_FLUSH_MAX_PENDING
+
+        counter = (scope, key, period)
+        self.pending[counter] = self.pending.get(counter, 0) + 1
+        if len(self.pending) >= USAGE_FLUSH_MAX_PENDING:
+            await self.flush()
+
+    async def flush(self):
+        """Writes all pending increments in a single transaction."""
+        async with self._lock:
+            if not self.pending:
+                return
+            batch, self.pending = self.pending, {}
+            self.inflight = batch
+
+            user_rows = []
+            total_rows = {}
+            for (scope, key, period), delta in batch.items():
+                if scope == USAGE_SCOPE_USER:
+                    user_rows.append((USAGE_SCOPE_USER, key, period, delta))
+                    total_rows[key] = total_rows.get(key, 0) + delta
+
+            kept = {}
+            try:
+                async with get_db() as db:
+                    premium_ids = await _get_channel_premium_ids(
+                        db, {key for scope, key, _ in batch if scope == USAGE_SCOPE_CHANNEL}
+                    )
+                    channel_rows = []
+                    for (scope, key, period), delta in batch.items():
+                        if scope != USAGE_SCOPE_CHANNEL:
+                            continue
+                        if key in premium_ids:
+                            channel_rows.append((USAGE_SCOPE_CHANNEL, premium_ids[key], period, delta))
+                        else:
+                            # E.g. the channel was removed while posts to it were pending. Kept (and still
+                            # counted by quota reads) until the channel is registered again, not dropped.
+                            kept[(scope, key, period)] = delta
+                    await db.executemany('''
+                        INSERT INTO usage_counters (scope, id, period, count) VALUES (?, ?, ?, ?)
+                        ON CONFLICT (scope, id, period) DO UPDATE SET count = count + excluded.count
+                    ''', channel_rows)
+                    await db.executemany('''
+                        INSERT INTO usage_counters (scope, id, period, count) VALUES (?, ?, ?, ?)
+                        ON CONFLICT (scope, id, period) DO UPDATE SET count = count + excluded.count
+                    ''', user_rows)
+                    await db.executemany('''
+                        INSERT INTO user_stats (user_id, total_posts_sent) VALUES (?, ?)
+                        ON CONFLICT (user_id) DO UPDATE SET total_posts_sent = total_posts_sent + excluded.total_posts_sent
+                    ''', list(total_rows.items()))
+                    await db.commit()
+                self.flushes += 1
+                self.flushed_increments += sum(batch.values()) - sum(kept.values())
+                for counter, delta in kept.items():
+                    self.pending[counter] = self.pending.get(counter, 0) + delta
+                    if counter not in self.orphaned:
+                        self.orphaned.add(counter)
+                        logging.warning(f"⚠️ {delta} posts to channel {counter[1][0]} (user {counter[1][1]}) match no "
+                                        f"channel_premium row; keeping them until the channel is registered again")
+                self.orphaned.intersection_update(self.pending)
+            except Exception as e:
+                # Keep the increments for the next attempt
+                for counter, delta in batch.items():
+                    self.pending[counter] = self.pending.get(counter, 0) + delta
+                logging.error(f"Error flushing usage counters ({len(batch)} keys): {e}")
+            finally:
+                self.inflight = {}
+
+    async def _run(self):
+        from config import USAGE_FLUSH_INTERVAL
+
+        while True:
+            await asyncio.sleep(USAGE_FLUSH_INTERVAL)
+            # Shielded so stop() never cancels a flush halfway through
+            await asyncio.shield(self.flush())
+
+    def start(self):
+        """Starts the periodic flusher (idempotent)."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stops the periodic flusher and writes whatever is still pending."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        if self.orphaned:
+            logging.warning(f"⚠️ Dropping {len(self.orphaned)} usage counters of unregistered channels on shutdown")
+
+    def stats(self) -> dict:
+        """Returns buffer metrics."""
+        return {
+            'pending_keys': len(self.pending),
+            'pending_increments': sum(self.pending.values()),
+            'flushes': self.flushes,
+            'flushed_increments': self.flushed_increments,
+            'orphaned_keys': len(self.orphaned),
+        }
+
+
+usage_buffer = UsageCounterBuffer()
+
+# --- User Profile Cache ---
+class UserProfile(NamedTuple):
+    """The per-user fields nearly every handler needs."""
+    language: Optional[str]
+    footer: Optional[str]
+    is_premium: int
+    premium_until: Optional[str]
+    is_developer: bool
+
+# Measured per-entry cost (tuple + cache bookkeeping), plus the footer text (2 bytes/char for Persian)
+_PROFILE_OVERHEAD_BYTES = 420
+
+def _profile_weight(profile: Optional[UserProfile]) -> int:
+    return _PROFILE_OVERHEAD_BYTES + (2 * len(profile.footer) if profile and profile.footer else 0)
+
+_MISSING = object()
+_user_cache: Optional[TTLCache] = None
+
+def _get_user_cache() -> TTLCache:
+    global _user_cache
+    if _user_cache is None:
+        from config import USER_CACHE_MAX_ENTRIES, USER_CACHE_MAX_MB, USER_CACHE_TTL
+        _user_cache = TTLCache(USER_CACHE_MAX_ENTRIES, USER_CACHE_TTL,
+                               max_bytes=USER_CACHE_MAX_MB * 1024 * 1024, weigher=_profile_weight)
+    return _user_cache
+
+def _make_profile(user_id: int, language: Optional[str], footer: Optional[str],
+                  is_premium: int, premium_until: Optional[str]) -> UserProfile:
+    from config import DEVELOPER_ID
+    return UserProfile(language, footer, is_premium or 0, premium_until, user_id == DEVELOPER_ID)
+
+def _update_cached_profile(user_id: int, **changes):
+    """Write-through: applies changes to a cached profile, or forgets the user if not fully cached."""
+    cache = _get_user_cache()
+    profile = cache.peek(user_id)
+    if profile is not None:
+        cache.set(user_id, profile._replace(**changes))
+    else:
+        cache.pop(user_id)
+
+async def get_user_profile(user_id: int) -> Optional[UserProfile]:
+    """Returns the cached profile of a user, loading it on a miss. None if the user doesn't exist."""
+    cache = _get_user_cache()
+    profile = cache.get(user_id, _MISSING)
+    if profile is not _MISSING:
+        return profile
+
+    async with get_db() as db:
+        cursor = await db.execute(
+            'SELECT language_code, footer_text, is_premium, premium_until FROM users WHERE user_id = ?', (user_id,)
+        )
+        row = await cursor.fetchone()
+    profile = _make_profile(user_id, *row) if row else None
+    # Unknown users are cached too, so repeated lookups of strangers don't hit SQLite
+    cache.set(user_id, profile)
+    return profile
+
+def get_user_cache_stats() -> dict:
+    """Returns hit/miss and size metrics of the user profile cache."""
+    return _get_user_cache().stats()
+
 # --- User Functions ---
 async def add_or_update_user(user_id: int, language_code: str):
-    async with aiosqlite.connect(DB_NAME) as db:
+    async with get_db() as db:
         cursor = await db.execute('SELECT user_id FROM users WHERE user_id = ?', (user_id,))
         if await cursor.fetchone():
             await db.execute('UPDATE users SET language_code = ? WHERE user_id = ?', (language_code, user_id))
+            created = False
         else:
             tehran_time = get_tehran_time()
             await db.execute('INSERT INTO users (user_id, language_code, created_at) VALUES (?, ?, ?)', 
                            (user_id, language_code, tehran_time.isoformat()))
             # Initialize user stats
             await db.execute('INSERT INTO user_stats (user_id) VALUES (?)', (user_id,))
+            created = True
         await db.commit()
 
+    if created:
+        _get_user_cache().set(user_id, _make_profile(user_id, language_code, None, 0, None))
+    else:
+        _update_cached_profile(user_id, language=language_code)
+
 async def set_footer_text(user_id: int, footer_text: str):
-    async with aiosqlite.connect(DB_NAME) as db:
+    async with get_db() as db:
         await db.execute('UPDATE users SET footer_text = ? WHERE user_id = ?', (footer_text, user_id))
         await db.commit()
+    _update_cached_profile(user_id, footer=footer_text)
 
 async def get_user_language(user_id: int) -> Optional[str]:
-    async with aiosqlite.connect(DB_NAME) as db:
-        cursor = await db.execute('SELECT language_code FROM users WHERE user_id = ?', (user_id,))
-        row = await cursor.fetchone()
-        return row[0] if row else None
+    profile = await get_user_profile(user_id)
+    return profile.language if profile else None
 
 async def get_user_footer(user_id: int) -> Optional[str]:
-    async with aiosqlite.connect(DB_NAME) as db:
-        cursor = await db.execute('SELECT footer_text FROM users WHERE user_id = ?', (user_id,))
-        row = await cursor.fetchone()
-        return row[0] if row else None
+    profile = await get_user_profile(user_id)
+    return profile.footer if profile else None
 
 # --- Channel Functions ---
 async def is_channel_registered(channel_id: int, user_id: int) -> bool:
-    async with aiosqlite.connect(DB_NAME) as db:
+    async with get_db() as db:
         cursor = await db.execute('SELECT 1 FROM channels WHERE channel_id = ? AND user_id = ?', (channel_id, user_id))
         return await cursor.fetchone() is not None
 
 async def add_channel(channel_id: int, user_id: int):
-    async with aiosqlite.connect(DB_NAME) as db:
+    async with get_db() as db:
         await db.execute('INSERT INTO channels (channel_id, user_id) VALUES (?, ?)', (channel_id, user_id))
         # Initialize channel premium record with Tehran time
         tehran_time = get_tehran_time()
@@ -156,22 +867,199 @@ async def add_channel(channel_id: int, user_id: int):
         await db.commit()
 
 async def get_user_channels(user_id: int) -> List[Tuple[int]]:
-    async with aiosqlite.connect(DB_NAME) as db:
+    async with get_db() as db:
         cursor = await db.execute('SELECT channel_id FROM channels WHERE user_id = ?', (user_id,))
         return await cursor.fetchall()
 
+# --- Channel Metadata Functions ---
+# Title, username and type of each channel, so channel screens render without
+# a get_chat call per channel. Saved when a channel is registered and kept
+# fresh by utils/channel_meta.py; reads go through an in-memory TTL cache.
+# A row with a NULL title is a channel get_chat failed for.
+
+class ChannelMeta(NamedTuple):
+    title: Optional[str]
+    username: Optional[str]
+    type: Optional[str]
+    updated_at: str
+
+_channel_meta_cache: Optional[TTLCache] = None
+
+def _get_channel_meta_cache() -> TTLCache:
+    global _channel_meta_cache
+    if _channel_meta_cache is None:
+        from config import CHANNEL_META_CACHE_MAX_ENTRIES, CHANNEL_META_CACHE_TTL
+        _channel_meta_cache = TTLCache(CHANNEL_META_CACHE_MAX_ENTRIES, CHANNEL_META_CACHE_TTL)
+    return _channel_meta_cache
+
+async def save_channel_meta(channel_id: int, title: Optional[str], username: Optional[str], chat_type: Optional[str]):
+    await save_channel_meta_batch([(channel_id, title, username, chat_type)])
+
+async def save_channel_meta_batch(entries: List[Tuple[int, Optional[str], Optional[str], Optional[str]]]):
+    """Stores (channel_id, title, username, type) entries in one transaction and caches them."""
+    if not entries:
+        return
+    now = utc_timestamp()
+    async with get_db() as db:
+        await db.executemany('''
+            INSERT INTO channel_meta (channel_id, title, username, type, updated_at) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(channel_id) DO UPDATE SET
+                title = excluded.title, username = excluded.username, type = excluded.type, updated_at = excluded.updated_at
+        ''', [(channel_id, title, username, chat_type, now) for channel_id, title, username, chat_type in entries])
+        await db.commit()
+    cache = _get_channel_meta_cache()
+    for channel_id, title, username, chat_type in entries:
+        cache.set(channel_id, ChannelMeta(title, username, chat_type, now))
+
+async def touch_channel_meta(channel_ids: List[int]):
+    """Marks channels as just checked without changing what is known about them, e.g. after get_chat failed."""
+    if not channel_ids:
+        return
+    now = utc_timestamp()
+    async with get_db() as db:
+        await db.executemany('''
+            INSERT INTO channel_meta (channel_id, updated_at) VALUES (?, ?)
+            ON CONFLICT(channel_id) DO UPDATE SET updated_at = excluded.updated_at
+        ''', [(channel_id, now) for channel_id in channel_ids])
+        await db.commit()
+    cache = _get_channel_meta_cache()
+    for channel_id in channel_ids:
+        cache.pop(channel_id)
+
+async def get_channel_meta(channel_ids: List[int]) -> Dict[int, ChannelMeta]:
+    """Metadata of the given channels, from the cache or one query; channels never fetched are left out."""
+    cache = _get_channel_meta_cache()
+    found, missing = {}, []
+    for channel_id in channel_ids:
+        meta = cache.get(channel_id, _MISSING)
+        if meta is _MISSING:
+            missing.append(channel_id)
+        elif meta is not None:
+            found[channel_id] = meta
+
+    if missing:
+        placeholders = ','.join('?' * len(missing))
+        async with get_db() as db:
+            cursor = await db.execute(
+                f'SELECT channel_id, title, username, type, updated_at FROM channel_meta WHERE channel_id IN ({placeholders})',
+                missing
+            )
+            rows = await cursor.fetchall()
+        for channel_id, *fields in rows:
+            found[channel_id] = ChannelMeta(*fields)
+        # Channels without a row are cached too, until the refresher saves them
+        for channel_id in missing:
+            cache.set(channel_id, found.get(channel_id))
+    return found
+
+async def get_stale_channel_ids(updated_before: str, limit: int) -> List[int]:
+    """Registered channels with no metadata or metadata older than `updated_before`, oldest first."""
+    async with get_db() as db:
+        cursor = await db.execute('''
+            SELECT c.channel_id
+            FROM (SELECT DISTINCT channel_id FROM channels) c
+            LEFT JOIN channel_meta m ON m.channel_id = c.channel_id
+            WHERE m.channel_id IS NULL OR m.updated_at < ?
+            ORDER BY m.updated_at
+            LIMIT ?
+        ''', (updated_before, limit))
+        return [row[0] for row in await cursor.fetchall()]
+
+def get_channel_meta_cache_stats() -> dict:
+    return _get_channel_meta_cache().stats()
+
+# --- Channel Health Functions ---
+# Whether the bot can still post in each channel, from the background audit in
+# utils/channel_health.py: 'ok', 'no_post_rights' (admin without the right to
+# post), 'not_admin', 'gone' (chat not found or bot removed) or 'unknown' (never
+# checked successfully). Deliveries to unhealthy channels are not attempted.
+
+async def save_channel_health_batch(entries: List[Tuple[int, Optional[str], Optional[str]]]):
+    """
+    Stores (channel_id, status, error) check results in one transaction. A
+    None status (a transient error) keeps the previous status and only
+    records the error and the check time.
+    """
+    if not entries:
+        return
+    now = utc_timestamp()
+    async with get_db() as db:
+        await db.executemany('''
+            INSERT INTO channel_health (channel_id, status, checked_at, failures, last_error)
+            VALUES (?, COALESCE(?, 'unknown'), ?, CASE WHEN ? = 'ok' THEN 0 ELSE 1 END, ?)
+            ON CONFLICT(channel_id) DO UPDATE SET
+                status = CASE WHEN ? IS NULL THEN channel_health.status ELSE excluded.status END,
+                checked_at = excluded.checked_at,
+                failures = CASE WHEN excluded.status = 'ok' THEN 0 ELSE channel_health.failures + 1 END,
+                last_error = excluded.last_error
+        ''', [(channel_id, status, now, status, error, status) for channel_id, status, error in entries])
+        await db.commit()
+
+async def get_channels_due_for_audit(checked_before: str, limit: int) -> List[int]:
+    """Registered channels never checked or last checked before `checked_before`, oldest first."""
+    async with get_db() as db:
+        cursor = await db.execute('''
+            SELECT c.channel_id
+            FROM (SELECT DISTINCT channel_id FROM channels) c
+            LEFT JOIN channel_health h ON h.channel_id = c.channel_id
+            WHERE h.channel_id IS NULL OR h.checked_at < ?
+            ORDER BY h.checked_at
+            LIMIT ?
+        ''', (checked_before, limit))
+        return [row[0] for row in await cursor.fetchall()]
+
+async def get_unhealthy_channels(channel_ids: List[int]) -> Dict[int, Tuple[str, Optional[str], str]]:
+    """Status, last error and check time of those given channels that failed their last check."""
+    if not channel_ids:
+        return {}
+    unhealthy = {}
+    async with get_db() as db:
+        # Chunked to stay under SQLite's bound parameter limit
+        for i in range(0, len(channel_ids), 500):
+            chunk = channel_ids[i:i + 500]
+            cursor = await db.execute(f'''
+                SELECT channel_id, status, last_error, checked_at FROM channel_health
+                WHERE channel_id IN ({','.join('?' * len(chunk))}) AND status NOT IN ('ok', 'unknown')
+            ''', chunk)
+            unhealthy.update({row[0]: (row[1], row[2], row[3]) for row in await cursor.fetchall()})
+    return unhealthy
+
+async def get_channel_health_summary() -> Dict[str, int]:
+    """Number of audited channels per health status."""
+    async with get_db() as db:
+        cursor = await db.execute('SELECT status, COUNT(*) FROM channel_health GROUP BY status')
+        return dict(await cursor.fetchall())
+
 async def remove_channel(channel_id: int, user_id: int):
     """Removes a channel from user's registered channels."""
-    async with aiosqlite.connect(DB_NAME) as db:
+    async with get_db() as db:
         await db.execute('DELETE FROM channels WHERE channel_id = ? AND user_id = ?', (channel_id, user_id))
         await db.execute('DELETE FROM channel_premium WHERE channel_id = ? AND user_id = ?', (channel_id, user_id))
         await db.commit()
         logging.info(f"Channel {channel_id} removed for user {user_id}")
 
 # --- Channel Premium Functions ---
+def _is_premium_active(is_premium, premium_until: Optional[str]) -> bool:
+    """Evaluates a stored (is_premium, premium_until) pair against the current Tehran time."""
+    if not is_premium:
+        return False
+    if not premium_until:
+        return True
+    try:
+        premium_date = datetime.fromisoformat(premium_until)
+        current_time = get_tehran_time()
+        # Remove timezone info for comparison
+        if premium_date.tzinfo:
+            premium_date = premium_date.replace(tzinfo=None)
+        if current_time.tzinfo:
+            current_time = current_time.replace(tzinfo=None)
+        return current_time < premium_date
+    except:
+        return False
+
 async def is_channel_premium(channel_id: int, user_id: int) -> bool:
     """Checks if a specific channel has premium access."""
-    async with aiosqlite.connect(DB_NAME) as db:
+    async with get_db() as db:
         cursor = await db.execute('''
             SELECT is_premium, premium_until FROM channel_premium 
             WHERE channel_id = ? AND user_id = ?
@@ -182,102 +1070,54 @@ async def is_channel_premium(channel_id: int, user_id: int) -> bool:
             return False
         
         is_premium, premium_until = row
-        if not is_premium:
-            return False
-            
-        if premium_until:
-            try:
-                premium_date = datetime.fromisoformat(premium_until)
-                current_time = get_tehran_time()
-                # Remove timezone info for comparison
-                if premium_date.tzinfo:
-                    premium_date = premium_date.replace(tzinfo=None)
-                if current_time.tzinfo:
-                    current_time = current_time.replace(tzinfo=None)
-                return current_time < premium_date
-            except:
-                return False
-        return True
+        return _is_premium_active(is_premium, premium_until)
+
+async def _set_channel_premium(db, channel_id: int, user_id: int, premium_until: str = None):
+    """Writes the premium record on an already borrowed connection (no commit)."""
+    # Check if record exists
+    cursor = await db.execute('''
+        SELECT id FROM channel_premium WHERE channel_id = ? AND user_id = ?
+    ''', (channel_id, user_id))
+    
+    if await cursor.fetchone():
+        # Update existing record
+        await db.execute('''
+            UPDATE channel_premium 
+            SET is_premium = 1, premium_until = ? 
+            WHERE channel_id = ? AND user_id = ?
+        ''', (premium_until, channel_id, user_id))
+    else:
+        # Create new record
+        tehran_time = get_tehran_time()
+        await db.execute('''
+            INSERT INTO channel_premium (channel_id, user_id, is_premium, premium_until, created_at, last_reset_date)
+            VALUES (?, ?, 1, ?, ?, ?)
+        ''', (channel_id, user_id, premium_until, tehran_time.isoformat(), tehran_time.isoformat()))
 
 async def set_channel_premium(channel_id: int, user_id: int, premium_until: str = None):
     """Sets a channel as premium until specified date."""
-    async with aiosqlite.connect(DB_NAME) as db:
-        # Check if record exists
-        cursor = await db.execute('''
-            SELECT id FROM channel_premium WHERE channel_id = ? AND user_id = ?
-        ''', (channel_id, user_id))
-        
-        if await cursor.fetchone():
-            # Update existing record
-            await db.execute('''
-                UPDATE channel_premium 
-                SET is_premium = 1, premium_until = ? 
-                WHERE channel_id = ? AND user_id = ?
-            ''', (premium_until, channel_id, user_id))
-        else:
-            # Create new record
-            tehran_time = get_tehran_time()
-            await db.execute('''
-                INSERT INTO channel_premium (channel_id, user_id, is_premium, premium_until, created_at, last_reset_date)
-                VALUES (?, ?, 1, ?, ?, ?)
-            ''', (channel_id, user_id, premium_until, tehran_time.isoformat(), tehran_time.isoformat()))
-        
+    async with get_db() as db:
+        await _set_channel_premium(db, channel_id, user_id, premium_until)
         await db.commit()
         logging.info(f"Channel {channel_id} for user {user_id} set as premium until {premium_until}")
 
 async def get_channel_post_count_this_month(channel_id: int, user_id: int) -> int:
     """Gets channel's post count for current month."""
-    current_month = get_tehran_time().strftime('%Y-%m')
-    
-    async with aiosqlite.connect(DB_NAME) as db:
+    period = get_usage_period()
+    async with get_db() as db:
         cursor = await db.execute('''
-            SELECT posts_sent_this_month, last_reset_date 
-            FROM channel_premium 
-            WHERE channel_id = ? AND user_id = ?
-        ''', (channel_id, user_id))
+            SELECT uc.count
+            FROM channel_premium cp
+            JOIN usage_counters uc ON uc.scope = ? AND uc.id = cp.id AND uc.period = ?
+            WHERE cp.channel_id = ? AND cp.user_id = ?
+        ''', (USAGE_SCOPE_CHANNEL, period, channel_id, user_id))
         row = await cursor.fetchone()
-        
-        if not row:
-            # Initialize record for new channel
-            tehran_time = get_tehran_time()
-            await db.execute('''
-                INSERT INTO channel_premium (channel_id, user_id, created_at, last_reset_date) 
-                VALUES (?, ?, ?, ?)
-            ''', (channel_id, user_id, tehran_time.isoformat(), tehran_time.isoformat()))
-            await db.commit()
-            return 0
-            
-        posts_count, last_reset = row
-        
-        # Check if we need to reset monthly count
-        if last_reset:
-            try:
-                last_reset_dt = datetime.fromisoformat(last_reset)
-                last_reset_month = last_reset_dt.strftime('%Y-%m')
-                if last_reset_month != current_month:
-                    # Reset monthly count
-                    tehran_time = get_tehran_time()
-                    await db.execute('''
-                        UPDATE channel_premium 
-                        SET posts_sent_this_month = 0, last_reset_date = ? 
-                        WHERE channel_id = ? AND user_id = ?
-                    ''', (tehran_time.isoformat(), channel_id, user_id))
-                    await db.commit()
-                    return 0
-            except:
-                pass
-                
-        return posts_count or 0
+    stored = row[0] if row else 0
+    return stored + usage_buffer.pending_delta(USAGE_SCOPE_CHANNEL, (channel_id, user_id), period)
 
 async def increment_channel_post_count(channel_id: int, user_id: int):
-    """Increments channel's post count."""
-    async with aiosqlite.connect(DB_NAME) as db:
-        await db.execute('''
-            UPDATE channel_premium 
-            SET posts_sent_this_month = posts_sent_this_month + 1
-            WHERE channel_id = ? AND user_id = ?
-        ''', (channel_id, user_id))
-        await db.commit()
+    """Increments channel's post count for the current period (buffered, see UsageCounterBuffer)."""
+    await usage_buffer.add(USAGE_SCOPE_CHANNEL, (channel_id, user_id), get_usage_period())
 
 async def can_channel_send_post(channel_id: int, user_id: int) -> tuple[bool, int]:
     """Checks if a channel can send a post. Returns (can_send, remaining_posts)."""
@@ -297,48 +1137,46 @@ async def can_channel_send_post(channel_id: int, user_id: int) -> tuple[bool, in
     
     return remaining > 0, remaining
 
-async def get_user_channels_with_premium_status(user_id: int) -> List[dict]:
-    """Gets user channels with their premium status."""
-    async with aiosqlite.connect(DB_NAME) as db:
+async def get_channel_quota_batch(user_id: int) -> List[dict]:
+    """
+    Gets premium state, expiry, this month's post count and remaining quota
+    for all of a user's channels in a single query.
+    A remaining quota of -1 means unlimited (premium channel or developer).
+    """
+    from config import FREE_CHANNEL_POST_LIMIT, DEVELOPER_ID
+
+    period = get_usage_period()
+    async with get_db() as db:
         cursor = await db.execute('''
-            SELECT c.channel_id, cp.is_premium, cp.premium_until, cp.posts_sent_this_month
+            SELECT c.channel_id, cp.is_premium, cp.premium_until, COALESCE(uc.count, 0)
             FROM channels c
             LEFT JOIN channel_premium cp ON c.channel_id = cp.channel_id AND c.user_id = cp.user_id
+            LEFT JOIN usage_counters uc ON uc.scope = ? AND uc.id = cp.id AND uc.period = ?
             WHERE c.user_id = ?
-        ''', (user_id,))
-        
-        channels = []
-        for row in await cursor.fetchall():
-            channel_id, is_premium, premium_until, posts_count = row
-            
-            # Check if premium is still valid
-            is_premium_active = False
-            if is_premium and premium_until:
-                try:
-                    premium_date = datetime.fromisoformat(premium_until)
-                    current_time = get_tehran_time()
-                    # Remove timezone info for comparison
-                    if premium_date.tzinfo:
-                        premium_date = premium_date.replace(tzinfo=None)
-                    if current_time.tzinfo:
-                        current_time = current_time.replace(tzinfo=None)
-                    is_premium_active = current_time < premium_date
-                except:
-                    pass
-            
-            channels.append({
-                'channel_id': channel_id,
-                'is_premium': is_premium_active,
-                'premium_until': premium_until,
-                'posts_this_month': posts_count or 0
-            })
-        
-        return channels
+        ''', (USAGE_SCOPE_CHANNEL, period, user_id))
+        rows = await cursor.fetchall()
+
+    channels = []
+    for channel_id, is_premium, premium_until, posts_count in rows:
+        posts_count += usage_buffer.pending_delta(USAGE_SCOPE_CHANNEL, (channel_id, user_id), period)
+        is_premium_active = _is_premium_active(is_premium, premium_until)
+        if is_premium_active or user_id == DEVELOPER_ID:
+            remaining = -1
+        else:
+            remaining = max(FREE_CHANNEL_POST_LIMIT - posts_count, 0)
+        channels.append({
+            'channel_id': channel_id,
+            'is_premium': is_premium_active,
+            'premium_until': premium_until,
+            'posts_this_month': posts_count,
+            'remaining': remaining
+        })
+    return channels
 
 # --- Payment Functions ---
 async def create_payment_request(user_id: int, channel_id: int, channel_title: str, duration_months: int, amount: int) -> int:
     """Creates a new payment request and returns the request ID."""
-    async with aiosqlite.connect(DB_NAME) as db:
+    async with get_db() as db:
         tehran_time = get_tehran_time()
         cursor = await db.execute('''
             INSERT INTO payment_requests (user_id, channel_id, channel_title, duration_months, amount, created_at)
@@ -349,7 +1187,7 @@ async def create_payment_request(user_id: int, channel_id: int, channel_title: s
 
 async def update_payment_receipt(request_id: int, receipt_message_id: int):
     """Updates payment request with receipt message ID."""
-    async with aiosqlite.connect(DB_NAME) as db:
+    async with get_db() as db:
         await db.execute('''
             UPDATE payment_requests 
             SET receipt_message_id = ? 
@@ -359,7 +1197,7 @@ async def update_payment_receipt(request_id: int, receipt_message_id: int):
 
 async def get_payment_request(request_id: int) -> Optional[dict]:
     """Gets payment request details."""
-    async with aiosqlite.connect(DB_NAME) as db:
+    async with get_db() as db:
         cursor = await db.execute('''
             SELECT * FROM payment_requests WHERE id = ?
         ''', (request_id,))
@@ -382,7 +1220,7 @@ async def get_payment_request(request_id: int) -> Optional[dict]:
 
 async def get_pending_payment_requests() -> List[dict]:
     """Gets all pending payment requests."""
-    async with aiosqlite.connect(DB_NAME) as db:
+    async with get_db() as db:
         cursor = await db.execute('''
             SELECT * FROM payment_requests WHERE status = 'pending' ORDER BY created_at DESC
         ''', )
@@ -407,7 +1245,7 @@ async def get_pending_payment_requests() -> List[dict]:
 
 async def get_all_payment_requests() -> List[dict]:
     """Gets all payment requests (for management)."""
-    async with aiosqlite.connect(DB_NAME) as db:
+    async with get_db() as db:
         cursor = await db.execute('''
             SELECT pr.*, cp.premium_until 
             FROM payment_requests pr
@@ -436,7 +1274,7 @@ async def get_all_payment_requests() -> List[dict]:
 
 async def approve_payment_request(request_id: int):
     """Approves a payment request and sets channel as premium."""
-    async with aiosqlite.connect(DB_NAME) as db:
+    async with get_db() as db:
         # Get request details
         cursor = await db.execute('SELECT * FROM payment_requests WHERE id = ?', (request_id,))
         row = await cursor.fetchone()
@@ -450,8 +1288,8 @@ async def approve_payment_request(request_id: int):
         tehran_time = get_tehran_time()
         premium_until_tehran = tehran_time + timedelta(days=duration_months * 30)
         
-        # Set channel as premium
-        await set_channel_premium(channel_id, user_id, premium_until_tehran.isoformat())
+        # Set channel as premium in the same transaction (a nested borrow could exhaust the pool)
+        await _set_channel_premium(db, channel_id, user_id, premium_until_tehran.isoformat())
         
         # Update request status with Tehran time
         await db.execute('''
@@ -465,7 +1303,7 @@ async def approve_payment_request(request_id: int):
 
 async def reject_payment_request(request_id: int):
     """Rejects a payment request."""
-    async with aiosqlite.connect(DB_NAME) as db:
+    async with get_db() as db:
         tehran_time = get_tehran_time()
         await db.execute('''
             UPDATE payment_requests 
@@ -475,111 +1313,705 @@ async def reject_payment_request(request_id: int):
         await db.commit()
 
 # --- Scheduled Post Functions ---
-async def add_scheduled_post(job_id: str, user_id: int, post_chat_id: int, post_message_id: int, target_channel_id: int, caption: Optional[str], scheduled_time_utc: str):
-    """Adds a new scheduled post to the database."""
-    async with aiosqlite.connect(DB_NAME) as db:
+# A scheduled post is one `scheduled_batches` row (fired by one scheduler job)
+# plus one `scheduled_batch_targets` row per channel. When the job fires the
+# batch moves into the outbox under the same id, so its deliveries are
+# reported to the user together.
+
+async def add_scheduled_batch(batch_id: str, user_id: int, post_chat_id: int, post_message_id: int,
+                              target_channel_ids: List[int], caption: Optional[str], scheduled_time_utc: str):
+    """Adds a scheduled post and its target channels in one transaction."""
+    async with get_db() as db:
         await db.execute('''
-            INSERT INTO scheduled_posts (job_id, user_id, post_chat_id, post_message_id, target_channel_id, caption, scheduled_time_utc)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (job_id, user_id, post_chat_id, post_message_id, target_channel_id, caption, scheduled_time_utc))
+            INSERT INTO scheduled_batches (batch_id, user_id, post_chat_id, post_message_id, caption, scheduled_time_utc)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (batch_id, user_id, post_chat_id, post_message_id, caption, scheduled_time_utc))
+        await db.executemany(
+            'INSERT OR IGNORE INTO scheduled_batch_targets (batch_id, target_channel_id) VALUES (?, ?)',
+            [(batch_id, channel_id) for channel_id in target_channel_ids]
+        )
+        await db.commit()
+        logging.info(f"Scheduled batch {batch_id} for {len(target_channel_ids)} channels added to DB.")
+
+async def get_pending_scheduled_batches() -> List[Tuple[str, str]]:
+    """All scheduled posts as (batch_id, scheduled_time_utc), earliest first, in one indexed scan."""
+    async with get_db() as db:
+        cursor = await db.execute(
+            'SELECT batch_id, scheduled_time_utc FROM scheduled_batches ORDER BY scheduled_time_utc'
+        )
+        return await cursor.fetchall()
+
+async def _move_scheduled_batches_to_outbox(db, batch_ids: List[str]) -> int:
+    """Copies the targets of the given batches into the outbox and deletes the batches (no commit)."""
+    now = utc_timestamp()
+    placeholders = ','.join('?' * len(batch_ids))
+    cursor = await db.execute(f'''
+        INSERT INTO outbox (batch_id, user_id, post_chat_id, post_message_id, target_channel_id,
+                            caption, next_attempt_at, updated_at)
+        SELECT b.batch_id, b.user_id, b.post_chat_id, b.post_message_id, t.target_channel_id, b.caption,
+               MIN(datetime(b.scheduled_time_utc), ?), ?
+        FROM scheduled_batches b
+        JOIN scheduled_batch_targets t ON t.batch_id = b.batch_id
+        WHERE b.batch_id IN ({placeholders})
+    ''', (now, now, *batch_ids))
+    queued = cursor.rowcount
+    await _delete_scheduled_batches(db, batch_ids)
+    return queued
+
+async def _delete_scheduled_batches(db, batch_ids: List[str]):
+    placeholders = ','.join('?' * len(batch_ids))
+    await db.execute(f'DELETE FROM scheduled_batch_targets WHERE batch_id IN ({placeholders})', batch_ids)
+    await db.execute(f'DELETE FROM scheduled_batches WHERE batch_id IN ({placeholders})', batch_ids)
+
+async def stage_scheduled_batches(batch_ids: List[str], lease_seconds: float,
+                                  claimed_by: Optional[str] = None) -> List['OutboxDelivery']:
+    """
+    Moves scheduled posts into the outbox ahead of their time, already leased:
+    the rows are 'sending' until `lease_seconds` after the scheduled time and keep
+    it as next_attempt_at, so a restart requeues them for that time, not earlier.
+    The caller holds the returned deliveries and sends them when they are due.
+    """
+    if not batch_ids:
+        return []
+    now = utc_timestamp()
+    placeholders = ','.join('?' * len(batch_ids))
+    async with get_db() as db:
+        cursor = await db.execute(f'''
+            INSERT INTO outbox (batch_id, user_id, post_chat_id, post_message_id, target_channel_id, caption,
+                                status, attempts, next_attempt_at, lease_until, claimed_by, updated_at)
+            SELECT b.batch_id, b.user_id, b.post_chat_id, b.post_message_id, t.target_channel_id, b.caption,
+                   'sending', 1, datetime(b.scheduled_time_utc), datetime(b.scheduled_time_utc, ?), ?, ?
+            FROM scheduled_batches b
+            JOIN scheduled_batch_targets t ON t.batch_id = b.batch_id
+            WHERE b.batch_id IN ({placeholders})
+            RETURNING {OUTBOX_COLUMNS}
+        ''', (f'+{int(lease_seconds)} seconds', claimed_by, now, *batch_ids))
+        rows = await cursor.fetchall()
+        await _delete_scheduled_batches(db, batch_ids)
+        await db.commit()
+    return sorted((OutboxDelivery(*row) for row in rows), key=lambda d: d.id)
+
+async def enqueue_scheduled_batch(batch_id: str) -> int:
+    """Moves a due scheduled post into the outbox in one transaction; returns the number of deliveries queued."""
+    return await enqueue_scheduled_batches([batch_id])
+
+async def enqueue_scheduled_batches(batch_ids: List[str]) -> int:
+    """Moves several due scheduled posts into the outbox in one transaction; returns the number of deliveries queued."""
+    async with get_db() as db:
+        queued = await _move_scheduled_batches_to_outbox(db, batch_ids)
         await db.commit()
-        logging.info(f"Scheduled post with job_id {job_id} added to DB.")
+    return queued
 
-async def get_scheduled_post(job_id: str) -> Optional[tuple]:
-    """Retrieves a scheduled post by its job_id."""
-    async with aiosqlite.connect(DB_NAME) as db:
-        cursor = await db.execute('SELECT * FROM scheduled_posts WHERE job_id = ?', (job_id,))
-        return await cursor.fetchone()
+async def get_scheduled_batches_page(after: Tuple[str, str], until: str, limit: int) -> List[Tuple[str, str]]:
+    """
+    Next page of scheduled posts as (batch_id, scheduled_time_utc), in
+    (scheduled_time_utc, batch_id) order strictly after the `after` key and
+    due no later than `until`.
+    """
+    async with get_db() as db:
+        cursor = await db.execute('''
+            SELECT batch_id, scheduled_time_utc FROM scheduled_batches
+            WHERE (scheduled_time_utc, batch_id) > (?, ?) AND scheduled_time_utc <= ?
+            ORDER BY scheduled_time_utc, batch_id
+            LIMIT ?
+        ''', (after[0], after[1], until, limit))
+        return await cursor.fetchall()
+
+async def get_scheduled_load(start_utc: str, end_utc: str) -> List[Tuple[str, int]]:
+    """Deliveries scheduled per fire time in [start_utc, end_utc), as (scheduled_time_utc, deliveries)."""
+    async with get_db() as db:
+        cursor = await db.execute('''
+            SELECT b.scheduled_time_utc, COUNT(*) FROM scheduled_batches b
+            JOIN scheduled_batch_targets t ON t.batch_id = b.batch_id
+            WHERE b.scheduled_time_utc >= ? AND b.scheduled_time_utc < ?
+            GROUP BY b.scheduled_time_utc
+        ''', (start_utc, end_utc))
+        return await cursor.fetchall()
 
-async def delete_scheduled_post(job_id: str):
-    """Deletes a scheduled post from the database by its job_id."""
-    async with aiosqlite.connect(DB_NAME) as db:
-        await db.execute('DELETE FROM scheduled_posts WHERE job_id = ?', (job_id,))
+async def get_last_scheduled_time_for_channels(start_utc: str, end_utc: str, channel_ids: List[int]) -> Optional[str]:
+    """Latest fire time in [start_utc, end_utc) of a scheduled post to any of the given channels."""
+    if not channel_ids:
+        return None
+    placeholders = ','.join('?' * len(channel_ids))
+    async with get_db() as db:
+        cursor = await db.execute(f'''
+            SELECT MAX(b.scheduled_time_utc) FROM scheduled_batches b
+            JOIN scheduled_batch_targets t ON t.batch_id = b.batch_id
+            WHERE b.scheduled_time_utc >= ? AND b.scheduled_time_utc < ? AND t.target_channel_id IN ({placeholders})
+        ''', (start_utc, end_utc, *channel_ids))
+        row = await cursor.fetchone()
+        return row[0]
+
+async def enqueue_due_scheduled_batches(due_before: str, limit: int) -> int:
+    """
+    Moves up to `limit` posts scheduled at or before `due_before` (ISO UTC) into
+    the outbox, earliest first, in one transaction; returns how many posts were moved.
+    """
+    async with get_db() as db:
+        cursor = await db.execute(
+            'SELECT batch_id FROM scheduled_batches WHERE scheduled_time_utc <= ? ORDER BY scheduled_time_utc LIMIT ?',
+            (due_before, limit)
+        )
+        batch_ids = [row[0] for row in await cursor.fetchall()]
+        if not batch_ids:
+            return 0
+        await _move_scheduled_batches_to_outbox(db, batch_ids)
         await db.commit()
-        logging.info(f"Scheduled post with job_id {job_id} deleted from DB.")
+    return len(batch_ids)
+
+async def delete_scheduled_batch(batch_id: str):
+    """Deletes a scheduled post and its targets."""
+    async with get_db() as db:
+        await db.execute('DELETE FROM scheduled_batch_targets WHERE batch_id = ?', (batch_id,))
+        await db.execute('DELETE FROM scheduled_batches WHERE batch_id = ?', (batch_id,))
+        await db.commit()
+        logging.info(f"Scheduled batch {batch_id} deleted from DB.")
+
+# --- Album Functions ---
+# An album (media group) is sent to the bot as one message per photo/video/file.
+# Its parts are stored under the first message's id, which is the post's
+# (post_chat_id, post_message_id) everywhere else, and the outbox sends them as
+# one media group. The rows are small and kept like the source messages
+# themselves, since recurring posts and dead letter retries resend them later.
+
+class AlbumItem(NamedTuple):
+    media_type: str
+    file_id: str
+    caption: Optional[str]
+
+# Albums never change once saved, and most posts are not albums: both are cached
+_album_cache: Optional[TTLCache] = None
+
+def _get_album_cache() -> TTLCache:
+    global _album_cache
+    if _album_cache is None:
+        from config import ALBUM_CACHE_MAX_ENTRIES, ALBUM_CACHE_TTL
+        _album_cache = TTLCache(ALBUM_CACHE_MAX_ENTRIES, ALBUM_CACHE_TTL)
+    return _album_cache
+
+async def save_album(post_chat_id: int, post_message_id: int, items: List[AlbumItem]):
+    """Stores the parts of an album post in order."""
+    async with get_db() as db:
+        await db.executemany('''
+            INSERT OR REPLACE INTO album_items (post_chat_id, post_message_id, position, media_type, file_id, caption)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', [(post_chat_id, post_message_id, position, *item) for position, item in enumerate(items)])
+        await db.commit()
+    _get_album_cache().set((post_chat_id, post_message_id), list(items))
+
+async def get_album(post_chat_id: int, post_message_id: int) -> Optional[List[AlbumItem]]:
+    """The parts of an album post, or None when the post is a single message."""
+    cache = _get_album_cache()
+    items = cache.get((post_chat_id, post_message_id), _MISSING)
+    if items is not _MISSING:
+        return items
+
+    async with get_db() as db:
+        cursor = await db.execute('''
+            SELECT media_type, file_id, caption FROM album_items
+            WHERE post_chat_id = ? AND post_message_id = ?
+            ORDER BY position
+        ''', (post_chat_id, post_message_id))
+        items = [AlbumItem(*row) for row in await cursor.fetchall()] or None
+    cache.set((post_chat_id, post_message_id), items)
+    return items
+
+# --- Outbox Functions ---
+# Every channel delivery is a row in `outbox`: pending -> sending (leased by a
+# worker) -> sent | failed. Rows left in 'sending' by a crash are requeued.
+
+OUTBOX_COLUMNS = 'id, batch_id, user_id, post_chat_id, post_message_id, target_channel_id, caption, attempts, next_attempt_at'
+
+class OutboxDelivery(NamedTuple):
+    id: int
+    batch_id: str
+    user_id: int
+    post_chat_id: int
+    post_message_id: int
+    target_channel_id: int
+    caption: Optional[str]
+    attempts: int
+    next_attempt_at: str
+
+async def enqueue_outbox(batch_id: str, user_id: int, post_chat_id: int, post_message_id: int,
+                         target_channel_ids: List[int], caption: Optional[str]) -> int:
+    """Queues one delivery per target channel; returns the number of rows added."""
+    now = utc_timestamp()
+    async with get_db() as db:
+        await db.executemany(
+            '''INSERT INTO outbox (batch_id, user_id, post_chat_id, post_message_id, target_channel_id,
+                                  caption, next_attempt_at, updated_at)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
+            [(batch_id, user_id, post_chat_id, post_message_id, channel_id, caption, now, now)
+             for channel_id in target_channel_ids]
+        )
+        await db.commit()
+    return len(target_channel_ids)
+
+async def claim_outbox_batch(limit: int, lease_seconds: float, claimed_by: Optional[str] = None) -> List[OutboxDelivery]:
+    """
+    Atomically leases up to `limit` due pending deliveries, oldest first. The
+    UPDATE is a single write transaction, so replicas sharing the database
+    never claim the same row.
+    """
+    now = utc_timestamp()
+    async with get_db() as db:
+        cursor = await db.execute(f'''
+            UPDATE outbox
+            SET status = 'sending', attempts = attempts + 1, lease_until = ?, claimed_by = ?, updated_at = ?
+            WHERE id IN (
+                SELECT id FROM outbox
+                WHERE status = 'pending' AND next_attempt_at <= ?
+                ORDER BY next_attempt_at
+                LIMIT ?
+            )
+            RETURNING {OUTBOX_COLUMNS}
+        ''', (utc_timestamp(delay=lease_seconds), claimed_by, now, now, limit))
+        rows = await cursor.fetchall()
+        await db.commit()
+    return sorted((OutboxDelivery(*row) for row in rows), key=lambda d: d.id)
+
+async def complete_outbox_deliveries(sent: List[Tuple[int, List[int], str, Optional[int]]],
+                                     retry: List[Tuple[int, str, str]],
+                                     failed: List[Tuple[int, str, str, str]]):
+    """
+    Records delivery results in one transaction: `sent` is (id, message_ids,
+    sent_at, latency_ms) with one id per album part, `retry` is (id,
+    next_attempt_at, error) and `failed`
+    is (id, error_class, error_kind, error). Finished deliveries are appended
+    to the `deliveries` ledger; failed ones are also copied to `dead_letters`,
+    where they stay until a developer retries or purges them.
+    """
+    now = utc_timestamp()
+    async with get_db() as db:
+        await db.executemany(
+            "UPDATE outbox SET status = 'sent', sent_message_id = ?, lease_until = NULL, updated_at = ? WHERE id = ?",
+            [(message_ids[0] if message_ids else None, now, delivery_id) for delivery_id, message_ids, _, _ in sent]
+        )
+        await db.executemany(
+            '''UPDATE outbox SET status = 'pending', next_attempt_at = ?, last_error = ?, lease_until = NULL, updated_at = ?
+               WHERE id = ?''',
+            [(next_attempt_at, error, now, delivery_id) for delivery_id, next_attempt_at, error in retry]
+        )
+        await db.executemany(
+            "UPDATE outbox SET status = 'failed', last_error = ?, lease_until = NULL, updated_at = ? WHERE id = ?",
+            [(error, now, delivery_id) for delivery_id, _, _, error in failed]
+        )
+        await db.executemany(
+            '''INSERT INTO dead_letters (outbox_id, batch_id, user_id, post_chat_id, post_message_id, target_channel_id,
+                                       caption, error_class, error_kind, last_error, attempts, failed_at)
+               SELECT id, batch_id, user_id, post_chat_id, post_message_id, target_channel_id,
+                      caption, ?, ?, last_error, attempts, ?
+               FROM outbox WHERE id = ?''',
+            [(error_class, error_kind, now, delivery_id) for delivery_id, error_class, error_kind, _ in failed]
+        )
+        await db.executemany(
+            '''INSERT OR IGNORE INTO deliveries (id, batch_id, user_id, post_chat_id, post_message_id, channel_id, message_id,
+                                                 album_message_ids, status, error_code, attempts, enqueued_at, finished_at,
+                                                 latency_ms)
+               SELECT id, batch_id, user_id, post_chat_id, post_message_id, target_channel_id, ?, ?, ?, ?, attempts, created_at,
+                      ?, ?
+               FROM outbox WHERE id = ?''',
+            [(message_ids[0] if message_ids else None, ','.join(map(str, message_ids[1:])) or None,
+              'sent', None, sent_at, latency_ms, delivery_id)
+             for delivery_id, message_ids, sent_at, latency_ms in sent] +
+            [(None, None, 'failed', error_class, now, None, delivery_id) for delivery_id, error_class, _, _ in failed]
+        )
+        await db.commit()
+
+async def get_outbox_batch_summaries(batch_ids: List[str]) -> List[dict]:
+    """Delivery counts per batch: sent, failed and still open (pending or sending)."""
+    if not batch_ids:
+        return []
+    placeholders = ','.join('?' * len(batch_ids))
+    async with get_db() as db:
+        cursor = await db.execute(f'''
+            SELECT batch_id, MIN(user_id), MIN(post_chat_id), MIN(post_message_id),
+                   SUM(status = 'sent'), SUM(status = 'failed'), SUM(status IN ('pending', 'sending'))
+            FROM outbox WHERE batch_id IN ({placeholders})
+            GROUP BY batch_id
+        ''', batch_ids)
+        rows = await cursor.fetchall()
+    return [{'batch_id': row[0], 'user_id': row[1], 'post_chat_id': row[2], 'post_message_id': row[3],
+             'sent': row[4], 'failed': row[5], 'open': row[6]}
+            for row in rows]
+
+async def requeue_outbox_leases(claimed_by: Optional[str] = None) -> int:
+    """
+    Puts deliveries whose worker died back to pending; returns how many were requeued.
+    Expired leases are always requeued, live ones only when held by `claimed_by`
+    (a replica restarting under the same instance id). Deliveries staged ahead
+    of their scheduled time stay due at that time.
+    """
+    now = utc_timestamp()
+    async with get_db() as db:
+        cursor = await db.execute('''
+            UPDATE outbox SET status = 'pending', lease_until = NULL, claimed_by = NULL,
+                              next_attempt_at = MAX(next_attempt_at, ?), updated_at = ?
+            WHERE status = 'sending' AND (lease_until <= ? OR claimed_by = ?)
+        ''', (now, now, now, claimed_by))
+        await db.commit()
+        return cursor.rowcount
+
+async def prune_outbox(retention_days: float) -> int:
+    """Deletes finished deliveries older than `retention_days`; returns the number of rows removed."""
+    cutoff = utc_timestamp(delay=-retention_days * 86400)
+    async with get_db() as db:
+        cursor = await db.execute(
+            "DELETE FROM outbox WHERE status IN ('sent', 'failed') AND updated_at < ?", (cutoff,)
+        )
+        await db.execute('DELETE FROM outbox_reports WHERE reported_at < ?', (cutoff,))
+        await db.commit()
+        return cursor.rowcount
+
+async def claim_outbox_report(batch_id: str) -> bool:
+    """Marks a finished batch as reported; False if a replica already reported it."""
+    async with get_db() as db:
+        cursor = await db.execute(
+            'INSERT OR IGNORE INTO outbox_reports (batch_id, reported_at) VALUES (?, ?)', (batch_id, utc_timestamp())
+        )
+        await db.commit()
+        return cursor.rowcount > 0
+
+async def get_outbox_stats() -> Dict[str, int]:
+    """Number of deliveries per status."""
+    async with get_db() as db:
+        cursor = await db.execute('SELECT status, COUNT(*) FROM outbox GROUP BY status')
+        return {status: count for status, count in await cursor.fetchall()}
+
+# --- Delivery Ledger Functions ---
+# `deliveries` keeps one row per finished outbox delivery (same id) with the
+# channel's message id, timings and outcome, long after the outbox row is pruned.
+
+async def get_channel_delivery_stats(since: str, channel_id: Optional[int] = None, limit: int = 10) -> List[dict]:
+    """
+    Sent and failed counts, success rate and average latency per channel for
+    deliveries finished since `since`: one channel, or the `limit` channels
+    with the worst success rate.
+    """
+    where, params = 'finished_at >= ?', [since]
+    if channel_id is not None:
+        where, params = 'channel_id = ? AND finished_at >= ?', [channel_id, since]
+    async with get_db() as db:
+        cursor = await db.execute(f'''
+            SELECT channel_id, SUM(status = 'sent'), SUM(status = 'failed'), AVG(latency_ms)
+            FROM deliveries
+            WHERE {where}
+            GROUP BY channel_id
+            ORDER BY 1.0 * SUM(status = 'sent') / COUNT(*), COUNT(*) DESC
+            LIMIT ?
+        ''', (*params, limit))
+        rows = await cursor.fetchall()
+    return [{'channel_id': row[0], 'sent': row[1], 'failed': row[2],
+             'success_rate': row[1] / (row[1] + row[2]) * 100, 'avg_latency_ms': row[3]}
+            for row in rows]
+
+async def get_channel_latency_percentiles(channel_id: int, since: str,
+                                          quantiles: Tuple[float, ...] = (0.5, 0.95, 0.99)) -> Dict[float, Optional[int]]:
+    """
+    Latency (due time to sent, ms) percentiles of a channel's sends finished
+    since `since`, read from its range of the covering index. Across all
+    channels that would sort the whole window; use metrics.delivery_lag instead.
+    """
+    where = "channel_id = ? AND finished_at >= ? AND status = 'sent' AND latency_ms IS NOT NULL"
+    params = [channel_id, since]
+    async with get_db() as db:
+        cursor = await db.execute(f'SELECT COUNT(*) FROM deliveries WHERE {where}', params)
+        count = (await cursor.fetchone())[0]
+        percentiles = {}
+        for q in quantiles:
+            if not count:
+                percentiles[q] = None
+                continue
+            cursor = await db.execute(
+                f'SELECT latency_ms FROM deliveries WHERE {where} ORDER BY latency_ms LIMIT 1 OFFSET ?',
+                (*params, int(q * (count - 1)))
+            )
+            percentiles[q] = (await cursor.fetchone())[0]
+    return percentiles
+
+async def get_post_deliveries(post_chat_id: int, post_message_id: int, user_id: int) -> List[Tuple[int, int, List[int]]]:
+    """
+    Copies of a post still up in the channels, as (ledger id, channel_id,
+    message_ids), from every send of it (a recurring post has one per fire).
+    An album copy has one message id per part, the captioned one first.
+    """
+    async with get_db() as db:
+        cursor = await db.execute('''
+            SELECT id, channel_id, message_id, album_message_ids FROM deliveries
+            WHERE post_chat_id = ? AND post_message_id = ? AND user_id = ?
+              AND status = 'sent' AND message_id IS NOT NULL AND deleted_at IS NULL
+            ORDER BY id
+        ''', (post_chat_id, post_message_id, user_id))
+        return [(delivery_id, channel_id, [message_id] + [int(part) for part in (album_message_ids or '').split(',') if part])
+                for delivery_id, channel_id, message_id, album_message_ids in await cursor.fetchall()]
+
+async def mark_deliveries_deleted(delivery_ids: List[int]) -> int:
+    """Records that these channel copies were deleted; they stay in the ledger for the stats."""
+    if not delivery_ids:
+        return 0
+    now = utc_timestamp()
+    async with get_db() as db:
+        cursor = await db.executemany('UPDATE deliveries SET deleted_at = ? WHERE id = ?',
+                                      [(now, delivery_id) for delivery_id in delivery_ids])
+        await db.commit()
+        return cursor.rowcount
+
+# --- Dead Letter Functions ---
+
+async def get_dead_letter_summary() -> List[Dict]:
+    """Dead letters per error class, most frequent first."""
+    async with get_db() as db:
+        cursor = await db.execute('''
+            SELECT error_class, MIN(error_kind), COUNT(*), MAX(failed_at) FROM dead_letters
+            GROUP BY error_class
+            ORDER BY COUNT(*) DESC
+        ''')
+        return [
+            {'error_class': row[0], 'error_kind': row[1], 'count': row[2], 'last_failed_at': row[3]}
+            for row in await cursor.fetchall()
+        ]
+
+async def get_dead_letters(limit: int = 10, error_class: Optional[str] = None) -> List[Dict]:
+    """The most recent dead letters, optionally of one error class."""
+    async with get_db() as db:
+        cursor = await db.execute('''
+            SELECT id, user_id, target_channel_id, error_class, last_error, attempts, failed_at FROM dead_letters
+            WHERE ? IS NULL OR error_class = ?
+            ORDER BY failed_at DESC, id DESC
+            LIMIT ?
+        ''', (error_class, error_class, limit))
+        return [
+            {'id': row[0], 'user_id': row[1], 'target_channel_id': row[2], 'error_class': row[3],
+             'last_error': row[4], 'attempts': row[5], 'failed_at': row[6]}
+            for row in await cursor.fetchall()
+        ]
+
+async def retry_dead_letters(retry_id: str, error_class: Optional[str] = None) -> int:
+    """
+    Moves dead letters (all, or one error class) back into the outbox in one
+    transaction; returns how many were requeued. Each original post gets the
+    batch id 'retry:<retry_id>:<batch_id>', so its owner gets a fresh report.
+    """
+    now = utc_timestamp()
+    async with get_db() as db:
+        cursor = await db.execute('''
+            INSERT INTO outbox (batch_id, user_id, post_chat_id, post_message_id, target_channel_id,
+                                caption, next_attempt_at, updated_at)
+            SELECT 'retry:' || ? || ':' || batch_id, user_id, post_chat_id, post_message_id, target_channel_id,
+                   caption, ?, ?
+            FROM dead_letters
+            WHERE ? IS NULL OR error_class = ?
+            ORDER BY id
+        ''', (retry_id, now, now, error_class, error_class))
+        requeued = cursor.rowcount
+        await db.execute('DELETE FROM dead_letters WHERE ? IS NULL OR error_class = ?', (error_class, error_class))
+        await db.commit()
+        return requeued
+
+async def purge_dead_letters(error_class: Optional[str] = None) -> int:
+    """Deletes dead letters (all, or one error class); returns how many were removed."""
+    async with get_db() as db:
+        cursor = await db.execute('DELETE FROM dead_letters WHERE ? IS NULL OR error_class = ?', (error_class, error_class))
+        await db.commit()
+        return cursor.rowcount
+
+# --- Recurring Post Functions ---
+
+class RecurringPost(NamedTuple):
+    rule_id: str
+    kind: str
+    time_of_day: str
+    weekdays: Optional[str]
+    month_day: Optional[int]
+    next_fire_utc: str
+
+async def add_recurring_post(rule_id: str, user_id: int, post_chat_id: int, post_message_id: int,
+                             target_channel_ids: List[int], caption: Optional[str], kind: str, time_of_day: str,
+                             weekdays: Optional[str], month_day: Optional[int], next_fire_utc: str):
+    """Adds a recurring post rule and its target channels in one transaction."""
+    async with get_db() as db:
+        await db.execute('''
+            INSERT INTO recurring_posts (rule_id, user_id, post_chat_id, post_message_id, caption,
+                                         kind, time_of_day, weekdays, month_day, next_fire_utc)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (rule_id, user_id, post_chat_id, post_message_id, caption, kind, time_of_day, weekdays, month_day, next_fire_utc))
+        await db.executemany(
+            'INSERT OR IGNORE INTO recurring_post_targets (rule_id, target_channel_id) VALUES (?, ?)',
+            [(rule_id, channel_id) for channel_id in target_channel_ids]
+        )
+        await db.commit()
+
+async def get_due_recurring_posts(due_before: str, limit: int) -> List[RecurringPost]:
+    """Rules whose next fire time is at or before `due_before` (ISO UTC), earliest first."""
+    async with get_db() as db:
+        cursor = await db.execute('''
+            SELECT rule_id, kind, time_of_day, weekdays, month_day, next_fire_utc FROM recurring_posts
+            WHERE next_fire_utc <= ?
+            ORDER BY next_fire_utc
+            LIMIT ?
+        ''', (due_before, limit))
+        return [RecurringPost(*row) for row in await cursor.fetchall()]
+
+async def get_next_recurring_fire() -> Optional[str]:
+    """The earliest next fire time over all rules, or None when there are none."""
+    async with get_db() as db:
+        cursor = await db.execute('SELECT MIN(next_fire_utc) FROM recurring_posts')
+        row = await cursor.fetchone()
+        return row[0]
+
+async def get_recurring_post_targets(rule_ids: List[str]) -> Dict[str, Tuple[int, List[int]]]:
+    """Owner and target channels of each rule, as {rule_id: (user_id, [channel_id, ...])}."""
+    if not rule_ids:
+        return {}
+    placeholders = ','.join('?' * len(rule_ids))
+    async with get_db() as db:
+        cursor = await db.execute(f'''
+            SELECT r.rule_id, r.user_id, t.target_channel_id
+            FROM recurring_posts r
+            JOIN recurring_post_targets t ON t.rule_id = r.rule_id
+            WHERE r.rule_id IN ({placeholders})
+        ''', rule_ids)
+        targets = {}
+        for rule_id, user_id, channel_id in await cursor.fetchall():
+            targets.setdefault(rule_id, (user_id, []))[1].append(channel_id)
+        return targets
+
+async def fire_recurring_posts(fires: List[Tuple[str, str, str, List[int]]]) -> int:
+    """
+    Advances rules in one transaction. `fires` holds (rule_id, fired_utc,
+    next_fire_utc, channel_ids): the rule moves from fired_utc to next_fire_utc
+    and one delivery per listed target channel is queued in the outbox under
+    the batch id '<rule_id>:<fired_utc>'; an empty list skips the occurrence.
+    A rule that was already advanced or deleted meanwhile is skipped. Returns
+    the number of deliveries queued.
+    """
+    now = utc_timestamp()
+    queued = 0
+    async with get_db() as db:
+        for rule_id, fired_utc, next_fire_utc, channel_ids in fires:
+            cursor = await db.execute(
+                'UPDATE recurring_posts SET next_fire_utc = ?, last_fired_utc = ? WHERE rule_id = ? AND next_fire_utc = ?',
+                (next_fire_utc, fired_utc, rule_id, fired_utc)
+            )
+            if not cursor.rowcount or not channel_ids:
+                continue
+            placeholders = ','.join('?' * len(channel_ids))
+            cursor = await db.execute(f'''
+                INSERT INTO outbox (batch_id, user_id, post_chat_id, post_message_id, target_channel_id,
+                                    caption, next_attempt_at, updated_at)
+                SELECT r.rule_id || ':' || ?, r.user_id, r.post_chat_id, r.post_message_id, t.target_channel_id, r.caption,
+                       MIN(datetime(?), ?), ?
+                FROM recurring_posts r
+                JOIN recurring_post_targets t ON t.rule_id = r.rule_id
+                WHERE r.rule_id = ? AND t.target_channel_id IN ({placeholders})
+            ''', (fired_utc, fired_utc, now, now, rule_id, *channel_ids))
+            queued += cursor.rowcount
+        await db.commit()
+    return queued
+
+async def get_user_recurring_posts(user_id: int) -> List[Dict]:
+    """A user's recurring post rules with their channel counts, soonest first."""
+    async with get_db() as db:
+        cursor = await db.execute('''
+            SELECT r.rule_id, r.kind, r.time_of_day, r.weekdays, r.month_day, r.next_fire_utc,
+                   (SELECT COUNT(*) FROM recurring_post_targets t WHERE t.rule_id = r.rule_id)
+            FROM recurring_posts r
+            WHERE r.user_id = ?
+            ORDER BY r.next_fire_utc
+        ''', (user_id,))
+        return [
+            {'rule_id': row[0], 'kind': row[1], 'time_of_day': row[2], 'weekdays': row[3],
+             'month_day': row[4], 'next_fire_utc': row[5], 'channels': row[6]}
+            for row in await cursor.fetchall()
+        ]
+
+async def delete_recurring_post(rule_id: str, user_id: int) -> bool:
+    """Deletes one of the user's rules; returns False when it does not exist or belongs to someone else."""
+    async with get_db() as db:
+        cursor = await db.execute('DELETE FROM recurring_posts WHERE rule_id = ? AND user_id = ?', (rule_id, user_id))
+        if cursor.rowcount:
+            await db.execute('DELETE FROM recurring_post_targets WHERE rule_id = ?', (rule_id,))
+        await db.commit()
+        return cursor.rowcount > 0
+
+# --- Lease Functions ---
+# A lease is one row per role (e.g. the scheduler leader) naming the replica that
+# holds it until `expires_at`. The holder renews it by heartbeat; anyone may take
+# it over once it has expired.
+
+async def acquire_lease(name: str, holder: str, ttl_seconds: float) -> bool:
+    """Takes or renews a lease for `ttl_seconds`; returns False while another holder's lease is live."""
+    now = utc_timestamp()
+    async with get_db() as db:
+        cursor = await db.execute('''
+            INSERT INTO leases (name, holder, expires_at, acquired_at, renewed_at) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(name) DO UPDATE SET
+                holder = excluded.holder,
+                expires_at = excluded.expires_at,
+                acquired_at = CASE WHEN leases.holder = excluded.holder THEN leases.acquired_at ELSE excluded.acquired_at END,
+                renewed_at = excluded.renewed_at
+            WHERE leases.holder = excluded.holder OR leases.expires_at <= ?
+        ''', (name, holder, utc_timestamp(delay=ttl_seconds), now, now, now))
+        await db.commit()
+        return cursor.rowcount > 0
+
+async def release_lease(name: str, holder: str):
+    """Gives a lease up early so another replica can take it without waiting for it to expire."""
+    async with get_db() as db:
+        await db.execute('DELETE FROM leases WHERE name = ? AND holder = ?', (name, holder))
+        await db.commit()
+
+async def get_lease(name: str) -> Optional[Dict]:
+    async with get_db() as db:
+        cursor = await db.execute(
+            'SELECT holder, expires_at, acquired_at, renewed_at FROM leases WHERE name = ?', (name,)
+        )
+        row = await cursor.fetchone()
+    if row is None:
+        return None
+    return {'holder': row[0], 'expires_at': row[1], 'acquired_at': row[2], 'renewed_at': row[3]}
+
 
 # --- Legacy Premium Functions (User-based) ---
 async def is_user_premium(user_id: int) -> bool:
     """Checks if user has premium access."""
-    async with aiosqlite.connect(DB_NAME) as db:
-        cursor = await db.execute('SELECT is_premium, premium_until FROM users WHERE user_id = ?', (user_id,))
-        row = await cursor.fetchone()
-        if not row:
-            return False
-        
-        is_premium, premium_until = row
-        if not is_premium:
-            return False
-            
-        if premium_until:
-            try:
-                premium_date = datetime.fromisoformat(premium_until)
-                current_time = get_tehran_time()
-                # Remove timezone info for comparison
-                if premium_date.tzinfo:
-                    premium_date = premium_date.replace(tzinfo=None)
-                if current_time.tzinfo:
-                    current_time = current_time.replace(tzinfo=None)
-                return current_time < premium_date
-            except:
-                return False
-        return True
+    profile = await get_user_profile(user_id)
+    if not profile:
+        return False
+    return _is_premium_active(profile.is_premium, profile.premium_until)
 
 async def set_user_premium(user_id: int, premium_until: str = None):
     """Sets user as premium until specified date."""
-    async with aiosqlite.connect(DB_NAME) as db:
+    async with get_db() as db:
         await db.execute('UPDATE users SET is_premium = 1, premium_until = ? WHERE user_id = ?', 
                         (premium_until, user_id))
         await db.commit()
         logging.info(f"User {user_id} set as premium until {premium_until}")
+    _update_cached_profile(user_id, is_premium=1, premium_until=premium_until)
+
+async def clear_user_premium(user_id: int):
+    """Removes user premium access."""
+    async with get_db() as db:
+        await db.execute('UPDATE users SET is_premium = 0, premium_until = NULL WHERE user_id = ?', (user_id,))
+        await db.commit()
+        logging.info(f"User {user_id} premium removed")
+    _update_cached_profile(user_id, is_premium=0, premium_until=None)
 
 async def get_user_post_count_this_month(user_id: int) -> int:
     """Gets user's post count for current month."""
-    current_month = get_tehran_time().strftime('%Y-%m')
-    
-    async with aiosqlite.connect(DB_NAME) as db:
+    period = get_usage_period()
+    async with get_db() as db:
         cursor = await db.execute('''
-            SELECT posts_sent_this_month, last_reset_date FROM user_stats WHERE user_id = ?
-        ''', (user_id,))
+            SELECT count FROM usage_counters WHERE scope = ? AND id = ? AND period = ?
+        ''', (USAGE_SCOPE_USER, user_id, period))
         row = await cursor.fetchone()
-        
-        if not row:
-            # Initialize stats for new user
-            await db.execute('INSERT INTO user_stats (user_id) VALUES (?)', (user_id,))
-            await db.commit()
-            return 0
-            
-        posts_count, last_reset = row
-        
-        # Check if we need to reset monthly count
-        if last_reset:
-            try:
-                last_reset_dt = datetime.fromisoformat(last_reset)
-                last_reset_month = last_reset_dt.strftime('%Y-%m')
-                if last_reset_month != current_month:
-                    # Reset monthly count
-                    tehran_time = get_tehran_time()
-                    await db.execute('''
-                        UPDATE user_stats SET posts_sent_this_month = 0, last_reset_date = ? 
-                        WHERE user_id = ?
-                    ''', (tehran_time.isoformat(), user_id))
-                    await db.commit()
-                    return 0
-            except:
-                pass
-                
-        return posts_count or 0
+    stored = row[0] if row else 0
+    return stored + usage_buffer.pending_delta(USAGE_SCOPE_USER, user_id, period)
 
 async def increment_user_post_count(user_id: int):
-    """Increments user's post count."""
-    async with aiosqlite.connect(DB_NAME) as db:
-        await db.execute('''
-            UPDATE user_stats 
-            SET posts_sent_this_month = posts_sent_this_month + 1,
-                total_posts_sent = total_posts_sent + 1
-            WHERE user_id = ?
-        ''', (user_id,))
-        await db.commit()
+    """Increments user's post count for the current period and the lifetime total (buffered)."""
+    await usage_buffer.add(USAGE_SCOPE_USER, user_id, get_usage_period())
 
 async def can_user_send_post(user_id: int) -> tuple[bool, int]:
     """Checks if user can send a post. Returns (can_send, remaining_posts)."""
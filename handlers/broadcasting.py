@@ -2,36 +2,44 @@ import logging
 import uuid
 import jdatetime
 import datetime
+from typing import Optional
 from pytz import timezone
 from aiogram import Router, F, types, Bot
 from aiogram.fsm.context import FSMContext
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 
 import database
+from middlewares.user_context import UserContext
 from texts import get_text
 from states import Form
-from keyboards import get_post_action_keyboard, get_channel_selection_keyboard, get_caption_choice_keyboard
+from keyboards import get_post_action_keyboard, get_channel_selection_keyboard, get_caption_choice_keyboard, \
+    get_recurrence_kind_keyboard, get_weekday_selection_keyboard
 from utils.persian_calendar import create_persian_calendar, CALENDAR_CALLBACK_PREFIX, PREV_MONTH_CALLBACK, NEXT_MONTH_CALLBACK, DAY_CALLBACK
-from utils.scheduler import send_scheduled_post
+from utils.scheduler import schedule_post_job
+from utils.slots import check_slot, pick_fire_time
+from utils.outbox import outbox_worker
+from utils.recurrence import WEEKDAY_NAMES, describe, format_weekdays, next_occurrence, recurring_dispatcher
+from utils.channel_meta import channel_meta_refresher
+from utils.albums import MAX_ALBUM_SIZE, album_buffer, album_item
 
 router = Router()
 
 # --- 1. State-specific handlers (Must be before content handler!) ---
 
 @router.message(Form.waiting_for_caption, F.text)
-async def process_caption_handler(message: types.Message, state: FSMContext, bot: Bot, scheduler: AsyncIOScheduler):
+async def process_caption_handler(message: types.Message, state: FSMContext, bot: Bot, scheduler: AsyncIOScheduler, user_ctx: UserContext):
     current_state = await state.get_state()
     logging.info(f"🎯 Caption handler called for user {message.from_user.id}, state: {current_state}, text: {message.text}")
     await state.update_data(caption=message.text)
-    lang = await database.get_user_language(message.from_user.id) or 'en'
+    lang = user_ctx.lang
     processing_msg = "کپشن دریافت شد. در حال پردازش..." if lang == 'fa' else "Caption received. Processing..."
-    await message.answer(processing_msg)
+    status = await message.answer(processing_msg)
     logging.info(f"🚀 About to call send_final_post for user {message.from_user.id}")
-    await send_final_post(message.from_user.id, state, bot, scheduler)
+    await send_final_post(user_ctx, state, bot, scheduler, status)
 
 @router.message(Form.selecting_schedule_time, F.text)
-async def process_schedule_time(message: types.Message, state: FSMContext, bot: Bot):
-    lang = await database.get_user_language(message.from_user.id) or 'en'
+async def process_schedule_time(message: types.Message, state: FSMContext, bot: Bot, user_ctx: UserContext):
+    lang = user_ctx.lang
     logging.info(f"⏰ Time handler called for user {message.from_user.id}, text: {message.text}")
     try:
         hour, minute = map(int, message.text.split(':'))
@@ -52,41 +60,29 @@ async def process_schedule_time(message: types.Message, state: FSMContext, bot:
              await message.answer("زمان انت��اب شده در گذشته است. لطفا زمان دیگری انتخاب کنید.")
              return
 
+        # Warn once about crowded minutes; sending the same time again keeps it
+        busy, suggestions = await check_slot(utc_dt)
+        if suggestions is not None and data.get('busy_slot_warned') != utc_dt.isoformat():
+            await state.update_data(busy_slot_warned=utc_dt.isoformat())
+            separator = '، ' if lang == 'fa' else ', '
+            await message.answer(get_text('schedule_slot_busy', lang).format(
+                time=f"{hour:02d}:{minute:02d}",
+                count=busy,
+                suggestions=separator.join(m.astimezone(tehran_tz).strftime('%H:%M') for m in suggestions) or "-"
+            ))
+            return
+
         await state.update_data(scheduled_datetime_utc=utc_dt)
         await state.set_state(None)
 
         # Re-trigger the channel selection process now that time is set
-        channels = await database.get_user_channels(message.from_user.id)
-        logging.info(f"Retrieved channels for user {message.from_user.id}: {channels}")
+        all_channels_info = await get_channels_info(user_ctx)
         
-        if not channels:
+        if not all_channels_info:
             await message.answer(get_text('no_channels', lang))
             await state.clear()
             return
 
-        # Convert channels to proper format with premium status
-        all_channels_info = []
-        for channel in channels:
-            try:
-                if isinstance(channel, tuple):
-                    channel_id = channel[0]
-                else:
-                    channel_id = channel
-                chat = await bot.get_chat(channel_id)
-                
-                # Check channel premium status and post count
-                is_premium = await database.is_channel_premium(channel_id, message.from_user.id)
-                posts_count = await database.get_channel_post_count_this_month(channel_id, message.from_user.id)
-                
-                all_channels_info.append({
-                    'id': channel_id, 
-                    'title': chat.title,
-                    'is_premium': is_premium,
-                    'posts_count': posts_count
-                })
-            except Exception as e:
-                logging.error(f"Error getting chat info for channel {channel}: {e}")
-
         await state.update_data(all_channels=all_channels_info, selected_channels=[], is_scheduled=True)
         await state.set_state(Form.selecting_channels)
         await message.answer(get_text('select_channels_prompt', lang), reply_markup=get_channel_selection_keyboard(lang, all_channels_info, []))
@@ -96,12 +92,53 @@ async def process_schedule_time(message: types.Message, state: FSMContext, bot:
         logging.error(f"Error processing schedule time: {e}")
         await message.answer("خطا در پردازش زمان. لطفا دوباره تلاش کنید.")
 
+@router.message(Form.waiting_for_recurrence_month_day, F.text)
+async def process_recurrence_month_day(message: types.Message, state: FSMContext, user_ctx: UserContext):
+    lang = user_ctx.lang
+    try:
+        month_day = int(message.text)
+    except ValueError:
+        month_day = 0
+    if not 1 <= month_day <= 31:
+        await message.answer(get_text('error_invalid_month_day', lang))
+        return
+
+    data = await state.get_data()
+    await state.update_data(recurrence={**data['recurrence'], 'month_day': month_day})
+    await state.set_state(Form.waiting_for_recurrence_time)
+    await message.answer(get_text('prompt_recurrence_time', lang))
+
+@router.message(Form.waiting_for_recurrence_time, F.text)
+async def process_recurrence_time(message: types.Message, state: FSMContext, bot: Bot, user_ctx: UserContext):
+    lang = user_ctx.lang
+    try:
+        hour, minute = map(int, message.text.split(':'))
+        time_of_day = datetime.time(hour, minute).strftime('%H:%M')
+    except ValueError:
+        await message.answer("فرمت ساعت نادرست است. لطفا به صورت HH:MM وارد کنید (مثال: 14:30)")
+        return
+
+    data = await state.get_data()
+    recurrence = {**data['recurrence'], 'time_of_day': time_of_day}
+    await state.update_data(recurrence=recurrence, is_scheduled=False)
+    await state.set_state(None)
+
+    all_channels_info = await get_channels_info(user_ctx)
+    if not all_channels_info:
+        await message.answer(get_text('no_channels', lang))
+        await state.clear()
+        return
+
+    await state.update_data(all_channels=all_channels_info, selected_channels=[])
+    await state.set_state(Form.selecting_channels)
+    await message.answer(get_text('select_channels_prompt', lang), reply_markup=get_channel_selection_keyboard(lang, all_channels_info, []))
+
 # --- 2. Content Entry Point - Accept ALL content types ---
 
 @router.message(~F.text.startswith('/'))  # Accept everything except commands
-async def content_entry_handler(message: types.Message, state: FSMContext):
+async def content_entry_handler(message: types.Message, state: FSMContext, user_ctx: UserContext):
     user_id = message.from_user.id
-    lang = await database.get_user_language(user_id) or 'en'
+    lang = user_ctx.lang
     
     current_state = await state.get_state()
     logging.info(f"📨 Content handler called for user {user_id}, state: {current_state}, content_type: {message.content_type}")
@@ -133,6 +170,23 @@ async def content_entry_handler(message: types.Message, state: FSMContext):
         logging.info(f"User {user_id} is in state {current_state}, ignoring content handler")
         return
     
+    # The parts of an album arrive as separate messages and make one post
+    album = None
+    if message.media_group_id:
+        collected = await album_buffer.collect(message)
+        if collected is None:
+            return
+        if not collected.messages:
+            await message.answer(get_text('album_too_many_pending', lang).format(limit=album_buffer.max_pending_per_user))
+            return
+        parts = collected.messages
+        album = [list(item) for item in map(album_item, parts) if item is not None]
+        message = parts[0]
+        logging.info(f"🖼️ Album of {len(parts)} parts received from user {user_id}")
+        if collected.dropped:
+            await message.answer(get_text('album_parts_dropped', lang).format(
+                limit=MAX_ALBUM_SIZE, count=collected.dropped))
+
     logging.info(f"📤 Content received from user {user_id} for broadcasting")
 
     # Check if user has registered channels
@@ -151,6 +205,7 @@ async def content_entry_handler(message: types.Message, state: FSMContext):
     await state.set_data({
         'post_message_id': message.message_id,
         'post_chat_id': message.chat.id,
+        'album': album,
         'selected_channels': []
     })
 
@@ -159,30 +214,76 @@ async def content_entry_handler(message: types.Message, state: FSMContext):
 # --- 3. Broadcasting & Scheduling Workflow ---
 
 @router.callback_query(F.data == "cancel_broadcast")
-async def cancel_broadcast_handler(callback: types.CallbackQuery, state: FSMContext):
-    lang = await database.get_user_language(callback.from_user.id) or 'en'
+async def cancel_broadcast_handler(callback: types.CallbackQuery, state: FSMContext, user_ctx: UserContext):
+    lang = user_ctx.lang
     await state.clear()
     await callback.message.edit_text(get_text('operation_cancelled', lang))
 
 @router.callback_query(F.data == "send_now")
-async def send_now_handler(callback: types.CallbackQuery, state: FSMContext, bot: Bot):
+async def send_now_handler(callback: types.CallbackQuery, state: FSMContext, bot: Bot, user_ctx: UserContext):
     await state.update_data(is_scheduled=False)
-    await start_channel_selection(callback, state, bot)
+    await start_channel_selection(callback, state, bot, user_ctx)
 
 @router.callback_query(F.data == "send_scheduled")
-async def send_scheduled_handler(callback: types.CallbackQuery, state: FSMContext):
-    lang = await database.get_user_language(callback.from_user.id) or 'en'
+async def send_scheduled_handler(callback: types.CallbackQuery, state: FSMContext, user_ctx: UserContext):
+    lang = user_ctx.lang
     await state.update_data(is_scheduled=True)
     await callback.message.edit_text(
         get_text('prompt_for_schedule_date', lang),
         reply_markup=await create_persian_calendar()
     )
 
+@router.callback_query(F.data == "send_recurring")
+async def send_recurring_handler(callback: types.CallbackQuery, state: FSMContext, user_ctx: UserContext):
+    lang = user_ctx.lang
+    await callback.message.edit_text(get_text('prompt_recurrence_kind', lang), reply_markup=get_recurrence_kind_keyboard(lang))
+
+@router.callback_query(F.data.in_(["recurrence_daily", "recurrence_weekly", "recurrence_monthly"]))
+async def recurrence_kind_handler(callback: types.CallbackQuery, state: FSMContext, user_ctx: UserContext):
+    lang = user_ctx.lang
+    kind = callback.data.split('_')[1]
+    await state.update_data(recurrence={'kind': kind, 'weekdays': [], 'month_day': None})
+
+    if kind == 'weekly':
+        await state.set_state(Form.selecting_recurrence_weekdays)
+        await callback.message.edit_text(
+            get_text('prompt_recurrence_weekdays', lang),
+            reply_markup=get_weekday_selection_keyboard(lang, WEEKDAY_NAMES.get(lang, WEEKDAY_NAMES['en']), [])
+        )
+    elif kind == 'monthly':
+        await state.set_state(Form.waiting_for_recurrence_month_day)
+        await callback.message.edit_text(get_text('prompt_recurrence_month_day', lang))
+    else:
+        await state.set_state(Form.waiting_for_recurrence_time)
+        await callback.message.edit_text(get_text('prompt_recurrence_time', lang))
+
+@router.callback_query(Form.selecting_recurrence_weekdays, F.data.startswith("recurrence_day_"))
+async def recurrence_weekday_handler(callback: types.CallbackQuery, state: FSMContext, user_ctx: UserContext):
+    lang = user_ctx.lang
+    day = int(callback.data.split('_')[2])
+    data = await state.get_data()
+    weekdays = data['recurrence']['weekdays']
+    if day in weekdays:
+        weekdays.remove(day)
+    else:
+        weekdays.append(day)
+
+    await state.update_data(recurrence={**data['recurrence'], 'weekdays': weekdays})
+    await callback.message.edit_reply_markup(
+        reply_markup=get_weekday_selection_keyboard(lang, WEEKDAY_NAMES.get(lang, WEEKDAY_NAMES['en']), weekdays)
+    )
+
+@router.callback_query(Form.selecting_recurrence_weekdays, F.data == "recurrence_days_done")
+async def recurrence_weekdays_done_handler(callback: types.CallbackQuery, state: FSMContext, user_ctx: UserContext):
+    lang = user_ctx.lang
+    await state.set_state(Form.waiting_for_recurrence_time)
+    await callback.message.edit_text(get_text('prompt_recurrence_time', lang))
+
 # --- 4. Calendar Handlers ---
 
 @router.callback_query(F.data.startswith(f"{CALENDAR_CALLBACK_PREFIX}_"))
-async def calendar_process(callback: types.CallbackQuery, state: FSMContext):
-    lang = await database.get_user_language(callback.from_user.id) or 'en'
+async def calendar_process(callback: types.CallbackQuery, state: FSMContext, user_ctx: UserContext):
+    lang = user_ctx.lang
     data = callback.data.split('_')
     action = data[1]
 
@@ -208,29 +309,39 @@ async def calendar_process(callback: types.CallbackQuery, state: FSMContext):
 
 # --- 5. Channel and Caption Handlers ---
 
-async def start_channel_selection(callback: types.CallbackQuery, state: FSMContext, bot: Bot):
-    # This function is now a reusable entry point for channel selection
-    user_id = callback.from_user.id
-    lang = await database.get_user_language(user_id) or 'en'
-    db_channels = await database.get_user_channels(user_id)
-    
-    # Get channels with premium status and post counts
+async def get_channels_info(user_ctx: UserContext) -> list:
+    """
+    Builds the channel selection list with titles, premium status and post
+    counts from cached channel metadata. Channels without a cached title, e.g.
+    never fetched or get_chat last failed, are listed by ID; never fetched ones
+    are fetched in the background.
+    """
     all_channels_info = []
-    for c in db_channels:
-        try:
-            channel_id = c[0]
-            chat = await bot.get_chat(channel_id)
-            is_premium = await database.is_channel_premium(channel_id, user_id)
-            posts_count = await database.get_channel_post_count_this_month(channel_id, user_id)
-            
-            all_channels_info.append({
-                'id': channel_id, 
-                'title': chat.title,
-                'is_premium': is_premium,
-                'posts_count': posts_count
-            })
-        except Exception as e:
-            logging.error(f"Error getting channel info: {e}")
+    quotas = await user_ctx.get_channel_quotas()
+    channel_ids = [quota['channel_id'] for quota in quotas]
+    metas = await database.get_channel_meta(channel_ids)
+    # Posts to these are skipped at send time, so flag them here already
+    unhealthy = await database.get_unhealthy_channels(channel_ids)
+    for quota in quotas:
+        channel_id = quota['channel_id']
+        meta = metas.get(channel_id)
+        if meta is None:
+            channel_meta_refresher.request([channel_id])
+        title = meta.title if meta and meta.title else f"ID: {channel_id}"
+        all_channels_info.append({
+            'id': channel_id,
+            'title': f"⚠️ {title}" if channel_id in unhealthy else title,
+            'is_premium': quota['is_premium'],
+            'posts_count': quota['posts_this_month'],
+            'remaining': quota['remaining']
+        })
+    return all_channels_info
+
+async def start_channel_selection(callback: types.CallbackQuery, state: FSMContext, bot: Bot, user_ctx: UserContext):
+    # This function is now a reusable entry point for channel selection
+    user_id = user_ctx.user_id
+    lang = user_ctx.lang
+    all_channels_info = await get_channels_info(user_ctx)
 
     await state.update_data(all_channels=all_channels_info)
     await state.set_state(Form.selecting_channels)
@@ -247,9 +358,9 @@ async def start_channel_selection(callback: types.CallbackQuery, state: FSMConte
 
 
 @router.callback_query(Form.selecting_channels, F.data.startswith("select_channel_"))
-async def select_channel_handler(callback: types.CallbackQuery, state: FSMContext):
+async def select_channel_handler(callback: types.CallbackQuery, state: FSMContext, user_ctx: UserContext):
     channel_id = int(callback.data.split("_")[2])
-    lang = await database.get_user_language(callback.from_user.id) or 'en'
+    lang = user_ctx.lang
     data = await state.get_data()
     selected = data.get('selected_channels', [])
     
@@ -272,15 +383,15 @@ async def select_channel_handler(callback: types.CallbackQuery, state: FSMContex
     await callback.message.edit_reply_markup(reply_markup=get_channel_selection_keyboard(lang, data['all_channels'], selected))
 
 @router.callback_query(Form.selecting_channels, F.data == "confirm_channels")
-async def confirm_channels_handler(callback: types.CallbackQuery, state: FSMContext):
-    lang = await database.get_user_language(callback.from_user.id) or 'en'
+async def confirm_channels_handler(callback: types.CallbackQuery, state: FSMContext, user_ctx: UserContext):
+    lang = user_ctx.lang
     await state.set_state(None)
     await callback.message.edit_text(get_text('ask_for_caption_prompt', lang), reply_markup=get_caption_choice_keyboard(lang))
 
 @router.callback_query(F.data.startswith("add_caption_"))
-async def caption_choice_handler(callback: types.CallbackQuery, state: FSMContext, scheduler: AsyncIOScheduler, bot: Bot):
+async def caption_choice_handler(callback: types.CallbackQuery, state: FSMContext, scheduler: AsyncIOScheduler, bot: Bot, user_ctx: UserContext):
     choice = callback.data.split("_")[2]
-    lang = await database.get_user_language(callback.from_user.id) or 'en'
+    lang = user_ctx.lang
     logging.info(f"Caption choice handler called for user {callback.from_user.id}, choice: {choice}")
     if choice == "yes":
         await state.set_state(Form.waiting_for_caption)
@@ -289,14 +400,27 @@ async def caption_choice_handler(callback: types.CallbackQuery, state: FSMContex
     else:
         logging.info(f"No caption selected, sending immediately for user {callback.from_user.id}")
         await callback.message.edit_text("در حال پردازش...")
-        await send_final_post(callback.from_user.id, state, bot, scheduler)
+        await send_final_post(user_ctx, state, bot, scheduler, callback.message)
 
 # --- 6. Final Sending/Scheduling Logic ---
 
-async def send_final_post(user_id: int, state: FSMContext, bot: Bot, scheduler: AsyncIOScheduler):
+async def _show_status(bot: Bot, user_id: int, status: Optional[types.Message], text: str):
+    """Replaces the "processing" message with `text`, or sends it when there is none to edit."""
+    try:
+        if status is not None:
+            await status.edit_text(text)
+            return
+    except Exception as e:
+        logging.warning(f"Could not update status message for user {user_id}: {e}")
+    await bot.send_message(user_id, text)
+
+async def send_final_post(user_ctx: UserContext, state: FSMContext, bot: Bot, scheduler: AsyncIOScheduler,
+                          status: Optional[types.Message] = None):
+    """Sends, schedules or saves the post; an immediate send turns `status`, the "processing" message, into its queued notice."""
+    user_id = user_ctx.user_id
+    lang = user_ctx.lang
     try:
         data = await state.get_data()
-        lang = await database.get_user_language(user_id) or 'en'
         
         # Debug log
         logging.info(f"📤 send_final_post called for user {user_id}, data keys: {list(data.keys())}")
@@ -309,44 +433,70 @@ async def send_final_post(user_id: int, state: FSMContext, bot: Bot, scheduler:
     post_chat_id = data['post_chat_id']
     target_channels = data['selected_channels']
     caption = data.get('caption')
-    footer = await database.get_user_footer(user_id)
+    footer = user_ctx.footer
 
     final_caption = f"{caption}\n\n{footer}" if caption and footer else caption or footer or ""
 
-    if is_scheduled:
+    if data.get('album'):
+        # Saved under the post's first message, where the outbox looks for it however the post is sent
+        try:
+            await database.save_album(post_chat_id, post_message_id, [database.AlbumItem(*item) for item in data['album']])
+        except Exception as e:
+            logging.error(f"❌ Failed to save album for user {user_id}: {e}")
+            error_msg = "❌ خطا در ثبت آلبوم" if lang == 'fa' else "❌ Error saving the album"
+            await bot.send_message(user_id, error_msg)
+            await state.clear()
+            return
+
+    recurrence = data.get('recurrence')
+    if recurrence and 'time_of_day' in recurrence:
+        # One rule row however often it repeats; the recurring dispatcher fires and advances it
+        weekdays = format_weekdays(recurrence['weekdays']) or None
+        try:
+            rule_id = str(uuid.uuid4())
+            next_fire_utc = next_occurrence(recurrence['kind'], recurrence['time_of_day'], weekdays,
+                                            recurrence['month_day'], datetime.datetime.now(datetime.timezone.utc))
+            await database.add_recurring_post(
+                rule_id, user_id, post_chat_id, post_message_id, target_channels, final_caption,
+                recurrence['kind'], recurrence['time_of_day'], weekdays, recurrence['month_day'], next_fire_utc.isoformat()
+            )
+            recurring_dispatcher.wake()
+            logging.info(f"🔁 Saved recurring post {rule_id} for user {user_id}: {recurrence}")
+        except Exception as e:
+            logging.error(f"❌ Failed to save recurring post for user {user_id}: {e}")
+            error_msg = "❌ خطا در ثبت پست تکراری" if lang == 'fa' else "❌ Error saving the recurring post"
+            await bot.send_message(user_id, error_msg)
+            await state.clear()
+            return
+
+        jalali_time = jdatetime.datetime.fromgregorian(datetime=next_fire_utc.astimezone(timezone('Asia/Tehran')))
+        await bot.send_message(user_id, get_text('recurring_success', lang).format(
+            rule=describe(recurrence['kind'], recurrence['time_of_day'], weekdays, recurrence['month_day'], lang),
+            date=jalali_time.strftime('%Y/%m/%d'),
+            time=jalali_time.strftime('%H:%M'),
+            count=len(target_channels)
+        ))
+    elif is_scheduled:
         scheduled_time_utc = data['scheduled_datetime_utc']
-        scheduled_jobs = 0
-        
-        logging.info(f"🕒 Scheduling posts for {len(target_channels)} channels at {scheduled_time_utc}")
-        
-        for channel_id in target_channels:
-            try:
-                job_id = str(uuid.uuid4())
-                
-                # Add job to scheduler
-                scheduler.add_job(
-                    send_scheduled_post,
-                    trigger='date',
-                    run_date=scheduled_time_utc,
-                    args=[job_id, bot],
-                    id=job_id,
-                    misfire_grace_time=3600,  # Allow to run up to 1h late
-                    max_instances=1  # Prevent duplicate execution
-                )
-                
-                # Add to database
-                await database.add_scheduled_post(
-                    job_id, user_id, post_chat_id, post_message_id, 
-                    channel_id, final_caption, scheduled_time_utc.isoformat()
-                )
-                
-                scheduled_jobs += 1
-                logging.info(f"✅ Scheduled job {job_id} for channel {channel_id}")
-                
-            except Exception as e:
-                logging.error(f"❌ Failed to schedule job for channel {channel_id}: {e}")
-
-        if scheduled_jobs > 0:
+        scheduled_channels = 0
+
+        logging.info(f"🕒 Scheduling post for {len(target_channels)} channels at {scheduled_time_utc}")
+
+        # One job fires the post for all target channels, moved off the exact second when that is crowded
+        try:
+            job_id = str(uuid.uuid4())
+            fire_time_utc = await pick_fire_time(scheduled_time_utc, target_channels)
+            await database.add_scheduled_batch(
+                job_id, user_id, post_chat_id, post_message_id,
+                target_channels, final_caption, fire_time_utc.isoformat()
+            )
+            schedule_post_job(scheduler, job_id, fire_time_utc, bot)
+            scheduled_channels = len(target_channels)
+            logging.info(f"✅ Scheduled job {job_id} for {scheduled_channels} channels")
+        except Exception as e:
+            logging.error(f"❌ Failed to schedule post for user {user_id}: {e}")
+
+        if scheduled_channels > 0:
             jalali_time = jdatetime.datetime.fromgregorian(
                 datetime=data['scheduled_datetime_utc'].astimezone(timezone('Asia/Tehran'))
             )
@@ -354,44 +504,30 @@ async def send_final_post(user_id: int, state: FSMContext, bot: Bot, scheduler:
                 date=jalali_time.strftime('%Y/%m/%d'), 
                 time=jalali_time.strftime('%H:%M')
             )
-            success_msg += f"\n📊 تعداد کانال‌های زمان‌بندی شده: {scheduled_jobs}" if lang == 'fa' else f"\n📊 Scheduled channels: {scheduled_jobs}"
+            success_msg += f"\n📊 تعداد کانال‌های زمان‌بندی شده: {scheduled_channels}" if lang == 'fa' else f"\n📊 Scheduled channels: {scheduled_channels}"
+            delay = int((fire_time_utc - scheduled_time_utc).total_seconds())
+            if delay > 0:
+                success_msg += "\n" + get_text('schedule_smoothed', lang).format(seconds=delay)
             await bot.send_message(user_id, success_msg)
-            logging.info(f"✅ Successfully scheduled {scheduled_jobs} posts for user {user_id}")
+            logging.info(f"✅ Successfully scheduled a post to {scheduled_channels} channels for user {user_id}")
         else:
             error_msg = "❌ خطا در زمان‌بندی پست‌ها" if lang == 'fa' else "❌ Error scheduling posts"
             await bot.send_message(user_id, error_msg)
             logging.error(f"❌ Failed to schedule any posts for user {user_id}")
     else:
-        logging.info(f"🚀 Starting immediate broadcast for user {user_id} to {len(target_channels)} channels")
-        sent_count = 0
-        for channel_id in target_channels:
-            try:
-                logging.info(f"📤 Sending to channel {channel_id}")
-                await bot.copy_message(
-                    chat_id=channel_id, 
-                    from_chat_id=post_chat_id, 
-                    message_id=post_message_id, 
-                    caption=final_caption or None, 
-                    parse_mode="HTML"
-                )
-                sent_count += 1
-                logging.info(f"✅ Successfully sent to channel {channel_id}")
-                
-                # Increment channel post count (channel-based system)
-                try:
-                    await database.increment_channel_post_count(channel_id, user_id)
-                except Exception as e:
-                    logging.error(f"Error incrementing channel post count for {channel_id}: {e}")
-                    
-            except Exception as e:
-                logging.error(f"❌ Failed to send to channel {channel_id}: {e}")
-        
-        # Also increment user's post count for backward compatibility
-        if sent_count > 0:
-            await database.increment_user_post_count(user_id)
-            
-        logging.info(f"✅ Broadcast completed. Sent to {sent_count} channels")
-        await bot.send_message(user_id, get_text('broadcast_success', lang).format(count=sent_count))
+        # Deliveries go through the durable outbox; the worker reports back once all channels are done
+        batch_id = str(uuid.uuid4())
+        try:
+            queued = await database.enqueue_outbox(batch_id, user_id, post_chat_id, post_message_id, target_channels, final_caption)
+        except Exception as e:
+            logging.error(f"❌ Failed to queue post for user {user_id}: {e}")
+            await _show_status(bot, user_id, status, "❌ خطا در ثبت ارسال" if lang == 'fa' else "❌ Error queueing the post")
+            await state.clear()
+            return
+        outbox_worker.wake()
+        logging.info(f"📮 Queued batch {batch_id} for user {user_id}: {queued} channels")
+        # The delivery report can take minutes for large batches or retries
+        await _show_status(bot, user_id, status, get_text('broadcast_queued', lang).format(count=queued))
 
     await state.clear()
 
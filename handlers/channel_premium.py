@@ -4,6 +4,7 @@ from aiogram.fsm.context import FSMContext
 from datetime import timedelta
 
 import database
+from middlewares.user_context import UserContext
 from texts import get_text
 from states import Form
 from keyboards import (
@@ -12,40 +13,38 @@ from keyboards import (
     get_payment_requests_keyboard,
     get_payment_approval_keyboard
 )
+from utils.channel_meta import channel_meta_refresher
 from config import PAYMENT_CARD_NUMBER, PAYMENT_CARD_HOLDER, PAYMENT_PRICES, DEVELOPER_ID
 
 router = Router()
 
 # --- Channel Premium Purchase Flow ---
 
+def _channel_labels(channel_id: int, metas: dict) -> tuple:
+    """Title and @username (or ID) of a channel from its cached metadata."""
+    meta = metas.get(channel_id)
+    title = meta.title if meta and meta.title else f"کانال {channel_id}"
+    identifier = f"@{meta.username}" if meta and meta.username else f"ID: {channel_id}"
+    return title, identifier
+
 @router.message(F.text.in_([get_text('upgrade_premium_button', 'fa'), get_text('upgrade_premium_button', 'en')]))
-async def show_channel_premium_info(message: types.Message, bot: Bot):
+async def show_channel_premium_info(message: types.Message, user_ctx: UserContext):
     """Shows channel premium information and selection."""
-    user_id = message.from_user.id
-    lang = await database.get_user_language(user_id) or 'en'
+    lang = user_ctx.lang
     
     try:
-        # Get user channels with premium status
-        channels_info = await database.get_user_channels_with_premium_status(user_id)
+        # Get user channels with premium status and quota in one query
+        channels_info = await user_ctx.get_channel_quotas()
         
         if not channels_info:
             await message.answer(get_text('error_no_channels_for_broadcast', lang))
             return
         
         # Add channel titles and usernames
+        metas = await database.get_channel_meta([channel_info['channel_id'] for channel_info in channels_info])
         for channel_info in channels_info:
-            try:
-                chat = await bot.get_chat(channel_info['channel_id'])
-                channel_info['title'] = chat.title
-                # Add username if available
-                if hasattr(chat, 'username') and chat.username:
-                    channel_info['username'] = f"@{chat.username}"
-                else:
-                    channel_info['username'] = f"ID: {channel_info['channel_id']}"
-            except Exception as e:
-                logging.error(f"Error getting chat info: {e}")
-                channel_info['title'] = f"کانال {channel_info['channel_id']}"
-                channel_info['username'] = f"ID: {channel_info['channel_id']}"
+            channel_info['title'], channel_info['username'] = _channel_labels(channel_info['channel_id'], metas)
+        channel_meta_refresher.request(info['channel_id'] for info in channels_info if info['channel_id'] not in metas)
         
         text = get_text('channel_premium_info', lang)
         await message.answer(
@@ -58,10 +57,10 @@ async def show_channel_premium_info(message: types.Message, bot: Bot):
         await message.answer(get_text('error_occurred', lang))
 
 @router.callback_query(F.data.startswith("upgrade_channel_"))
-async def select_channel_for_premium(callback: types.CallbackQuery, state: FSMContext, bot: Bot):
+async def select_channel_for_premium(callback: types.CallbackQuery, state: FSMContext, user_ctx: UserContext):
     """Handle channel selection for premium upgrade."""
     user_id = callback.from_user.id
-    lang = await database.get_user_language(user_id) or 'en'
+    lang = user_ctx.lang
     
     try:
         channel_id = int(callback.data.split("_")[2])
@@ -72,12 +71,7 @@ async def select_channel_for_premium(callback: types.CallbackQuery, state: FSMCo
             return
         
         # Get channel info with username
-        chat = await bot.get_chat(channel_id)
-        channel_title = chat.title
-        if hasattr(chat, 'username') and chat.username:
-            channel_identifier = f"@{chat.username}"
-        else:
-            channel_identifier = f"ID: {channel_id}"
+        channel_title, channel_identifier = _channel_labels(channel_id, await database.get_channel_meta([channel_id]))
         
         # Store channel info in state
         await state.update_data(
@@ -96,10 +90,10 @@ async def select_channel_for_premium(callback: types.CallbackQuery, state: FSMCo
         await callback.answer(get_text('error_occurred', lang), show_alert=True)
 
 @router.callback_query(F.data.startswith("buy_premium_"))
-async def process_premium_purchase(callback: types.CallbackQuery, state: FSMContext):
+async def process_premium_purchase(callback: types.CallbackQuery, state: FSMContext, user_ctx: UserContext):
     """Process premium purchase request."""
     user_id = callback.from_user.id
-    lang = await database.get_user_language(user_id) or 'en'
+    lang = user_ctx.lang
     
     try:
         duration_months = int(callback.data.split("_")[2])
@@ -144,16 +138,16 @@ async def process_premium_purchase(callback: types.CallbackQuery, state: FSMCont
         await callback.answer(get_text('error_occurred', lang), show_alert=True)
 
 @router.callback_query(F.data == "back_to_channel_selection")
-async def back_to_channel_selection(callback: types.CallbackQuery, state: FSMContext, bot: Bot):
+async def back_to_channel_selection(callback: types.CallbackQuery, state: FSMContext, user_ctx: UserContext):
     """Go back to channel selection."""
     await state.clear()
-    await show_channel_premium_info(callback.message, bot)
+    # callback.message was sent by the bot, so the user has to come from the context
+    await show_channel_premium_info(callback.message, user_ctx)
 
 @router.message(Form.waiting_for_payment_receipt, F.photo)
-async def process_payment_receipt(message: types.Message, state: FSMContext, bot: Bot):
+async def process_payment_receipt(message: types.Message, state: FSMContext, bot: Bot, user_ctx: UserContext):
     """Process payment receipt photo."""
-    user_id = message.from_user.id
-    lang = await database.get_user_language(user_id) or 'en'
+    lang = user_ctx.lang
     
     try:
         data = await state.get_data()
@@ -183,9 +177,9 @@ async def process_payment_receipt(message: types.Message, state: FSMContext, bot
         await message.answer(get_text('error_occurred', lang))
 
 @router.message(Form.waiting_for_payment_receipt)
-async def invalid_receipt_handler(message: types.Message, state: FSMContext):
+async def invalid_receipt_handler(message: types.Message, state: FSMContext, user_ctx: UserContext):
     """Handle invalid receipt (non-photo)."""
-    lang = await database.get_user_language(message.from_user.id) or 'en'
+    lang = user_ctx.lang
     await message.answer(get_text('invalid_receipt', lang))
 
 async def send_receipt_to_developer(bot: Bot, payment_request: dict, receipt_message: types.Message):
@@ -230,13 +224,12 @@ async def send_receipt_to_developer(bot: Bot, payment_request: dict, receipt_mes
 # --- Developer Payment Management ---
 
 @router.message(F.text.in_([get_text('manage_payments_button', 'fa'), get_text('manage_payments_button', 'en')]))
-async def show_payment_requests(message: types.Message):
+async def show_payment_requests(message: types.Message, user_ctx: UserContext):
     """Show pending payment requests for developer."""
-    user_id = message.from_user.id
-    if user_id != DEVELOPER_ID:
+    if not user_ctx.is_developer:
         return
     
-    lang = await database.get_user_language(user_id) or 'en'
+    lang = user_ctx.lang
     
     try:
         requests = await database.get_pending_payment_requests()
@@ -255,9 +248,9 @@ async def show_payment_requests(message: types.Message):
         await message.answer(get_text('error_occurred', lang))
 
 @router.callback_query(F.data.startswith("view_payment_"))
-async def view_payment_details(callback: types.CallbackQuery):
+async def view_payment_details(callback: types.CallbackQuery, user_ctx: UserContext):
     """View payment request details."""
-    if callback.from_user.id != DEVELOPER_ID:
+    if not user_ctx.is_developer:
         await callback.answer("❌ Access denied", show_alert=True)
         return
     
@@ -292,9 +285,9 @@ async def view_payment_details(callback: types.CallbackQuery):
         await callback.answer("❌ خطا در نمایش جزئیات", show_alert=True)
 
 @router.callback_query(F.data.startswith("approve_payment_"))
-async def approve_payment(callback: types.CallbackQuery, bot: Bot):
+async def approve_payment(callback: types.CallbackQuery, bot: Bot, user_ctx: UserContext):
     """Approve payment request."""
-    if callback.from_user.id != DEVELOPER_ID:
+    if not user_ctx.is_developer:
         await callback.answer("❌ Access denied", show_alert=True)
         return
     
@@ -333,9 +326,9 @@ async def approve_payment(callback: types.CallbackQuery, bot: Bot):
         await callback.answer("❌ خطا در تایید پرداخت", show_alert=True)
 
 @router.callback_query(F.data.startswith("reject_payment_"))
-async def reject_payment(callback: types.CallbackQuery, bot: Bot):
+async def reject_payment(callback: types.CallbackQuery, bot: Bot, user_ctx: UserContext):
     """Reject payment request."""
-    if callback.from_user.id != DEVELOPER_ID:
+    if not user_ctx.is_developer:
         await callback.answer("❌ Access denied", show_alert=True)
         return
     
@@ -366,9 +359,9 @@ async def reject_payment(callback: types.CallbackQuery, bot: Bot):
         await callback.answer("❌ خطا در رد پرداخت", show_alert=True)
 
 @router.callback_query(F.data == "back_to_payments")
-async def back_to_payments(callback: types.CallbackQuery):
+async def back_to_payments(callback: types.CallbackQuery, user_ctx: UserContext):
     """Go back to payment requests list."""
-    if callback.from_user.id != DEVELOPER_ID:
+    if not user_ctx.is_developer:
         await callback.answer("❌ Access denied", show_alert=True)
         return
     
@@ -5,33 +5,36 @@ from aiogram.exceptions import TelegramBadRequest
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
 import database
+from middlewares.user_context import UserContext
 from texts import get_text
 from states import Form
 from keyboards import get_channels_menu_keyboard, get_channel_detail_keyboard, get_confirm_remove_keyboard
+from utils.channel_meta import channel_meta_refresher
+from utils.channel_health import classify_member, recheck_unhealthy
 
 # All handlers for this module are registered on a separate router
 router = Router()
 
 
 @router.message(F.text.in_([get_text('manage_channels_button', 'fa'), get_text('manage_channels_button', 'en')]))
-async def show_channels_menu(message: types.Message):
+async def show_channels_menu(message: types.Message, user_ctx: UserContext):
     """Shows the channel management inline menu."""
-    lang = await database.get_user_language(message.from_user.id) or 'en'
+    lang = user_ctx.lang
     await message.answer(get_text('channels_menu_title', lang), reply_markup=get_channels_menu_keyboard(lang))
 
 @router.callback_query(F.data == "add_channel")
-async def prompt_for_channel_forward(callback: types.CallbackQuery, state: FSMContext):
+async def prompt_for_channel_forward(callback: types.CallbackQuery, state: FSMContext, user_ctx: UserContext):
     """Prompts the user to forward a message to register a channel."""
-    lang = await database.get_user_language(callback.from_user.id) or 'en'
+    lang = user_ctx.lang
     await state.set_state(Form.waiting_for_channel_forward)
     await callback.message.edit_text(get_text('add_channel_prompt', lang))
     await callback.answer()
 
 @router.message(Form.waiting_for_channel_forward, F.forward_from_chat)
-async def process_channel_forward(message: types.Message, state: FSMContext, bot: Bot):
+async def process_channel_forward(message: types.Message, state: FSMContext, bot: Bot, user_ctx: UserContext):
     """Processes the forwarded message to register the channel."""
     user_id = message.from_user.id
-    lang = await database.get_user_language(user_id) or 'en'
+    lang = user_ctx.lang
 
     try:
         if message.forward_from_chat.type != 'channel':
@@ -61,6 +64,9 @@ async def process_channel_forward(message: types.Message, state: FSMContext, bot
             return
 
         await database.add_channel(channel_id, user_id)
+        chat = message.forward_from_chat
+        await database.save_channel_meta(channel_id, chat.title, chat.username, chat.type)
+        await database.save_channel_health_batch([(channel_id, classify_member(bot_member), None)])
         await message.answer(get_text('channel_added_success', lang))
 
     except TelegramBadRequest as e:
@@ -73,17 +79,17 @@ async def process_channel_forward(message: types.Message, state: FSMContext, bot
         await state.clear()
 
 @router.message(Form.waiting_for_channel_forward)
-async def invalid_channel_forward(message: types.Message, state: FSMContext):
+async def invalid_channel_forward(message: types.Message, state: FSMContext, user_ctx: UserContext):
     """Handles invalid forwards (not from channel)."""
-    lang = await database.get_user_language(message.from_user.id) or 'en'
+    lang = user_ctx.lang
     await message.answer(get_text('invalid_message_type', lang))
     await state.clear()
 
 @router.callback_query(F.data == "my_channels")
-async def list_my_channels(callback: types.CallbackQuery, bot: Bot):
+async def list_my_channels(callback: types.CallbackQuery, user_ctx: UserContext):
     """Lists all channels registered by the user with clickable buttons."""
     user_id = callback.from_user.id
-    lang = await database.get_user_language(user_id) or 'en'
+    lang = user_ctx.lang
     channels = await database.get_user_channels(user_id)
 
     if not channels:
@@ -93,45 +99,54 @@ async def list_my_channels(callback: types.CallbackQuery, bot: Bot):
 
     builder = InlineKeyboardBuilder()
     response_text = f"<b>{get_text('your_channels_list', lang)}</b>\n\n"
+    metas = await database.get_channel_meta([channel[0] for channel in channels])
     
     for i, channel in enumerate(channels, 1):
-        try:
-            chat = await bot.get_chat(channel[0])
-            response_text += f"{i}. {chat.title}\n"
+        meta = metas.get(channel[0])
+        if meta and meta.title:
+            response_text += f"{i}. {meta.title}\n"
             builder.row(types.InlineKeyboardButton(
-                text=f"📢 {chat.title}", 
+                text=f"📢 {meta.title}", 
                 callback_data=f"channel_detail_{channel[0]}"
             ))
-        except Exception:
+        else:
             response_text += f"{i}. Unknown Channel (ID: {channel[0]})\n"
             builder.row(types.InlineKeyboardButton(
                 text=f"❓ Unknown Channel", 
                 callback_data=f"channel_detail_{channel[0]}"
             ))
 
+    # Titles never fetched yet are looked up in the background for the next render
+    channel_meta_refresher.request(channel[0] for channel in channels if channel[0] not in metas)
+
     await callback.message.edit_text(response_text, reply_markup=builder.as_markup(), parse_mode="HTML")
     await callback.answer()
 
 @router.callback_query(F.data.startswith("channel_detail_"))
-async def show_channel_detail(callback: types.CallbackQuery, bot: Bot):
+async def show_channel_detail(callback: types.CallbackQuery, bot: Bot, user_ctx: UserContext):
     """Shows channel details with remove option."""
     channel_id = int(callback.data.split("_")[2])
-    user_id = callback.from_user.id
-    lang = await database.get_user_language(user_id) or 'en'
+    lang = user_ctx.lang
 
-    try:
-        chat = await bot.get_chat(channel_id)
-        text = f"📢 <b>{chat.title}</b>\n\n"
+    meta = (await database.get_channel_meta([channel_id])).get(channel_id)
+    if meta and meta.title:
+        text = f"📢 <b>{meta.title}</b>\n\n"
         text += f"🆔 ID: <code>{channel_id}</code>\n"
-        if chat.username:
-            text += f"🔗 @{chat.username}\n"
+        if meta.username:
+            text += f"🔗 @{meta.username}\n"
+        # The owner may just have fixed the bot's rights, so a warning is confirmed first
+        unhealthy = await database.get_unhealthy_channels([channel_id])
+        if unhealthy and await recheck_unhealthy(bot, unhealthy):
+            text += f"\n{get_text('channel_health_warning', lang)}\n"
         
         await callback.message.edit_text(
             text, 
             reply_markup=get_channel_detail_keyboard(lang, channel_id),
             parse_mode="HTML"
         )
-    except Exception:
+    else:
+        if meta is None:
+            channel_meta_refresher.request([channel_id])
         text = f"❓ <b>Unknown Channel</b>\n\n"
         text += f"🆔 ID: <code>{channel_id}</code>\n"
         await callback.message.edit_text(
@@ -143,17 +158,13 @@ async def show_channel_detail(callback: types.CallbackQuery, bot: Bot):
     await callback.answer()
 
 @router.callback_query(F.data.startswith("remove_channel_"))
-async def confirm_remove_channel(callback: types.CallbackQuery, bot: Bot):
+async def confirm_remove_channel(callback: types.CallbackQuery, user_ctx: UserContext):
     """Asks for confirmation before removing channel."""
     channel_id = int(callback.data.split("_")[2])
-    user_id = callback.from_user.id
-    lang = await database.get_user_language(user_id) or 'en'
+    lang = user_ctx.lang
 
-    try:
-        chat = await bot.get_chat(channel_id)
-        channel_title = chat.title
-    except Exception:
-        channel_title = f"Unknown Channel (ID: {channel_id})"
+    meta = (await database.get_channel_meta([channel_id])).get(channel_id)
+    channel_title = meta.title if meta and meta.title else f"Unknown Channel (ID: {channel_id})"
 
     text = get_text('confirm_remove_channel', lang).format(channel_title=channel_title)
     await callback.message.edit_text(
@@ -164,11 +175,11 @@ async def confirm_remove_channel(callback: types.CallbackQuery, bot: Bot):
     await callback.answer()
 
 @router.callback_query(F.data.startswith("confirm_remove_"))
-async def remove_channel(callback: types.CallbackQuery):
+async def remove_channel(callback: types.CallbackQuery, user_ctx: UserContext):
     """Removes the channel from user's list."""
     channel_id = int(callback.data.split("_")[2])
     user_id = callback.from_user.id
-    lang = await database.get_user_language(user_id) or 'en'
+    lang = user_ctx.lang
 
     try:
         await database.remove_channel(channel_id, user_id)
@@ -180,8 +191,8 @@ async def remove_channel(callback: types.CallbackQuery):
     await callback.answer()
 
 @router.callback_query(F.data == "cancel_remove")
-async def cancel_remove_channel(callback: types.CallbackQuery):
+async def cancel_remove_channel(callback: types.CallbackQuery, user_ctx: UserContext):
     """Cancels channel removal."""
-    lang = await database.get_user_language(callback.from_user.id) or 'en'
+    lang = user_ctx.lang
     await callback.message.edit_text(get_text('operation_cancelled', lang))
     await callback.answer()
@@ -0,0 +1,70 @@
+import html
+import logging
+import uuid
+from aiogram import Router, F, types
+
+import database
+from middlewares.user_context import UserContext
+from texts import get_text
+from keyboards import get_dead_letters_keyboard
+from config import DEVELOPER_ID
+from utils.outbox import outbox_worker
+
+router = Router()
+
+
+async def render_dead_letters(lang: str):
+    """Builds the dead letter report: counts per error class and the latest failures."""
+    summary = await database.get_dead_letter_summary()
+    if not summary:
+        return "✅ هیچ ارسال ناموفقی در صف وجود ندارد.", None
+
+    text = "☠️ <b>ارسال‌های ناموفق</b>\n\n"
+    for row in summary:
+        kind = "دائمی" if row['error_kind'] == 'permanent' else "موقت"
+        last_failed = database.format_persian_date(row['last_failed_at'] + '+00:00')  # stored as UTC
+        text += f"├── {row['error_class']} ({kind}): {row['count']} — آخرین: {last_failed}\n"
+
+    text += "\n🕒 <b>آخرین موارد:</b>\n"
+    for letter in await database.get_dead_letters(limit=10):
+        text += f"├── کانال {letter['target_channel_id']} (کاربر {letter['user_id']}), {letter['attempts']} تلاش\n"
+        # Error texts quote Telegram and may contain <, > or &
+        text += f"│   {html.escape((letter['last_error'] or letter['error_class'])[:120])}\n"
+    return text, get_dead_letters_keyboard(lang, summary)
+
+
+@router.message(F.text.in_([get_text('dead_letters_button', 'fa'), get_text('dead_letters_button', 'en')]))
+async def show_dead_letters(message: types.Message, user_ctx: UserContext):
+    """Lists deliveries that ran out of attempts, grouped by error class, for the developer."""
+    if not user_ctx.is_developer:
+        return
+
+    try:
+        text, keyboard = await render_dead_letters(user_ctx.lang)
+        await message.answer(text, reply_markup=keyboard)
+    except Exception as e:
+        logging.error(f"Error showing dead letters: {e}")
+        await message.answer(f"❌ خطا: {html.escape(str(e))}")
+
+@router.callback_query(F.from_user.id == DEVELOPER_ID, F.data.startswith("dlq_"))
+async def dead_letter_action(callback: types.CallbackQuery, user_ctx: UserContext):
+    """Retries dead letters (one error class or all) through the outbox, or purges them."""
+    action, _, target = callback.data[len("dlq_"):].partition('_')
+    error_class = None if target == 'all' else target
+
+    try:
+        if action == 'retry':
+            requeued = await database.retry_dead_letters(uuid.uuid4().hex[:8], error_class)
+            outbox_worker.wake()
+            logging.info(f"🔁 Developer requeued {requeued} dead letters ({target})")
+            await callback.answer(f"🔁 {requeued} ارسال دوباره در صف قرار گرفت.")
+        elif action == 'purge':
+            purged = await database.purge_dead_letters(error_class)
+            logging.info(f"🗑️ Developer purged {purged} dead letters ({target})")
+            await callback.answer(f"🗑 {purged} مورد حذف شد.")
+
+        text, keyboard = await render_dead_letters(user_ctx.lang)
+        await callback.message.edit_text(text, reply_markup=keyboard)
+    except Exception as e:
+        logging.error(f"Error handling dead letter action {callback.data}: {e}")
+        await callback.answer(f"❌ خطا: {e}", show_alert=True)
@@ -2,9 +2,9 @@ from aiogram import Router, F, types
 from aiogram.filters import CommandStart, Command
 
 import database
+from middlewares.user_context import UserContext
 from texts import get_text
 from keyboards import get_language_keyboard, get_main_menu_keyboard, get_developer_menu_keyboard
-from config import DEVELOPER_ID
 
 # All handlers for this module are registered on a separate router
 router = Router()
@@ -19,18 +19,17 @@ async def send_welcome(message: types.Message):
     )
 
 @router.message(Command("menu"))
-async def show_menu(message: types.Message):
+async def show_menu(message: types.Message, user_ctx: UserContext):
     """Handler for the /menu command. Shows the main menu."""
-    user_id = message.from_user.id
-    lang = await database.get_user_language(user_id) or 'en'
+    lang = user_ctx.lang
     
-    if user_id == DEVELOPER_ID:
+    if user_ctx.is_developer:
         await message.answer(get_text('developer_menu', lang), reply_markup=get_developer_menu_keyboard(lang))
     else:
         await message.answer(get_text('main_menu', lang), reply_markup=get_main_menu_keyboard(lang))
 
 @router.callback_query(F.data.startswith("lang_"))
-async def process_language_selection(callback: types.CallbackQuery):
+async def process_language_selection(callback: types.CallbackQuery, user_ctx: UserContext):
     """Handles language selection, saves it to DB, and shows the main menu."""
     lang = callback.data.split("_")[1]
     user_id = callback.from_user.id
@@ -41,7 +40,7 @@ async def process_language_selection(callback: types.CallbackQuery):
     await callback.message.edit_text(get_text('lang_selected', lang))
     
     # Show appropriate menu based on user type
-    if user_id == DEVELOPER_ID:
+    if user_ctx.is_developer:
         await callback.message.answer(get_text('developer_menu', lang), reply_markup=get_developer_menu_keyboard(lang))
     else:
         await callback.message.answer(get_text('main_menu', lang), reply_markup=get_main_menu_keyboard(lang))
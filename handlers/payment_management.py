@@ -3,19 +3,19 @@ from aiogram import Router, F, types
 from aiogram.fsm.context import FSMContext
 
 import database
+from middlewares.user_context import UserContext
 from texts import get_text
 from config import DEVELOPER_ID
 
 router = Router()
 
 @router.message(F.text.in_([get_text('manage_payments_button', 'fa'), get_text('manage_payments_button', 'en')]))
-async def show_all_payment_requests(message: types.Message):
+async def show_all_payment_requests(message: types.Message, user_ctx: UserContext):
     """Show all payment requests with Persian dates for developer."""
-    user_id = message.from_user.id
-    if user_id != DEVELOPER_ID:
+    if not user_ctx.is_developer:
         return
     
-    lang = await database.get_user_language(user_id) or 'en'
+    lang = user_ctx.lang
     
     try:
         # Get all payment requests (not just pending)
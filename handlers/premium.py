@@ -4,6 +4,12 @@ from aiogram.fsm.context import FSMContext
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
 import database
+from middlewares.user_context import UserContext, user_context_middleware
+from utils.ratelimit import rate_limiter
+from utils.retry import retry_middleware
+from utils.outbox import outbox_worker
+from utils import metrics
+from utils.channel_health import channel_health_auditor
 from texts import get_text
 from states import Form
 from keyboards import get_premium_management_keyboard, get_premium_duration_keyboard, get_user_management_keyboard
@@ -18,13 +24,12 @@ router = Router()
 # --- Developer Premium Management Menu ---
 
 @router.message(F.text.in_([get_text('developer_premium_management_button', 'fa'), get_text('developer_premium_management_button', 'en')]))
-async def show_premium_management_menu(message: types.Message):
+async def show_premium_management_menu(message: types.Message, user_ctx: UserContext):
     """Shows premium management menu for developer."""
-    user_id = message.from_user.id
-    if user_id != DEVELOPER_ID:
+    if not user_ctx.is_developer:
         return
         
-    lang = await database.get_user_language(user_id) or 'en'
+    lang = user_ctx.lang
     
     await message.answer(
         get_text('premium_management_menu', lang),
@@ -33,25 +38,25 @@ async def show_premium_management_menu(message: types.Message):
 
 
 @router.callback_query(F.data == "set_premium")
-async def start_set_premium(callback: types.CallbackQuery, state: FSMContext):
+async def start_set_premium(callback: types.CallbackQuery, state: FSMContext, user_ctx: UserContext):
     """Start the process of setting a user as premium."""
-    if callback.from_user.id != DEVELOPER_ID:
+    if not user_ctx.is_developer:
         await callback.answer("❌ Access denied", show_alert=True)
         return
         
-    lang = await database.get_user_language(callback.from_user.id) or 'en'
+    lang = user_ctx.lang
     await state.set_state(Form.waiting_for_user_id_premium)
     
     await callback.message.edit_text(get_text('enter_user_id_for_premium', lang))
 
 
 @router.message(Form.waiting_for_user_id_premium, F.text)
-async def process_user_id_for_premium(message: types.Message, state: FSMContext):
+async def process_user_id_for_premium(message: types.Message, state: FSMContext, user_ctx: UserContext):
     """Process user ID for premium setting."""
-    if message.from_user.id != DEVELOPER_ID:
+    if not user_ctx.is_developer:
         return
         
-    lang = await database.get_user_language(message.from_user.id) or 'en'
+    lang = user_ctx.lang
     
     try:
         user_id = int(message.text.strip())
@@ -74,13 +79,13 @@ async def process_user_id_for_premium(message: types.Message, state: FSMContext)
 
 
 @router.callback_query(F.data.startswith("premium_days_"))
-async def process_premium_duration(callback: types.CallbackQuery, state: FSMContext):
+async def process_premium_duration(callback: types.CallbackQuery, state: FSMContext, user_ctx: UserContext):
     """Process premium duration selection."""
-    if callback.from_user.id != DEVELOPER_ID:
+    if not user_ctx.is_developer:
         await callback.answer("❌ Access denied", show_alert=True)
         return
         
-    lang = await database.get_user_language(callback.from_user.id) or 'en'
+    lang = user_ctx.lang
     data = await state.get_data()
     target_user_id = data.get('target_user_id')
     
@@ -105,12 +110,12 @@ async def process_premium_duration(callback: types.CallbackQuery, state: FSMCont
 
 
 @router.message(Form.waiting_for_custom_days, F.text)
-async def process_custom_days(message: types.Message, state: FSMContext):
+async def process_custom_days(message: types.Message, state: FSMContext, user_ctx: UserContext):
     """Process custom premium days."""
-    if message.from_user.id != DEVELOPER_ID:
+    if not user_ctx.is_developer:
         return
         
-    lang = await database.get_user_language(message.from_user.id) or 'en'
+    lang = user_ctx.lang
     data = await state.get_data()
     target_user_id = data.get('target_user_id')
     
@@ -159,25 +164,25 @@ async def set_user_premium_with_days(message, target_user_id: int, days: int, la
 
 
 @router.callback_query(F.data == "remove_premium")
-async def start_remove_premium(callback: types.CallbackQuery, state: FSMContext):
+async def start_remove_premium(callback: types.CallbackQuery, state: FSMContext, user_ctx: UserContext):
     """Start the process of removing premium from a user."""
-    if callback.from_user.id != DEVELOPER_ID:
+    if not user_ctx.is_developer:
         await callback.answer("❌ Access denied", show_alert=True)
         return
         
-    lang = await database.get_user_language(callback.from_user.id) or 'en'
+    lang = user_ctx.lang
     await state.set_state(Form.waiting_for_user_id_remove_premium)
     
     await callback.message.edit_text(get_text('enter_user_id_for_premium', lang))
 
 
 @router.message(Form.waiting_for_user_id_remove_premium, F.text)
-async def process_remove_premium(message: types.Message, state: FSMContext):
+async def process_remove_premium(message: types.Message, state: FSMContext, user_ctx: UserContext):
     """Process premium removal."""
-    if message.from_user.id != DEVELOPER_ID:
+    if not user_ctx.is_developer:
         return
         
-    lang = await database.get_user_language(message.from_user.id) or 'en'
+    lang = user_ctx.lang
     
     try:
         target_user_id = int(message.text.strip())
@@ -189,13 +194,7 @@ async def process_remove_premium(message: types.Message, state: FSMContext):
             return
         
         # Remove premium
-        await database.set_user_premium(target_user_id, None)
-        
-        # Also update is_premium to 0
-        import aiosqlite
-        async with aiosqlite.connect(database.DB_NAME) as db:
-            await db.execute('UPDATE users SET is_premium = 0 WHERE user_id = ?', (target_user_id,))
-            await db.commit()
+        await database.clear_user_premium(target_user_id)
             
         success_text = get_text('premium_removed_success', lang).format(user_id=target_user_id)
         await message.answer(success_text)
@@ -217,39 +216,39 @@ async def process_remove_premium(message: types.Message, state: FSMContext):
 
 
 @router.callback_query(F.data == "check_user_info")
-async def start_check_user_info(callback: types.CallbackQuery, state: FSMContext):
+async def start_check_user_info(callback: types.CallbackQuery, state: FSMContext, user_ctx: UserContext):
     """Start the process of checking user information."""
-    if callback.from_user.id != DEVELOPER_ID:
+    if not user_ctx.is_developer:
         await callback.answer("❌ Access denied", show_alert=True)
         return
         
-    lang = await database.get_user_language(callback.from_user.id) or 'en'
+    lang = user_ctx.lang
     await state.set_state(Form.waiting_for_user_id_info)
     
     await callback.message.edit_text(get_text('enter_user_id_for_premium', lang))
 
 
 @router.message(Form.waiting_for_user_id_info, F.text)
-async def process_user_info_check(message: types.Message, state: FSMContext):
+async def process_user_info_check(message: types.Message, state: FSMContext, user_ctx: UserContext):
     """Process user information check."""
-    if message.from_user.id != DEVELOPER_ID:
+    if not user_ctx.is_developer:
         return
         
-    lang = await database.get_user_language(message.from_user.id) or 'en'
+    lang = user_ctx.lang
     
     try:
         target_user_id = int(message.text.strip())
         
-        import aiosqlite
-        async with aiosqlite.connect(database.DB_NAME) as db:
+        async with database.get_db() as db:
             # Get user info
             cursor = await db.execute('''
                 SELECT u.user_id, u.language_code, u.is_premium, u.premium_until, u.created_at,
-                       s.posts_sent_this_month, s.total_posts_sent
+                       uc.count, s.total_posts_sent
                 FROM users u
                 LEFT JOIN user_stats s ON u.user_id = s.user_id
+                LEFT JOIN usage_counters uc ON uc.scope = ? AND uc.id = u.user_id AND uc.period = ?
                 WHERE u.user_id = ?
-            ''', (target_user_id,))
+            ''', (database.USAGE_SCOPE_USER, database.get_usage_period(), target_user_id))
             user_data = await cursor.fetchone()
             
             if not user_data:
@@ -284,15 +283,14 @@ async def process_user_info_check(message: types.Message, state: FSMContext):
 
 
 @router.callback_query(F.data == "premium_stats")
-async def show_premium_stats(callback: types.CallbackQuery):
+async def show_premium_stats(callback: types.CallbackQuery, user_ctx: UserContext):
     """Show premium statistics."""
-    if callback.from_user.id != DEVELOPER_ID:
+    if not user_ctx.is_developer:
         await callback.answer("❌ Access denied", show_alert=True)
         return
         
     try:
-        import aiosqlite
-        async with aiosqlite.connect(database.DB_NAME) as db:
+        async with database.get_db() as db:
             # Total users
             cursor = await db.execute('SELECT COUNT(*) FROM users')
             total_users = (await cursor.fetchone())[0]
@@ -311,7 +309,8 @@ async def show_premium_stats(callback: types.CallbackQuery):
             total_posts = result[0] if result[0] else 0
             
             # Posts this month
-            cursor = await db.execute('SELECT SUM(posts_sent_this_month) FROM user_stats')
+            cursor = await db.execute('SELECT SUM(count) FROM usage_counters WHERE scope = ? AND period = ?',
+                                      (database.USAGE_SCOPE_USER, database.get_usage_period()))
             result = await cursor.fetchone()
             posts_this_month = result[0] if result[0] else 0
             
@@ -334,13 +333,13 @@ async def show_premium_stats(callback: types.CallbackQuery):
 
 
 @router.callback_query(F.data == "back_to_premium_menu")
-async def back_to_premium_menu(callback: types.CallbackQuery, state: FSMContext):
+async def back_to_premium_menu(callback: types.CallbackQuery, state: FSMContext, user_ctx: UserContext):
     """Go back to premium management menu."""
-    if callback.from_user.id != DEVELOPER_ID:
+    if not user_ctx.is_developer:
         await callback.answer("❌ Access denied", show_alert=True)
         return
         
-    lang = await database.get_user_language(callback.from_user.id) or 'en'
+    lang = user_ctx.lang
     await state.clear()
     
     await callback.message.edit_text(
@@ -352,13 +351,12 @@ async def back_to_premium_menu(callback: types.CallbackQuery, state: FSMContext)
 # --- User Management Menu ---
 
 @router.message(F.text.in_([get_text('developer_manage_users_button', 'fa'), get_text('developer_manage_users_button', 'en')]))
-async def show_user_management_menu(message: types.Message):
+async def show_user_management_menu(message: types.Message, user_ctx: UserContext):
     """Shows user management menu for developer."""
-    user_id = message.from_user.id
-    if user_id != DEVELOPER_ID:
+    if not user_ctx.is_developer:
         return
         
-    lang = await database.get_user_language(user_id) or 'en'
+    lang = user_ctx.lang
     
     await message.answer(
         "👥 منوی مدیریت کاربران\n\nلطفا یکی از گزینه‌های زیر را انتخاب کنید:",
@@ -369,20 +367,31 @@ async def show_user_management_menu(message: types.Message):
 # --- Statistics Menu ---
 
 @router.message(F.text.in_([get_text('developer_stats_button', 'fa'), get_text('developer_stats_button', 'en')]))
-async def show_stats_menu(message: types.Message):
+async def show_stats_menu(message: types.Message, user_ctx: UserContext):
     """Shows bot statistics for developer."""
-    user_id = message.from_user.id
-    if user_id != DEVELOPER_ID:
+    if not user_ctx.is_developer:
         return
         
     await show_stats_command(message)
 
 
+def _format_ms(value) -> str:
+    return f"{value:.0f}ms" if value is not None else "-"
+
+
+def _format_seconds(value) -> str:
+    """A histogram quantile (bucket upper bound in seconds) as text."""
+    if value is None:
+        return "-"
+    if value == float('inf'):
+        return f">{metrics.LAG_BUCKETS[-1]:g}s"
+    return _format_ms(value * 1000) if value < 1 else f"{value:g}s"
+
+
 async def show_stats_command(message: types.Message):
     """Developer command to show bot statistics."""
     try:
-        import aiosqlite
-        async with aiosqlite.connect(database.DB_NAME) as db:
+        async with database.get_db() as db:
             # Total users
             cursor = await db.execute('SELECT COUNT(*) FROM users')
             total_users = (await cursor.fetchone())[0]
@@ -401,7 +410,8 @@ async def show_stats_command(message: types.Message):
             total_posts = result[0] if result[0] else 0
             
             # Posts this month
-            cursor = await db.execute('SELECT SUM(posts_sent_this_month) FROM user_stats')
+            cursor = await db.execute('SELECT SUM(count) FROM usage_counters WHERE scope = ? AND period = ?',
+                                      (database.USAGE_SCOPE_USER, database.get_usage_period()))
             result = await cursor.fetchone()
             posts_this_month = result[0] if result[0] else 0
             
@@ -418,6 +428,78 @@ async def show_stats_command(message: types.Message):
 💰 نرخ تبدیل پریمیوم: {(premium_users/total_users*100):.1f}%
 📊 میانگین پست به ازای هر کاربر: {(total_posts/total_users):.1f}"""
 
+        pool = database.get_pool_stats()
+        if pool:
+            stats_text += f"""
+
+🗄️ استخر اتصال دیتابیس:
+├── اندازه: {pool['size']} (در حال استفاده: {pool['in_use']})
+├── تعداد امانت‌ها: {pool['acquisitions']} (با انتظار: {pool['waits']})
+└── انتظار میانگین/بیشینه: {pool['avg_wait_ms']:.2f} / {pool['max_wait_ms']:.2f} ms"""
+
+        cache = database.get_user_cache_stats()
+        stats_text += f"""
+
+⚡ کش پروفایل کاربران:
+├── ورودی‌ها: {cache['entries']} از {cache['max_entries']} (~{cache['bytes'] / 1024 / 1024:.1f} MB)
+├── hit/miss: {cache['hits']} / {cache['misses']} ({cache['hit_rate']:.1f}%)
+└── حذف‌شده‌ها: {cache['evictions']}"""
+
+        channel_cache = database.get_channel_meta_cache_stats()
+        stats_text += f"""
+
+🏷️ کش اطلاعات کانال‌ها:
+├── ورودی‌ها: {channel_cache['entries']} از {channel_cache['max_entries']}
+└── hit/miss: {channel_cache['hits']} / {channel_cache['misses']} ({channel_cache['hit_rate']:.1f}%)"""
+
+        usage = database.usage_buffer.stats()
+        stats_text += f"""
+
+🧮 بافر شمارنده پست‌ها:
+├── در انتظار ثبت: {usage['pending_increments']}
+└── تعداد ثبت‌ها: {usage['flushes']} ({usage['flushed_increments']} افزایش)"""
+
+        round_trips = user_context_middleware.stats()
+        stats_text += f"""
+
+🔁 رفت‌وبرگشت دیتابیس به ازای هر آپدیت:
+├── آپدیت‌ها: {round_trips['updates']}
+└── میانگین/بیشینه: {round_trips['avg_round_trips']:.2f} / {round_trips['max_round_trips']}"""
+
+        limiter = rate_limiter.stats()
+        retries = retry_middleware.stats()
+        stats_text += f"""
+
+🚦 محدودکننده نرخ ارسال:
+├── درخواست‌ها: {limiter['requests']} (با تاخیر: {limiter['delayed']})
+├── صف فعلی/بیشینه: {limiter['queue_depth']} / {limiter['max_queue_depth']}
+├── انتظار میانگین/بیشینه: {limiter['avg_wait_ms']:.0f} / {limiter['max_wait_ms']:.0f} ms
+├── توقف‌های flood control: {limiter['pauses']}
+└── تلاش مجدد: {retries['retries']} (منصرف‌شده: {retries['gave_up']})"""
+
+        outbox = outbox_worker.stats()
+        outbox_rows = await database.get_outbox_stats()
+        stats_text += f"""
+
+📮 صف ارسال (outbox):
+├── در انتظار/در حال ارسال: {outbox_rows.get('pending', 0)} / {outbox_rows.get('sending', 0)}
+├── ارسال‌شده/ناموفق: {outbox_rows.get('sent', 0)} / {outbox_rows.get('failed', 0)}
+├── این اجرا: {outbox['delivered']} ارسال، {outbox['retried']} تلاش مجدد، {outbox['failed']} ناموفق
+└── تاخیر پست‌های زمان‌بندی شده (p50/p99): {_format_ms(outbox['lateness_p50_ms'])} / {_format_ms(outbox['lateness_p99_ms'])}"""
+
+        audit = channel_health_auditor.stats()
+        health = await database.get_channel_health_summary()
+        last_sweep = f"{audit['last_sweep_channels']} کانال در {audit['last_sweep_seconds']:.0f} ثانیه" \
+            if audit['last_sweep_seconds'] is not None else "-"
+        unhealthy = ', '.join(f"{status}: {count}" for status, count in sorted(health.items()) if status not in ('ok', 'unknown'))
+        stats_text += f"""
+
+🩺 سلامت کانال‌ها:
+├── سالم/نامشخص: {health.get('ok', 0)} / {health.get('unknown', 0)}
+├── بدون دسترسی ارسال: {unhealthy or 0}
+├── ارسال‌های ردشده به کانال‌های ناسالم: {outbox['skipped']}
+└── آخرین بررسی کامل: {last_sweep}{' (در حال بررسی)' if audit['sweeping'] else ''}"""
+
         await message.answer(stats_text)
         
     except Exception as e:
@@ -472,12 +554,7 @@ async def remove_premium_command(message: types.Message):
         target_user_id = int(parts[1])
         
         # Set premium to 0 and clear premium_until
-        await database.set_user_premium(target_user_id, None)
-        # Also update is_premium to 0
-        import aiosqlite
-        async with aiosqlite.connect(database.DB_NAME) as db:
-            await db.execute('UPDATE users SET is_premium = 0 WHERE user_id = ?', (target_user_id,))
-            await db.commit()
+        await database.clear_user_premium(target_user_id)
             
         await message.answer(f"✅ پریمیوم کاربر {target_user_id} حذف شد.")
         
@@ -507,16 +584,16 @@ async def show_user_info_command(message: types.Message):
             
         target_user_id = int(parts[1])
         
-        import aiosqlite
-        async with aiosqlite.connect(database.DB_NAME) as db:
+        async with database.get_db() as db:
             # Get user info
             cursor = await db.execute('''
                 SELECT u.user_id, u.language_code, u.is_premium, u.premium_until, u.created_at,
-                       s.posts_sent_this_month, s.total_posts_sent
+                       uc.count, s.total_posts_sent
                 FROM users u
                 LEFT JOIN user_stats s ON u.user_id = s.user_id
+                LEFT JOIN usage_counters uc ON uc.scope = ? AND uc.id = u.user_id AND uc.period = ?
                 WHERE u.user_id = ?
-            ''', (target_user_id,))
+            ''', (database.USAGE_SCOPE_USER, database.get_usage_period(), target_user_id))
             user_data = await cursor.fetchone()
             
             if not user_data:
@@ -546,4 +623,74 @@ async def show_user_info_command(message: types.Message):
         await message.answer("فرمت نامعتبر. استفاده: /userinfo USER_ID")
     except Exception as e:
         logging.error(f"Error showing user info: {e}")
-        await message.answer(f"❌ خطا: {e}")
\ No newline at end of file
+        await message.answer(f"❌ خطا: {e}")
+
+@router.message(F.from_user.id == DEVELOPER_ID, F.text.startswith("/schedstats"))
+async def show_scheduler_stats_command(message: types.Message):
+    """Scheduler lag, throughput and the queue depth of the next 15 minutes."""
+    try:
+        from pytz import timezone as pytz_timezone
+        tehran = pytz_timezone('Asia/Tehran')
+
+        lag, job_lag = metrics.delivery_lag, metrics.job_lag
+        retries = retry_middleware.stats()
+        outbox_rows = await database.get_outbox_stats()
+        misfires = ', '.join(f"{source}: {count:g}" for source, count in sorted(metrics.misfires.values.items())) or '0'
+        stats_text = f"""⏱️ وضعیت زمان‌بند:
+
+├── تاخیر ارسال (p50/p90/p99): {_format_seconds(lag.quantile(0.5))} / {_format_seconds(lag.quantile(0.9))} / {_format_seconds(lag.quantile(0.99))} ({lag.count} ارسال)
+├── تاخیر اجرای jobها (p50/p99): {_format_seconds(job_lag.quantile(0.5))} / {_format_seconds(job_lag.quantile(0.99))}
+├── jobهای جاافتاده: {misfires}
+├── ارسال در ثانیه (۱۰ ثانیه/۱ دقیقه): {metrics.send_rate.rate(10):.1f} / {metrics.send_rate.rate():.1f}
+├── تلاش مجدد: {retries['retries']} (flood wait: {retries['flood_waits']}، منصرف‌شده: {retries['gave_up']}، نامعلوم بدون تکرار: {retries['ambiguous']})
+└── outbox در انتظار/در حال ارسال: {outbox_rows.get('pending', 0)} / {outbox_rows.get('sending', 0)}
+
+📅 ارسال‌های زمان‌بندی شده در ۱۵ دقیقه آینده:"""
+        for minute, count in await metrics.get_queue_depth_by_minute(15):
+            stats_text += f"\n{minute.astimezone(tehran).strftime('%H:%M')}: {count}"
+
+        await message.answer(stats_text)
+
+    except Exception as e:
+        logging.error(f"Error showing scheduler stats: {e}")
+        await message.answer(f"❌ خطا: {e}")
+
+
+@router.message(F.from_user.id == DEVELOPER_ID, F.text.startswith("/deliverystats"))
+async def show_delivery_stats_command(message: types.Message):
+    """Per-channel success rates and latency percentiles of the last 7 days. Usage: /deliverystats [CHANNEL_ID]"""
+    try:
+        parts = message.text.split()
+        channel_id = int(parts[1]) if len(parts) > 1 else None
+        since = database.utc_timestamp(delay=-7 * 86400)
+
+        rows = await database.get_channel_delivery_stats(since, channel_id)
+        metas = await database.get_channel_meta([row['channel_id'] for row in rows])
+
+        if channel_id is not None:
+            latency = await database.get_channel_latency_percentiles(channel_id, since)
+            stats_text = f"""📬 ارسال‌های ۷ روز اخیر (کانال {channel_id}):
+
+⏱️ تاخیر تا ارسال (p50/p95/p99): {_format_ms(latency[0.5])} / {_format_ms(latency[0.95])} / {_format_ms(latency[0.99])}"""
+        else:
+            lag = metrics.delivery_lag
+            stats_text = f"""📬 ارسال‌های ۷ روز اخیر (همه کانال‌ها):
+
+⏱️ تاخیر تا شروع ارسال در این اجرا (p50/p99): {_format_seconds(lag.quantile(0.5))} / {_format_seconds(lag.quantile(0.99))}"""
+        if not rows:
+            stats_text += "\n\nارسالی ثبت نشده است."
+        elif channel_id is None:
+            stats_text += "\n\n📉 کانال‌های با کمترین نرخ موفقیت:"
+        for row in rows:
+            meta = metas.get(row['channel_id'])
+            title = meta.title if meta and meta.title else row['channel_id']
+            stats_text += (f"\n• {title}: {row['sent']} موفق، {row['failed']} ناموفق "
+                           f"({row['success_rate']:.1f}%)، میانگین تاخیر {_format_ms(row['avg_latency_ms'])}")
+
+        await message.answer(stats_text)
+
+    except (ValueError, IndexError):
+        await message.answer("فرمت نامعتبر. استفاده: /deliverystats [CHANNEL_ID]")
+    except Exception as e:
+        logging.error(f"Error showing delivery stats: {e}")
+        await message.answer(f"❌ خطا: {e}")
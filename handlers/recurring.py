@@ -0,0 +1,57 @@
+import datetime
+import logging
+
+import jdatetime
+from aiogram import Router, F, types
+from pytz import timezone
+
+import database
+from middlewares.user_context import UserContext
+from texts import get_text
+from keyboards import get_recurring_posts_keyboard
+from utils.recurrence import describe
+
+# All handlers for this module are registered on a separate router
+router = Router()
+
+
+async def render_recurring_posts(user_id: int, lang: str):
+    """Builds the text and delete keyboard for a user's recurring posts."""
+    rules = await database.get_user_recurring_posts(user_id)
+    if not rules:
+        return get_text('recurring_list_empty', lang), None
+
+    lines = [get_text('recurring_list_title', lang), ""]
+    for index, rule in enumerate(rules, 1):
+        next_fire = jdatetime.datetime.fromgregorian(
+            datetime=datetime.datetime.fromisoformat(rule['next_fire_utc']).astimezone(timezone('Asia/Tehran'))
+        )
+        lines.append(get_text('recurring_list_item', lang).format(
+            index=index,
+            rule=describe(rule['kind'], rule['time_of_day'], rule['weekdays'], rule['month_day'], lang),
+            channels=rule['channels'],
+            next=next_fire.strftime('%Y/%m/%d %H:%M')
+        ))
+    return "\n".join(lines), get_recurring_posts_keyboard(lang, [rule['rule_id'] for rule in rules])
+
+
+@router.message(F.text.in_([get_text('recurring_posts_button', 'fa'), get_text('recurring_posts_button', 'en')]))
+async def show_recurring_posts(message: types.Message, user_ctx: UserContext):
+    """Lists the user's recurring posts with a delete button for each."""
+    text, keyboard = await render_recurring_posts(user_ctx.user_id, user_ctx.lang)
+    await message.answer(text, reply_markup=keyboard)
+
+@router.callback_query(F.data.startswith("delete_recurring_"))
+async def delete_recurring_post(callback: types.CallbackQuery, user_ctx: UserContext):
+    """Deletes a recurring post and refreshes the list."""
+    lang = user_ctx.lang
+    rule_id = callback.data[len("delete_recurring_"):]
+
+    if await database.delete_recurring_post(rule_id, user_ctx.user_id):
+        logging.info(f"🗑️ User {user_ctx.user_id} deleted recurring post {rule_id}")
+        await callback.answer(get_text('recurring_deleted', lang))
+    else:
+        await callback.answer()
+
+    text, keyboard = await render_recurring_posts(user_ctx.user_id, lang)
+    await callback.message.edit_text(text, reply_markup=keyboard)
@@ -0,0 +1,148 @@
+import logging
+from aiogram import Router, F, types, Bot
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.fsm.context import FSMContext
+
+import database
+from middlewares.user_context import UserContext
+from texts import get_text
+from states import Form
+from keyboards import get_confirm_delete_sent_post_keyboard
+from utils.fanout import fan_out
+
+router = Router()
+
+
+def parse_post(data: str, prefix: str):
+    """Reads the (post_chat_id, post_message_id) a sent post button refers to."""
+    post_chat_id, post_message_id = data[len(prefix):].split('_')
+    return int(post_chat_id), int(post_message_id)
+
+
+async def run_on_copies(status: types.Message, copies: list, action, lang: str):
+    """Runs `action(copy)` for every channel copy through the fan-out, showing progress in `status`."""
+    async def progress(done: int, total: int):
+        await status.edit_text(get_text('sent_post_progress', lang).format(done=done, total=total))
+
+    await status.edit_text(get_text('sent_post_progress', lang).format(done=0, total=len(copies)))
+    report = await fan_out(copies, action, progress=progress)
+    for result in report.failed:
+        logging.warning(f"Could not update copy {result.target[2][0]} in channel {result.target[1]}: {result.error}")
+    return report
+
+
+@router.callback_query(F.data.startswith("sent_edit_"))
+async def edit_sent_caption_handler(callback: types.CallbackQuery, state: FSMContext, user_ctx: UserContext):
+    """Asks for the new caption of a post that already went out."""
+    lang = user_ctx.lang
+    post_chat_id, post_message_id = parse_post(callback.data, "sent_edit_")
+    copies = await database.get_post_deliveries(post_chat_id, post_message_id, user_ctx.user_id)
+    if not copies:
+        await callback.answer(get_text('sent_post_not_found', lang), show_alert=True)
+        return
+
+    await state.set_state(Form.waiting_for_sent_caption)
+    await state.update_data(sent_post=[post_chat_id, post_message_id])
+    await callback.message.answer(get_text('prompt_edit_sent_caption', lang).format(count=len(copies)))
+    await callback.answer()
+
+@router.message(Form.waiting_for_sent_caption, F.text)
+async def process_sent_caption(message: types.Message, state: FSMContext, bot: Bot, user_ctx: UserContext):
+    """Replaces the caption, or the text of a text post, of every channel copy, footer included like the original send."""
+    lang = user_ctx.lang
+    post_chat_id, post_message_id = (await state.get_data())['sent_post']
+    await state.clear()
+
+    copies = await database.get_post_deliveries(post_chat_id, post_message_id, user_ctx.user_id)
+    if not copies:
+        await message.answer(get_text('sent_post_not_found', lang))
+        return
+
+    footer = user_ctx.footer
+    # html_text keeps the bold, links etc. the user typed, like the original caption's entities
+    caption = f"{message.html_text}\n\n{footer}" if footer else message.html_text
+
+    async def edit(copy):
+        # An album's caption is on its first part
+        _, channel_id, message_ids = copy
+        try:
+            try:
+                return await bot.edit_message_caption(chat_id=channel_id, message_id=message_ids[0],
+                                                      caption=caption, parse_mode="HTML")
+            except TelegramBadRequest as e:
+                # The post was plain text, so its text is what the user is replacing
+                if 'no caption' not in str(e):
+                    raise
+                return await bot.edit_message_text(text=caption, chat_id=channel_id, message_id=message_ids[0],
+                                                   parse_mode="HTML")
+        except TelegramBadRequest as e:
+            # Pressing edit twice with the same text is not a failure: returning
+            # normally counts the copy as edited in report.sent_count
+            if 'message is not modified' not in str(e):
+                raise
+
+    status = await message.answer("⏳")
+    report = await run_on_copies(status, copies, edit, lang)
+    logging.info(f"✏️ User {user_ctx.user_id} edited post {post_chat_id}/{post_message_id}: "
+                 f"{report.sent_count} edited, {report.failed_count} failed")
+
+    text = get_text('sent_post_edited', lang).format(count=report.sent_count)
+    if report.failed_count:
+        text += "\n" + get_text('sent_post_partial_failure', lang).format(count=report.failed_count)
+    await status.edit_text(text)
+
+@router.message(Form.waiting_for_sent_caption)
+async def sent_caption_not_text(message: types.Message, user_ctx: UserContext):
+    """Asks again when anything but text (a photo, a sticker...) is sent as the new caption."""
+    await message.answer(get_text('sent_caption_text_only', user_ctx.lang))
+
+@router.callback_query(F.data.startswith("sent_delete_"))
+async def delete_sent_post_handler(callback: types.CallbackQuery, user_ctx: UserContext):
+    """Asks for confirmation before deleting a sent post everywhere."""
+    lang = user_ctx.lang
+    post_chat_id, post_message_id = parse_post(callback.data, "sent_delete_")
+    copies = await database.get_post_deliveries(post_chat_id, post_message_id, user_ctx.user_id)
+    if not copies:
+        await callback.answer(get_text('sent_post_not_found', lang), show_alert=True)
+        return
+
+    await callback.message.answer(
+        get_text('confirm_delete_sent_post', lang).format(count=len(copies)),
+        reply_markup=get_confirm_delete_sent_post_keyboard(lang, post_chat_id, post_message_id)
+    )
+    await callback.answer()
+
+@router.callback_query(F.data.startswith("sent_confirmdelete_"))
+async def confirm_delete_sent_post_handler(callback: types.CallbackQuery, bot: Bot, user_ctx: UserContext):
+    """Deletes every channel copy of a sent post and marks them deleted in the ledger."""
+    lang = user_ctx.lang
+    post_chat_id, post_message_id = parse_post(callback.data, "sent_confirmdelete_")
+    copies = await database.get_post_deliveries(post_chat_id, post_message_id, user_ctx.user_id)
+    if not copies:
+        await callback.message.edit_text(get_text('sent_post_not_found', lang))
+        return
+
+    async def delete(copy):
+        _, channel_id, message_ids = copy
+        for message_id in message_ids:
+            try:
+                await bot.delete_message(chat_id=channel_id, message_id=message_id)
+            except TelegramBadRequest as e:
+                # Already deleted in the channel, e.g. by hand or by an earlier partial attempt
+                if 'message to delete not found' not in str(e):
+                    raise
+
+    await callback.answer()
+    report = await run_on_copies(callback.message, copies, delete, lang)
+    await database.mark_deliveries_deleted([result.target[0] for result in report.succeeded])
+    logging.info(f"🗑️ User {user_ctx.user_id} deleted post {post_chat_id}/{post_message_id}: "
+                 f"{report.sent_count} deleted, {report.failed_count} failed")
+
+    text = get_text('sent_post_deleted', lang).format(count=report.sent_count)
+    if report.failed_count:
+        text += "\n" + get_text('sent_post_partial_failure', lang).format(count=report.failed_count)
+    await callback.message.edit_text(text)
+
+@router.callback_query(F.data == "sent_cancel")
+async def cancel_sent_post_action(callback: types.CallbackQuery, user_ctx: UserContext):
+    await callback.message.edit_text(get_text('operation_cancelled', user_ctx.lang))
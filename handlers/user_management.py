@@ -3,9 +3,11 @@ from aiogram import Router, F, types, Bot
 from aiogram.fsm.context import FSMContext
 
 import database
+from middlewares.user_context import UserContext
 from texts import get_text
 from states import Form
 from keyboards import get_user_management_keyboard
+from utils.fanout import fan_out
 from config import DEVELOPER_ID
 
 router = Router()
@@ -13,9 +15,9 @@ router = Router()
 # --- User Management Handlers ---
 
 @router.callback_query(F.data == "search_user")
-async def search_user_handler(callback: types.CallbackQuery, state: FSMContext):
+async def search_user_handler(callback: types.CallbackQuery, state: FSMContext, user_ctx: UserContext):
     """Start user search process."""
-    if callback.from_user.id != DEVELOPER_ID:
+    if not user_ctx.is_developer:
         await callback.answer("❌ Access denied", show_alert=True)
         return
     
@@ -23,26 +25,25 @@ async def search_user_handler(callback: types.CallbackQuery, state: FSMContext):
     await callback.message.edit_text("🔍 لطفا شناسه کاربری (User ID) کاربر مورد نظر را وارد کنید:")
 
 @router.callback_query(F.data == "user_stats")
-async def user_stats_handler(callback: types.CallbackQuery):
+async def user_stats_handler(callback: types.CallbackQuery, user_ctx: UserContext):
     """Show detailed user statistics."""
-    if callback.from_user.id != DEVELOPER_ID:
+    if not user_ctx.is_developer:
         await callback.answer("❌ Access denied", show_alert=True)
         return
     
     try:
-        import aiosqlite
-        async with aiosqlite.connect(database.DB_NAME) as db:
+        async with database.get_db() as db:
             # Get detailed user statistics
             cursor = await db.execute('''
                 SELECT 
                     COUNT(*) as total_users,
                     COUNT(CASE WHEN is_premium = 1 THEN 1 END) as premium_users,
-                    AVG(CASE WHEN s.posts_sent_this_month IS NOT NULL THEN s.posts_sent_this_month ELSE 0 END) as avg_posts_month,
-                    MAX(s.posts_sent_this_month) as max_posts_month,
-                    COUNT(CASE WHEN s.posts_sent_this_month > 0 THEN 1 END) as active_users
+                    AVG(COALESCE(uc.count, 0)) as avg_posts_month,
+                    MAX(uc.count) as max_posts_month,
+                    COUNT(CASE WHEN uc.count > 0 THEN 1 END) as active_users
                 FROM users u
-                LEFT JOIN user_stats s ON u.user_id = s.user_id
-            ''')
+                LEFT JOIN usage_counters uc ON uc.scope = ? AND uc.id = u.user_id AND uc.period = ?
+            ''', (database.USAGE_SCOPE_USER, database.get_usage_period()))
             stats = await cursor.fetchone()
             
             # Get channel statistics with proper premium check
@@ -50,10 +51,11 @@ async def user_stats_handler(callback: types.CallbackQuery):
                 SELECT 
                     COUNT(*) as total_channels,
                     COUNT(CASE WHEN cp.is_premium = 1 AND cp.premium_until > ? THEN 1 END) as premium_channels,
-                    AVG(cp.posts_sent_this_month) as avg_channel_posts
+                    AVG(COALESCE(uc.count, 0)) as avg_channel_posts
                 FROM channels c
                 LEFT JOIN channel_premium cp ON c.channel_id = cp.channel_id AND c.user_id = cp.user_id
-            ''', (database.get_tehran_time().isoformat(),))
+                LEFT JOIN usage_counters uc ON uc.scope = ? AND uc.id = cp.id AND uc.period = ?
+            ''', (database.get_tehran_time().isoformat(), database.USAGE_SCOPE_CHANNEL, database.get_usage_period()))
             channel_stats = await cursor.fetchone()
             
             # Get recent activity
@@ -114,9 +116,9 @@ async def user_stats_handler(callback: types.CallbackQuery):
         await callback.message.edit_text(f"❌ خطا: {e}")
 
 @router.callback_query(F.data == "broadcast_all")
-async def broadcast_all_handler(callback: types.CallbackQuery, state: FSMContext):
+async def broadcast_all_handler(callback: types.CallbackQuery, state: FSMContext, user_ctx: UserContext):
     """Start broadcast to all users process."""
-    if callback.from_user.id != DEVELOPER_ID:
+    if not user_ctx.is_developer:
         await callback.answer("❌ Access denied", show_alert=True)
         return
     
@@ -128,15 +130,14 @@ async def broadcast_all_handler(callback: types.CallbackQuery, state: FSMContext
     )
 
 @router.message(Form.waiting_for_broadcast_message)
-async def process_broadcast_message(message: types.Message, state: FSMContext, bot: Bot):
+async def process_broadcast_message(message: types.Message, state: FSMContext, bot: Bot, user_ctx: UserContext):
     """Process and send broadcast message to all users."""
-    if message.from_user.id != DEVELOPER_ID:
+    if not user_ctx.is_developer:
         return
     
     try:
         # Get all users
-        import aiosqlite
-        async with aiosqlite.connect(database.DB_NAME) as db:
+        async with database.get_db() as db:
             cursor = await db.execute('SELECT user_id FROM users')
             users = await cursor.fetchall()
         
@@ -169,9 +170,9 @@ async def process_broadcast_message(message: types.Message, state: FSMContext, b
         await state.clear()
 
 @router.callback_query(F.data == "confirm_broadcast")
-async def confirm_broadcast(callback: types.CallbackQuery, state: FSMContext, bot: Bot):
+async def confirm_broadcast(callback: types.CallbackQuery, state: FSMContext, bot: Bot, user_ctx: UserContext):
     """Confirm and execute broadcast."""
-    if callback.from_user.id != DEVELOPER_ID:
+    if not user_ctx.is_developer:
         await callback.answer("❌ Access denied", show_alert=True)
         return
     
@@ -184,26 +185,20 @@ async def confirm_broadcast(callback: types.CallbackQuery, state: FSMContext, bo
             return
         
         # Get all users
-        import aiosqlite
-        async with aiosqlite.connect(database.DB_NAME) as db:
+        async with database.get_db() as db:
             cursor = await db.execute('SELECT user_id FROM users')
             users = await cursor.fetchall()
         
         await callback.message.edit_text("📤 در حال ارسال پیام همگانی...")
         
         # Send to all users
-        sent_count = 0
-        failed_count = 0
-        
-        for user in users:
-            user_id = user[0]
-            try:
-                await bot.send_message(user_id, f"📢 پیام از مدیریت:\n\n{broadcast_message}")
-                sent_count += 1
-            except Exception as e:
-                failed_count += 1
-                logging.warning(f"Failed to send broadcast to user {user_id}: {e}")
-        
+        text = f"📢 پیام از مدیریت:\n\n{broadcast_message}"
+        report = await fan_out((user[0] for user in users), lambda user_id: bot.send_message(user_id, text))
+        sent_count = report.sent_count
+        failed_count = report.failed_count
+        for result in report.failed:
+            logging.warning(f"Failed to send broadcast to user {result.target}: {result.error}")
+
         result_text = f"""✅ ارسال پیام همگانی تکمیل شد
 
 📊 نتایج:
@@ -211,7 +206,11 @@ async def confirm_broadcast(callback: types.CallbackQuery, state: FSMContext, bo
 ├── ارسال ناموفق: {failed_count}
 └── کل: {sent_count + failed_count}
 
-📈 نرخ موفقیت: {(sent_count/(sent_count + failed_count)*100):.1f}%"""
+📈 نرخ موفقیت: {(sent_count/(sent_count + failed_count)*100):.1f}%
+⏱️ زمان ارسال: {report.elapsed:.1f} ثانیه"""
+        if report.failed_count:
+            errors = "\n".join(f"• {name}: {count}" for name, count in report.error_counts().items())
+            result_text += f"\n\n❌ خطاها:\n{errors}"
 
         await callback.message.edit_text(result_text)
         await state.clear()
@@ -222,9 +221,9 @@ async def confirm_broadcast(callback: types.CallbackQuery, state: FSMContext, bo
         await state.clear()
 
 @router.callback_query(F.data == "cancel_broadcast_all")
-async def cancel_broadcast(callback: types.CallbackQuery, state: FSMContext):
+async def cancel_broadcast(callback: types.CallbackQuery, state: FSMContext, user_ctx: UserContext):
     """Cancel broadcast."""
-    if callback.from_user.id != DEVELOPER_ID:
+    if not user_ctx.is_developer:
         await callback.answer("❌ Access denied", show_alert=True)
         return
     
@@ -237,35 +236,35 @@ async def cancel_broadcast(callback: types.CallbackQuery, state: FSMContext):
 async def show_top_users(message: types.Message):
     """Show top users by activity."""
     try:
-        import aiosqlite
-        async with aiosqlite.connect(database.DB_NAME) as db:
+        async with database.get_db() as db:
             # Top users by posts
             cursor = await db.execute('''
-                SELECT u.user_id, u.language_code, s.total_posts_sent, s.posts_sent_this_month
+                SELECT u.user_id, u.language_code, s.total_posts_sent, uc.count
                 FROM users u
                 LEFT JOIN user_stats s ON u.user_id = s.user_id
+                LEFT JOIN usage_counters uc ON uc.scope = ? AND uc.id = u.user_id AND uc.period = ?
                 WHERE s.total_posts_sent > 0
                 ORDER BY s.total_posts_sent DESC
                 LIMIT 10
-            ''')
+            ''', (database.USAGE_SCOPE_USER, database.get_usage_period()))
             top_users = await cursor.fetchall()
-            
-            if not top_users:
-                await message.answer("📊 هیچ کاربر فعالی یافت نشد.")
-                return
-            
-            text = "🏆 برترین کاربران (بر اساس کل پست‌ها):\n\n"
-            
-            for i, user in enumerate(top_users, 1):
-                user_id, lang, total_posts, month_posts = user
-                emoji = "🥇" if i == 1 else "🥈" if i == 2 else "🥉" if i == 3 else f"{i}️⃣"
-                text += f"{emoji} کاربر {user_id}\n"
-                text += f"   📊 کل پست‌ها: {total_posts or 0}\n"
-                text += f"   📅 این ماه: {month_posts or 0}\n"
-                text += f"   🌐 زب��ن: {lang or 'نامشخص'}\n\n"
-            
-            await message.answer(text)
-            
+        
+        if not top_users:
+            await message.answer("📊 هیچ کاربر فعالی یافت نشد.")
+            return
+        
+        text = "🏆 برترین کاربران (بر اساس کل پست‌ها):\n\n"
+        
+        for i, user in enumerate(top_users, 1):
+            user_id, lang, total_posts, month_posts = user
+            emoji = "🥇" if i == 1 else "🥈" if i == 2 else "🥉" if i == 3 else f"{i}️⃣"
+            text += f"{emoji} کاربر {user_id}\n"
+            text += f"   📊 کل پست‌ها: {total_posts or 0}\n"
+            text += f"   📅 این ماه: {month_posts or 0}\n"
+            text += f"   🌐 زب��ن: {lang or 'نامشخص'}\n\n"
+        
+        await message.answer(text)
+        
     except Exception as e:
         logging.error(f"Error showing top users: {e}")
         await message.answer(f"❌ خطا: {e}")
@@ -274,36 +273,35 @@ async def show_top_users(message: types.Message):
 async def show_active_users(message: types.Message):
     """Show recently active users."""
     try:
-        import aiosqlite
-        async with aiosqlite.connect(database.DB_NAME) as db:
+        async with database.get_db() as db:
             # Recently active users
             cursor = await db.execute('''
-                SELECT u.user_id, u.language_code, u.created_at, s.posts_sent_this_month
+                SELECT u.user_id, u.language_code, u.created_at, uc.count
                 FROM users u
-                LEFT JOIN user_stats s ON u.user_id = s.user_id
-                WHERE u.created_at > datetime('now', '-7 days') OR s.posts_sent_this_month > 0
+                LEFT JOIN usage_counters uc ON uc.scope = ? AND uc.id = u.user_id AND uc.period = ?
+                WHERE u.created_at > datetime('now', '-7 days') OR uc.count > 0
                 ORDER BY u.created_at DESC
                 LIMIT 20
-            ''')
+            ''', (database.USAGE_SCOPE_USER, database.get_usage_period()))
             active_users = await cursor.fetchall()
-            
-            if not active_users:
-                await message.answer("📊 هیچ کاربر فعالی یافت نشد.")
-                return
-            
-            text = "🔥 کاربران فعال (7 روز گذشته):\n\n"
-            
-            for user in active_users:
-                user_id, lang, created_at, month_posts = user
-                # Format date to Persian
-                created_persian = database.format_persian_date(created_at) if created_at else 'نامشخص'
-                text += f"👤 کاربر {user_id}\n"
-                text += f"   📅 عضویت: {created_persian}\n"
-                text += f"   📊 پست‌های ماه: {month_posts or 0}\n"
-                text += f"   🌐 زبان: {lang or 'نامشخص'}\n\n"
-            
-            await message.answer(text)
-            
+        
+        if not active_users:
+            await message.answer("📊 هیچ کاربر فعالی یافت نشد.")
+            return
+        
+        text = "🔥 کاربران فعال (7 روز گذشته):\n\n"
+        
+        for user in active_users:
+            user_id, lang, created_at, month_posts = user
+            # Format date to Persian
+            created_persian = database.format_persian_date(created_at) if created_at else 'نامشخص'
+            text += f"👤 کاربر {user_id}\n"
+            text += f"   📅 عضویت: {created_persian}\n"
+            text += f"   📊 پست‌های ماه: {month_posts or 0}\n"
+            text += f"   🌐 زبان: {lang or 'نامشخص'}\n\n"
+        
+        await message.answer(text)
+        
     except Exception as e:
         logging.error(f"Error showing active users: {e}")
         await message.answer(f"❌ خطا: {e}")
@@ -312,8 +310,7 @@ async def show_active_users(message: types.Message):
 async def show_premium_channels(message: types.Message):
     """Show all premium channels with expiry dates."""
     try:
-        import aiosqlite
-        async with aiosqlite.connect(database.DB_NAME) as db:
+        async with database.get_db() as db:
             # Get premium channels
             cursor = await db.execute('''
                 SELECT cp.channel_id, cp.user_id, cp.premium_until, cp.created_at
@@ -322,29 +319,29 @@ async def show_premium_channels(message: types.Message):
                 ORDER BY cp.premium_until ASC
             ''', (database.get_tehran_time().isoformat(),))
             premium_channels = await cursor.fetchall()
+        
+        if not premium_channels:
+            await message.answer("📊 هیچ کانال پریمیومی یافت نشد.")
+            return
+        
+        text = "💎 کانال‌های پریمیوم:\n\n"
+        
+        for channel in premium_channels:
+            channel_id, user_id, premium_until, created_at = channel
             
-            if not premium_channels:
-                await message.answer("📊 هیچ کانال پریمیومی یافت نشد.")
-                return
-            
-            text = "💎 کانال‌های پریمیوم:\n\n"
-            
-            for channel in premium_channels:
-                channel_id, user_id, premium_until, created_at = channel
-                
-                # Format dates to Persian
-                expiry_persian = database.format_persian_date(premium_until) if premium_until else 'نامشخص'
-                created_persian = database.format_persian_date(created_at) if created_at else 'نامشخص'
-                
-                text += f"📢 کانال {channel_id}\n"
-                text += f"   👤 کاربر: {user_id}\n"
-                text += f"   📅 ثبت: {created_persian}\n"
-                text += f"   ⏰ انقضا: {expiry_persian}\n\n"
-            
-            text += f"📊 کل کانال‌های پریمیوم: {len(premium_channels)}"
-            
-            await message.answer(text)
+            # Format dates to Persian
+            expiry_persian = database.format_persian_date(premium_until) if premium_until else 'نامشخص'
+            created_persian = database.format_persian_date(created_at) if created_at else 'نامشخص'
             
+            text += f"📢 کانال {channel_id}\n"
+            text += f"   👤 کاربر: {user_id}\n"
+            text += f"   📅 ثبت: {created_persian}\n"
+            text += f"   ⏰ انقضا: {expiry_persian}\n\n"
+        
+        text += f"📊 کل کانال‌های پریمیوم: {len(premium_channels)}"
+        
+        await message.answer(text)
+        
     except Exception as e:
         logging.error(f"Error showing premium channels: {e}")
         await message.answer(f"❌ خطا: {e}")
\ No newline at end of file
@@ -22,7 +22,10 @@ def get_main_menu_keyboard(lang: str) -> ReplyKeyboardMarkup:
         KeyboardButton(text=get_text('set_footer_button', lang)),
         KeyboardButton(text=get_text('manage_channels_button', lang))
     )
-    builder.row(KeyboardButton(text=get_text('upgrade_premium_button', lang)))
+    builder.row(
+        KeyboardButton(text=get_text('recurring_posts_button', lang)),
+        KeyboardButton(text=get_text('upgrade_premium_button', lang))
+    )
     return builder.as_markup(resize_keyboard=True)
 
 def get_developer_menu_keyboard(lang: str) -> ReplyKeyboardMarkup:
@@ -33,11 +36,15 @@ def get_developer_menu_keyboard(lang: str) -> ReplyKeyboardMarkup:
         KeyboardButton(text=get_text('developer_manage_users_button', lang))
     )
     builder.row(KeyboardButton(text=get_text('developer_premium_management_button', lang)))
-    builder.row(KeyboardButton(text=get_text('manage_payments_button', lang)))
+    builder.row(
+        KeyboardButton(text=get_text('manage_payments_button', lang)),
+        KeyboardButton(text=get_text('dead_letters_button', lang))
+    )
     builder.row(
         KeyboardButton(text=get_text('set_footer_button', lang)),
         KeyboardButton(text=get_text('manage_channels_button', lang))
     )
+    builder.row(KeyboardButton(text=get_text('recurring_posts_button', lang)))
     return builder.as_markup(resize_keyboard=True)
 
 def get_premium_management_keyboard(lang: str) -> InlineKeyboardMarkup:
@@ -104,9 +111,60 @@ def get_post_action_keyboard(lang: str) -> InlineKeyboardMarkup:
         InlineKeyboardButton(text=get_text('send_now_button', lang), callback_data="send_now"),
         InlineKeyboardButton(text=get_text('send_scheduled_button', lang), callback_data="send_scheduled")
     )
+    builder.row(InlineKeyboardButton(text=get_text('send_recurring_button', lang), callback_data="send_recurring"))
+    builder.row(InlineKeyboardButton(text=get_text('cancel_broadcast_button', lang), callback_data="cancel_broadcast"))
+    return builder.as_markup()
+
+def get_recurrence_kind_keyboard(lang: str) -> InlineKeyboardMarkup:
+    """Keyboard for choosing how often a recurring post repeats."""
+    builder = InlineKeyboardBuilder()
+    builder.row(*[
+        InlineKeyboardButton(text=get_text(f'recurrence_{kind}_button', lang), callback_data=f"recurrence_{kind}")
+        for kind in ('daily', 'weekly', 'monthly')
+    ])
     builder.row(InlineKeyboardButton(text=get_text('cancel_broadcast_button', lang), callback_data="cancel_broadcast"))
     return builder.as_markup()
 
+def get_weekday_selection_keyboard(lang: str, day_names: List[str], selected_days: List[int]) -> InlineKeyboardMarkup:
+    """Toggle keyboard for the Jalali weekdays of a weekly post. Selected days are marked."""
+    builder = InlineKeyboardBuilder()
+    for day, name in enumerate(day_names):
+        text = f"✅ {name}" if day in selected_days else name
+        builder.button(text=text, callback_data=f"recurrence_day_{day}")
+    builder.adjust(3)
+    if selected_days:
+        builder.row(InlineKeyboardButton(text=get_text('recurrence_weekdays_done_button', lang), callback_data="recurrence_days_done"))
+    return builder.as_markup()
+
+def get_recurring_posts_keyboard(lang: str, rule_ids: List[str]) -> InlineKeyboardMarkup:
+    """One delete button per recurring post, numbered like the list above it."""
+    builder = InlineKeyboardBuilder()
+    for index, rule_id in enumerate(rule_ids, 1):
+        builder.button(text=get_text('delete_recurring_button', lang).format(index=index),
+                       callback_data=f"delete_recurring_{rule_id}")
+    builder.adjust(2)
+    return builder.as_markup()
+
+def get_sent_post_keyboard(lang: str, post_chat_id: int, post_message_id: int) -> InlineKeyboardMarkup:
+    """Actions on a post that went out: edit its caption or delete it in every channel."""
+    post = f"{post_chat_id}_{post_message_id}"
+    builder = InlineKeyboardBuilder()
+    builder.row(
+        InlineKeyboardButton(text=get_text('edit_sent_caption_button', lang), callback_data=f"sent_edit_{post}"),
+        InlineKeyboardButton(text=get_text('delete_sent_post_button', lang), callback_data=f"sent_delete_{post}")
+    )
+    return builder.as_markup()
+
+def get_confirm_delete_sent_post_keyboard(lang: str, post_chat_id: int, post_message_id: int) -> InlineKeyboardMarkup:
+    """Keyboard to confirm deleting a sent post from every channel."""
+    builder = InlineKeyboardBuilder()
+    builder.row(
+        InlineKeyboardButton(text=get_text('yes_remove', lang),
+                             callback_data=f"sent_confirmdelete_{post_chat_id}_{post_message_id}"),
+        InlineKeyboardButton(text=get_text('no_cancel', lang), callback_data="sent_cancel")
+    )
+    return builder.as_markup()
+
 def get_channel_selection_keyboard(lang: str, all_channels: List[Dict], selected_channels: List[int]) -> InlineKeyboardMarkup:
     """Dynamic keyboard for selecting channels. Selected channels are marked."""
     builder = InlineKeyboardBuilder()
@@ -245,4 +303,19 @@ def get_payment_approval_keyboard(lang: str, request_id: int) -> InlineKeyboardM
         )
     )
     
-    return builder.as_markup()
\ No newline at end of file
+    return builder.as_markup()
+
+def get_dead_letters_keyboard(lang: str, summary: List[Dict]) -> InlineKeyboardMarkup:
+    """Bulk actions for dead letters: retry one error class, retry everything, or purge everything."""
+    builder = InlineKeyboardBuilder()
+    for row in summary:
+        builder.row(InlineKeyboardButton(
+            text=f"🔁 {row['error_class']} ({row['count']})",
+            callback_data=f"dlq_retry_{row['error_class']}"
+        ))
+    if summary:
+        builder.row(
+            InlineKeyboardButton(text="🔁 تلاش مجدد همه" if lang == 'fa' else "🔁 Retry all", callback_data="dlq_retry_all"),
+            InlineKeyboardButton(text="🗑 حذف همه" if lang == 'fa' else "🗑 Purge all", callback_data="dlq_purge_all")
+        )
+    return builder.as_markup()
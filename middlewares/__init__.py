@@ -0,0 +1 @@
+# This file makes the 'middlewares' directory a Python package.
@@ -0,0 +1,78 @@
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+import database
+
+
+@dataclass
+class UserContext:
+    """Everything handlers need to know about the user behind an update, resolved once."""
+    user_id: int
+    lang: str
+    is_developer: bool
+    footer: Optional[str]
+    is_registered: bool
+    _quotas: Optional[List[dict]] = field(default=None, repr=False)
+
+    async def get_channel_quotas(self) -> List[dict]:
+        """Channel quotas (see database.get_channel_quota_batch), loaded at most once per update."""
+        if self._quotas is None:
+            self._quotas = await database.get_channel_quota_batch(self.user_id)
+        return self._quotas
+
+
+class UserContextMiddleware(BaseMiddleware):
+    """
+    Outer update middleware that loads the sender's profile once and injects it
+    into handlers as the `user_ctx` argument. It also counts the database round
+    trips each update makes, so the per-update cost can be monitored.
+    """
+
+    def __init__(self):
+        self.updates = 0
+        self.round_trips = 0
+        self.max_round_trips = 0
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        user = data.get('event_from_user')
+        if user is None:
+            return await handler(event, data)
+
+        with database.count_round_trips() as trips:
+            try:
+                profile = await database.get_user_profile(user.id)
+                from config import DEVELOPER_ID
+                data['user_ctx'] = UserContext(
+                    user_id=user.id,
+                    lang=(profile.language if profile else None) or 'en',
+                    is_developer=user.id == DEVELOPER_ID,
+                    footer=profile.footer if profile else None,
+                    is_registered=profile is not None,
+                )
+                return await handler(event, data)
+            finally:
+                self.updates += 1
+                self.round_trips += trips[0]
+                self.max_round_trips = max(self.max_round_trips, trips[0])
+                logging.debug(f"Update from user {user.id} made {trips[0]} database round trips")
+
+    def stats(self) -> dict:
+        """Returns per-update database round-trip metrics."""
+        return {
+            'updates': self.updates,
+            'round_trips': self.round_trips,
+            'avg_round_trips': (self.round_trips / self.updates) if self.updates else 0.0,
+            'max_round_trips': self.max_round_trips,
+        }
+
+
+user_context_middleware = UserContextMiddleware()
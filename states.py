@@ -17,6 +17,14 @@ class Form(StatesGroup):
     # Scheduling states
     selecting_schedule_date = State()
     selecting_schedule_time = State()
+
+    # Recurring post states
+    selecting_recurrence_weekdays = State()
+    waiting_for_recurrence_month_day = State()
+    waiting_for_recurrence_time = State()
+
+    # Sent post states
+    waiting_for_sent_caption = State()
     
     # Premium management states
     waiting_for_user_id_premium = State()
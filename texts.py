@@ -20,6 +20,10 @@ TEXTS = {
         'fa': "مدیریت کانال‌ها 📢",
         'en': "Manage Channels 📢"
     },
+    'recurring_posts_button': {
+        'fa': "پست‌های تکراری 🔁",
+        'en': "Recurring Posts 🔁"
+    },
     'channels_menu_title': {
         'fa': "منوی مدیریت کانال‌ها:",
         'en': "Channel Management Menu:"
@@ -45,8 +49,17 @@ TEXTS = {
         'fa': "محتوای شما دریافت شد. چه کاری می‌خواهید انجام دهید؟",
         'en': "Your content has been received. What would you like to do?"
     },
+    'album_parts_dropped': {
+        'fa': "⚠️ هر آلبوم حداکثر {limit} قسمت دارد؛ {count} قسمت اضافه کنار گذاشته شد و پست بدون آن‌ها ارسال می‌شود.",
+        'en': "⚠️ An album has at most {limit} parts; {count} extra parts were left out and the post goes out without them."
+    },
+    'album_too_many_pending': {
+        'fa': "⚠️ آلبوم قبلی شما هنوز در حال دریافت است (حداکثر {limit} آلبوم هم‌زمان) و این آلبوم دریافت نشد. چند لحظه صبر کنید و آن را دوباره بفرستید.",
+        'en': "⚠️ Your previous album is still being received (at most {limit} at a time), so this album was not taken. Wait a moment and send it again."
+    },
     'send_now_button': { 'fa': "ارسال فوری 🚀", 'en': "Send Now 🚀" },
     'send_scheduled_button': { 'fa': "ارسال زمان‌بندی شده 🕒", 'en': "Scheduled Send 🕒" },
+    'send_recurring_button': { 'fa': "ارسال تکراری 🔁", 'en': "Recurring Send 🔁" },
     'cancel_broadcast_button': { 'fa': "لغو عملیات ❌", 'en': "Cancel ❌" },
     'operation_cancelled': { 'fa': "عملیات لغو شد.", 'en': "Operation cancelled." },
     'select_channels_prompt': {
@@ -68,6 +81,40 @@ TEXTS = {
         'fa': "✅ پست شما با موفقیت به {count} کانال ارسال شد.",
         'en': "✅ Your post was successfully sent to {count} channels."
     },
+    'broadcast_queued': {
+        'fa': "📮 پست شما برای ارسال به {count} کانال در صف قرار گرفت. پس از پایان ارسال، گزارش آن را دریافت می‌کنید.",
+        'en': "📮 Your post is queued for {count} channels. You will get a report once it has been sent."
+    },
+    'broadcast_partial_failure': {
+        'fa': "⚠️ ارسال به {count} کانال ناموفق بود.",
+        'en': "⚠️ Sending failed for {count} channels."
+    },
+    # Editing and deleting sent posts
+    'edit_sent_caption_button': { 'fa': "✏️ ویرایش کپشن", 'en': "✏️ Edit caption" },
+    'delete_sent_post_button': { 'fa': "🗑 حذف از همه کانال‌ها", 'en': "🗑 Delete everywhere" },
+    'sent_post_not_found': {
+        'fa': "نسخه‌ای از این پست در کانال‌ها باقی نمانده است.",
+        'en': "No copies of this post are left in your channels."
+    },
+    'prompt_edit_sent_caption': {
+        'fa': "کپشن جدید (یا متن جدید، اگر پست متنی است) را بفرستید تا در {count} کانال جایگزین شود:",
+        'en': "Send the new caption (or the new text, for a text post) to replace it in {count} channels:"
+    },
+    'sent_caption_text_only': {
+        'fa': "لطفاً کپشن جدید را به صورت متن بفرستید.",
+        'en': "Please send the new caption as text."
+    },
+    'confirm_delete_sent_post': {
+        'fa': "این پست از {count} کانال حذف شود؟",
+        'en': "Delete this post from {count} channels?"
+    },
+    'sent_post_progress': { 'fa': "⏳ {done} از {total} کانال...", 'en': "⏳ {done} of {total} channels..." },
+    'sent_post_edited': { 'fa': "✅ کپشن در {count} کانال ویرایش شد.", 'en': "✅ Caption edited in {count} channels." },
+    'sent_post_deleted': { 'fa': "🗑 پست از {count} کانال حذف شد.", 'en': "🗑 Post deleted from {count} channels." },
+    'sent_post_partial_failure': {
+        'fa': "⚠️ در {count} کانال انجام نشد.",
+        'en': "⚠️ Failed in {count} channels."
+    },
     # Scheduling
     'prompt_for_schedule_date': {
         'fa': "لطفا تاریخ ارسال را از تقویم زیر انتخاب کنید:",
@@ -81,6 +128,61 @@ TEXTS = {
         'fa': "❌ فرمت زمان اشتباه است. لطفا از فرمت HH:MM استفاده کنید.",
         'en': "❌ Invalid time format. Please use HH:MM format."
     },
+    # Recurring posts
+    'prompt_recurrence_kind': {
+        'fa': "این پست هر چند وقت یک‌بار ارسال شود؟",
+        'en': "How often should this post be sent?"
+    },
+    'recurrence_daily_button': { 'fa': "هر روز", 'en': "Every day" },
+    'recurrence_weekly_button': { 'fa': "هر هفته", 'en': "Every week" },
+    'recurrence_monthly_button': { 'fa': "هر ماه", 'en': "Every month" },
+    'prompt_recurrence_weekdays': {
+        'fa': "روزهای ارسال در هفته را انتخاب کنید:",
+        'en': "Select the days of the week to send on:"
+    },
+    'recurrence_weekdays_done_button': { 'fa': "تایید روزها ✅", 'en': "Confirm Days ✅" },
+    'prompt_recurrence_month_day': {
+        'fa': "روز ارسال در ماه شمسی را وارد کنید (1 تا 31). در ماه‌های کوتاه‌تر، آخرین روز ماه استفاده می‌شود:",
+        'en': "Enter the day of the Jalali month to send on (1 to 31). Shorter months use their last day:"
+    },
+    'error_invalid_month_day': {
+        'fa': "روز نادرست است. لطفا عددی بین 1 تا 31 وارد کنید.",
+        'en': "Invalid day. Please enter a number from 1 to 31."
+    },
+    'prompt_recurrence_time': {
+        'fa': "ساعت ارسال را به وقت تهران و با فرمت HH:MM (مثلا 20:00) وارد کنید:",
+        'en': "Enter the sending time (Tehran time) in HH:MM format (e.g., 20:00):"
+    },
+    'recurrence_daily': { 'fa': "هر روز ساعت {time}", 'en': "every day at {time}" },
+    'recurrence_weekly': { 'fa': "هر هفته {days} ساعت {time}", 'en': "every week on {days} at {time}" },
+    'recurrence_monthly': { 'fa': "روز {day} هر ماه ساعت {time}", 'en': "on day {day} of every month at {time}" },
+    'recurring_success': {
+        'fa': "✅ پست تکراری ثبت شد: {rule}\nاولین ارسال: {date} ساعت {time}\n📊 تعداد کانال‌ها: {count}",
+        'en': "✅ Recurring post saved: {rule}\nFirst send: {date} at {time}\n📊 Channels: {count}"
+    },
+    'recurring_list_title': { 'fa': "🔁 پست‌های تکراری شما:", 'en': "🔁 Your recurring posts:" },
+    'recurring_list_empty': {
+        'fa': "هیچ پست تکراری ندارید. برای ساخت، پست را بفرستید و «ارسال تکراری» را انتخاب کنید.",
+        'en': "You have no recurring posts. To create one, send a post and choose \"Recurring Send\"."
+    },
+    'recurring_list_item': {
+        'fa': "{index}. {rule} — {channels} کانال، ارسال بعدی: {next}",
+        'en': "{index}. {rule} — {channels} channels, next send: {next}"
+    },
+    'delete_recurring_button': { 'fa': "حذف {index} 🗑", 'en': "Delete {index} 🗑" },
+    'recurring_deleted': { 'fa': "پست تکراری حذف شد.", 'en': "Recurring post deleted." },
+    'recurring_over_quota': {
+        'fa': "⚠️ پست تکراری شما ({rule}) این بار به {count} کانال ارسال نشد، چون سهمیه ماهانه پست به پایان رسیده است.\n💎 برای ارسال نامحدود، به پریمیوم ارتقا دهید.",
+        'en': "⚠️ Your recurring post ({rule}) was not sent to {count} channels this time because the monthly post limit was reached.\n💎 Upgrade to premium for unlimited sending."
+    },
+    'schedule_slot_busy': {
+        'fa': "⚠️ ساعت {time} شلوغ است ({count} ارسال زمان‌بندی شده) و ممکن است پست شما تا یک دقیقه دیرتر ارسال شود.\nدقایق خلوت‌تر: {suggestions}\n\nبرای ادامه با همین ساعت، دوباره {time} را بفرستید یا ساعت دیگری وارد کنید.",
+        'en': "⚠️ {time} is busy ({count} deliveries scheduled) and your post may go out up to a minute later.\nQuieter minutes: {suggestions}\n\nSend {time} again to keep it, or enter another time."
+    },
+    'schedule_smoothed': {
+        'fa': "⏱ برای توزیع بار، ارسال {seconds} ثانیه بعد از این زمان انجام می‌شود.",
+        'en': "⏱ To spread the load, it will go out {seconds} seconds after that time."
+    },
     'schedule_success': {
         'fa': "✅ پست شما برای ارسال در تاریخ {date} ساعت {time} با موفقیت زمان‌بندی شد.",
         'en': "✅ Your post was successfully scheduled for {date} at {time}."
@@ -94,6 +196,10 @@ TEXTS = {
         'fa': "✅ کانال با موفقیت اضافه شد!",
         'en': "✅ Channel added successfully!"
     },
+    'channel_health_warning': {
+        'fa': "⚠️ ربات دیگر نمی‌تواند در این کانال پست بگذارد و ارسال به آن انجام نمی‌شود. ربات را دوباره ادمین کنید و اجازه ارسال پیام بدهید.",
+        'en': "⚠️ The bot can no longer post in this channel, so posts to it are skipped. Make the bot an admin again with permission to post messages."
+    },
     'channel_already_exists': {
         'fa': "❌ این کانال قبلاً ثبت شده است.",
         'en': "❌ This channel is already registered."
@@ -190,6 +296,10 @@ TEXTS = {
         'fa': "💳 مدیریت پرداخت‌ها",
         'en': "💳 Manage Payments"
     },
+    'dead_letters_button': {
+        'fa': "☠️ ارسال‌های ناموفق",
+        'en': "☠️ Failed Deliveries"
+    },
     # Premium Management Menu
     'set_user_premium_button': {
         'fa': "➕ پریمیوم کردن کاربر",
@@ -0,0 +1,140 @@
+import asyncio
+import logging
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from aiogram import types
+from aiogram.types import InputMediaAudio, InputMediaDocument, InputMediaPhoto, InputMediaVideo
+
+from database import AlbumItem
+
+# Telegram puts at most this many messages in one media group
+MAX_ALBUM_SIZE = 10
+
+INPUT_MEDIA = {
+    'photo': InputMediaPhoto,
+    'video': InputMediaVideo,
+    'document': InputMediaDocument,
+    'audio': InputMediaAudio,
+}
+
+
+def album_item(message: types.Message) -> Optional[AlbumItem]:
+    """The part of an album one message carries, or None for content a media group cannot hold."""
+    caption = message.html_text if message.caption else None
+    if message.photo:
+        return AlbumItem('photo', message.photo[-1].file_id, caption)
+    for media_type in ('video', 'document', 'audio'):
+        media = getattr(message, media_type)
+        if media is not None:
+            return AlbumItem(media_type, media.file_id, caption)
+    return None
+
+
+def build_media_group(items: List[AlbumItem], caption: Optional[str] = None) -> list:
+    """
+    InputMedia for send_media_group. A caption set for the post replaces the
+    first part's caption, like copy_message replaces a single message's.
+    """
+    media = []
+    for position, item in enumerate(items):
+        item_caption = caption if position == 0 and caption else item.caption
+        media.append(INPUT_MEDIA[item.media_type](media=item.file_id, caption=item_caption, parse_mode="HTML"))
+    return media
+
+
+class CollectedAlbum(NamedTuple):
+    messages: List[types.Message]  # In order; empty when the whole album was dropped
+    dropped: int  # Parts left out because the album was over MAX_ALBUM_SIZE
+
+
+class _PendingAlbum:
+    def __init__(self, message: types.Message, now: float):
+        self.messages = [message]
+        self.last_part_at = now
+        self.dropped = 0
+
+
+class AlbumBuffer:
+    """
+    Gathers the messages of an incoming album into one post.
+
+    Telegram delivers an album as separate updates sharing a media_group_id,
+    handled concurrently. The handler call for the first part waits until no
+    new part has arrived for `window` seconds and gets the whole album; calls
+    for the other parts only add their message and get None. Each user has at
+    most `max_pending_per_user` albums buffered, each of at most
+    MAX_ALBUM_SIZE parts; anything beyond that is dropped, and the result says
+    so: the owning call learns how many parts were left out, and the first
+    part of an album dropped as a whole gets an empty album, so the user can be
+    told once.
+    """
+
+    def __init__(self, window: Optional[float] = None, max_pending_per_user: Optional[int] = None):
+        from config import ALBUM_WINDOW, ALBUM_MAX_PENDING_PER_USER
+        self.window = window or ALBUM_WINDOW
+        self.max_pending_per_user = max_pending_per_user or ALBUM_MAX_PENDING_PER_USER
+        self._pending: Dict[Tuple[int, str], _PendingAlbum] = {}
+        self._pending_per_user: Dict[int, int] = {}
+        # Albums dropped as a whole, by when their last part came, so only the first part reports it
+        self._rejected: Dict[Tuple[int, str], float] = {}
+        self.albums = 0
+        self.dropped = 0
+
+    async def collect(self, message: types.Message) -> Optional[CollectedAlbum]:
+        """Adds one album part; returns the complete album to the call that owns it, None to the others."""
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        user_id = message.from_user.id
+        key = (user_id, message.media_group_id)
+
+        album = self._pending.get(key)
+        if album is not None:
+            if len(album.messages) < MAX_ALBUM_SIZE:
+                album.messages.append(message)
+                album.last_part_at = now
+            else:
+                album.dropped += 1
+                self.dropped += 1
+            return None
+
+        if key in self._rejected or self._pending_per_user.get(user_id, 0) >= self.max_pending_per_user:
+            self.dropped += 1
+            first = key not in self._rejected
+            self._forget_rejected(now)
+            self._rejected[key] = now
+            if not first:
+                return None
+            logging.warning(f"🖼️ User {user_id} has {self.max_pending_per_user} albums buffered, dropping another")
+            return CollectedAlbum([], 0)
+
+        album = self._pending[key] = _PendingAlbum(message, loop.time())
+        self._pending_per_user[user_id] = self._pending_per_user.get(user_id, 0) + 1
+        try:
+            # Every new part pushes the end of the window back
+            while True:
+                remaining = album.last_part_at + self.window - loop.time()
+                if remaining <= 0:
+                    break
+                await asyncio.sleep(remaining)
+        finally:
+            del self._pending[key]
+            self._pending_per_user[user_id] -= 1
+            if not self._pending_per_user[user_id]:
+                del self._pending_per_user[user_id]
+
+        self.albums += 1
+        if album.dropped:
+            logging.warning(f"🖼️ Album of user {user_id} had {album.dropped} parts over {MAX_ALBUM_SIZE}, dropped them")
+        return CollectedAlbum(sorted(album.messages, key=lambda part: part.message_id), album.dropped)
+
+    def _forget_rejected(self, now: float):
+        """Drops rejected albums whose parts have stopped arriving."""
+        for key, last_part_at in list(self._rejected.items()):
+            if now - last_part_at > self.window:
+                del self._rejected[key]
+
+    def stats(self) -> dict:
+        return {'pending': len(self._pending), 'albums': self.albums, 'dropped': self.dropped}
+
+
+album_buffer = AlbumBuffer()
@@ -0,0 +1,99 @@
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+
+class TTLCache:
+    """
+    A bounded LRU cache whose entries also expire after `ttl` seconds.
+
+    The cache is bounded by entry count and, optionally, by an approximate
+    memory budget: `weigher(value)` returns the estimated size of a value in
+    bytes and least recently used entries are evicted while the total exceeds
+    `max_bytes`. Hit/miss/eviction counters are kept for monitoring.
+    """
+
+    def __init__(self, max_entries: int, ttl: float, max_bytes: Optional[int] = None,
+                 weigher: Optional[Callable[[Any], int]] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.weigher = weigher or (lambda value: 0)
+        # key -> (expires_at, weight, value), least recently used first
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        entry = self._data.get(key)
+        return entry is not None and entry[0] > time.monotonic()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Returns a live entry and marks it as recently used; counts a hit or a miss."""
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        if entry[0] <= time.monotonic():
+            self._remove(key)
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return entry[2]
+
+    def peek(self, key: Hashable, default: Any = None) -> Any:
+        """Returns a live entry without touching recency or the hit/miss counters."""
+        entry = self._data.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            return default
+        return entry[2]
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        """Inserts or replaces an entry, evicting old ones to stay within bounds."""
+        if key in self._data:
+            self._remove(key)
+        weight = self.weigher(value)
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        self._data[key] = (expires_at, weight, value)
+        self.total_bytes += weight
+
+        while self._data and (len(self._data) > self.max_entries or
+                              (self.max_bytes is not None and self.total_bytes > self.max_bytes)):
+            oldest = next(iter(self._data))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """Removes an entry and returns its value."""
+        if key not in self._data:
+            return default
+        return self._remove(key)
+
+    def clear(self):
+        self._data.clear()
+        self.total_bytes = 0
+
+    def _remove(self, key: Hashable) -> Any:
+        _, weight, value = self._data.pop(key)
+        self.total_bytes -= weight
+        return value
+
+    def stats(self) -> dict:
+        """Returns size and hit/miss metrics."""
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._data),
+            'max_entries': self.max_entries,
+            'bytes': self.total_bytes,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': (self.hits / lookups * 100) if lookups else 0.0,
+        }
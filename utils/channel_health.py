@@ -0,0 +1,198 @@
+import asyncio
+import logging
+import time
+from typing import Dict, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramNotFound
+
+import database
+from utils.ratelimit import TokenBucket
+
+
+def classify_member(member) -> str:
+    """Health status of a channel from the bot's own ChatMember there."""
+    if member.status == 'creator':
+        return 'ok'
+    if member.status == 'administrator':
+        # Unset outside channels; in a channel an admin may lack the right to post
+        return 'no_post_rights' if getattr(member, 'can_post_messages', None) is False else 'ok'
+    return 'not_admin'
+
+
+async def check_channel(bot: Bot, channel_id: int) -> Tuple[int, Optional[str], Optional[str]]:
+    """One channel's (channel_id, status, error); a None status means the check told nothing about the channel."""
+    try:
+        member = await bot.get_chat_member(chat_id=channel_id, user_id=bot.id)
+        return channel_id, classify_member(member), None
+    except (TelegramForbiddenError, TelegramNotFound) as e:
+        return channel_id, 'gone', f"{type(e).__name__}: {e}"[:500]
+    except TelegramBadRequest as e:
+        # Only a missing chat means the bot is out; other bad requests leave its rights unknown
+        status = 'gone' if 'chat not found' in str(e).lower() else 'unknown'
+        return channel_id, status, f"{type(e).__name__}: {e}"[:500]
+    except Exception as e:
+        # Network trouble says nothing about the channel: keep its status
+        return channel_id, None, f"{type(e).__name__}: {e}"[:500]
+
+
+async def recheck_unhealthy(bot: Bot, unhealthy: Dict[int, Tuple[str, Optional[str], str]],
+                            min_age: float = 0) -> Dict[int, Tuple[str, Optional[str], str]]:
+    """
+    Checks channels flagged by get_unhealthy_channels again, saves the results
+    and returns those still unhealthy, in the same form. A verdict can be hours
+    old and the owner may have fixed the bot's rights since. Only verdicts at
+    least `min_age` seconds old are checked, and only while the auditor's rate
+    budget has a token free, so this never waits; the others, and checks that
+    fail without a verdict, keep the old verdict.
+    """
+    from config import CHANNEL_AUDIT_CONCURRENCY
+    checked_before = database.utc_timestamp(delay=-min_age)
+    bucket = channel_health_auditor.bucket()
+    due = [channel_id for channel_id, (_, _, checked_at) in unhealthy.items()
+           if checked_at <= checked_before and bucket.try_take()]
+    if not due:
+        return unhealthy
+    semaphore = asyncio.Semaphore(CHANNEL_AUDIT_CONCURRENCY)
+
+    async def check(channel_id: int):
+        async with semaphore:
+            return await check_channel(bot, channel_id)
+
+    results = await asyncio.gather(*(check(channel_id) for channel_id in due))
+    await database.save_channel_health_batch(results)
+    still = dict(unhealthy)
+    now = database.utc_timestamp()
+    for channel_id, status, error in results:
+        if status in ('ok', 'unknown'):
+            del still[channel_id]
+        elif status is not None:
+            still[channel_id] = (status, error, now)
+    return still
+
+
+class ChannelHealthAuditor:
+    """
+    Re-checks the bot's admin rights in every registered channel.
+
+    Channels last checked more than CHANNEL_AUDIT_INTERVAL ago are taken in
+    batches, oldest first, and checked with get_chat_member at most
+    CHANNEL_AUDIT_CONCURRENCY at a time and CHANNEL_AUDIT_RATE per second, so
+    the audit never crowds out sends. Each batch's results are saved in one
+    transaction; the outbox skips channels whose last check failed, checking
+    old verdicts once more within the same rate. A sweep ends when no channel
+    is due, and its duration is kept for the stats.
+    """
+
+    def __init__(self):
+        self.bot: Optional[Bot] = None
+        self._task: Optional[asyncio.Task] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._sweep_started: Optional[float] = None
+        self._sweep_checked = 0
+        self.checked = 0
+        self.unhealthy = 0
+        self.errors = 0
+        self.last_sweep_seconds: Optional[float] = None
+        self.last_sweep_channels = 0
+        self._bucket: Optional[TokenBucket] = None
+
+    def bucket(self) -> TokenBucket:
+        """The get_chat_member rate budget, shared with recheck_unhealthy, also on replicas not auditing."""
+        if self._bucket is None:
+            from config import CHANNEL_AUDIT_RATE
+            self._bucket = TokenBucket(CHANNEL_AUDIT_RATE, max(1.0, CHANNEL_AUDIT_RATE))
+        return self._bucket
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self, bot: Bot, interval: Optional[float] = None, rate: Optional[float] = None,
+              concurrency: Optional[int] = None, batch_size: Optional[int] = None, idle_sleep: float = 60):
+        if self.running:
+            return
+        from config import CHANNEL_AUDIT_INTERVAL, CHANNEL_AUDIT_RATE, CHANNEL_AUDIT_CONCURRENCY, CHANNEL_AUDIT_BATCH
+        self.bot = bot
+        self.interval = interval if interval is not None else CHANNEL_AUDIT_INTERVAL
+        self.rate = rate or CHANNEL_AUDIT_RATE
+        self.batch_size = batch_size or CHANNEL_AUDIT_BATCH
+        self.idle_sleep = idle_sleep
+        self._bucket = TokenBucket(self.rate, max(1.0, self.rate))
+        self._semaphore = asyncio.Semaphore(concurrency or CHANNEL_AUDIT_CONCURRENCY)
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+        logging.info(f"🩺 Channel health auditor started ({self.rate:g} checks/s)")
+
+    def wake(self):
+        if self._wake is not None:
+            self._wake.set()
+
+    async def stop(self):
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+    async def _run(self):
+        while self.running:  # see OutboxWorker._run
+            try:
+                self._wake.clear()
+                if await self.audit_batch() == self.batch_size:
+                    continue
+                try:
+                    await asyncio.wait_for(self._wake.wait(), self.idle_sleep)
+                except asyncio.TimeoutError:
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"❌ Channel health auditor error: {e}")
+                await asyncio.sleep(self.idle_sleep)
+
+    async def audit_batch(self) -> int:
+        """Checks one batch of due channels and saves the results; returns how many were checked."""
+        channel_ids = await database.get_channels_due_for_audit(
+            database.utc_timestamp(delay=-self.interval), self.batch_size
+        )
+        if channel_ids:
+            if self._sweep_started is None:
+                self._sweep_started = time.monotonic()
+                self._sweep_checked = 0
+            results = await asyncio.gather(*(self._check(channel_id) for channel_id in channel_ids))
+            await database.save_channel_health_batch(results)
+            self._sweep_checked += len(results)
+            self.checked += len(results)
+            bad = [channel_id for channel_id, status, _ in results if status not in (None, 'ok')]
+            self.unhealthy += len(bad)
+            self.errors += sum(1 for _, status, _ in results if status is None)
+            if bad:
+                logging.warning(f"🩺 {len(bad)} of {len(results)} channels lost the bot's posting rights")
+
+        if len(channel_ids) < self.batch_size and self._sweep_started is not None:
+            self.last_sweep_seconds = time.monotonic() - self._sweep_started
+            self.last_sweep_channels = self._sweep_checked
+            self._sweep_started = None
+            logging.info(f"🩺 Channel health sweep finished: {self.last_sweep_channels} channels "
+                         f"in {self.last_sweep_seconds:.0f}s")
+        return len(channel_ids)
+
+    async def _check(self, channel_id: int) -> Tuple[int, Optional[str], Optional[str]]:
+        async with self._semaphore:
+            wait = self._bucket.reserve()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            return await check_channel(self.bot, channel_id)
+
+    def stats(self) -> dict:
+        return {
+            'checked': self.checked,
+            'unhealthy': self.unhealthy,
+            'errors': self.errors,
+            'sweeping': self._sweep_started is not None,
+            'last_sweep_seconds': self.last_sweep_seconds,
+            'last_sweep_channels': self.last_sweep_channels,
+        }
+
+
+channel_health_auditor = ChannelHealthAuditor()
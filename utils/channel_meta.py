@@ -0,0 +1,101 @@
+import asyncio
+import logging
+from typing import Iterable, Optional, Set
+
+from aiogram import Bot
+
+import database
+
+
+class ChannelMetaRefresher:
+    """
+    Keeps `channel_meta` fresh with get_chat calls off the request path.
+
+    Every pass refreshes a batch of channels whose metadata is missing or
+    older than CHANNEL_META_MAX_AGE. Screens that find a channel without
+    metadata call `request()`, which queues it ahead of the stale ones and
+    wakes the loop. A channel get_chat fails for is only retried after it is
+    stale again.
+    """
+
+    def __init__(self):
+        self.bot: Optional[Bot] = None
+        self._task: Optional[asyncio.Task] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._requested: Set[int] = set()
+        self.refreshed = 0
+        self.failed = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self, bot: Bot):
+        if self.running:
+            return
+        from config import CHANNEL_META_MAX_AGE, CHANNEL_META_REFRESH_INTERVAL, CHANNEL_META_REFRESH_BATCH
+        self.bot = bot
+        self.max_age = CHANNEL_META_MAX_AGE
+        self.interval = CHANNEL_META_REFRESH_INTERVAL
+        self.batch_size = CHANNEL_META_REFRESH_BATCH
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+        logging.info("🏷️ Channel metadata refresher started")
+
+    def request(self, channel_ids: Iterable[int]):
+        """Asks for channels to be fetched soon, e.g. ones a screen had no title for."""
+        self._requested.update(channel_ids)
+        if self._wake is not None:
+            self._wake.set()
+
+    async def stop(self):
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+    async def _run(self):
+        while self.running:  # see OutboxWorker._run
+            try:
+                self._wake.clear()
+                refreshed = await self.refresh()
+                if refreshed < self.batch_size:
+                    try:
+                        await asyncio.wait_for(self._wake.wait(), self.interval)
+                    except asyncio.TimeoutError:
+                        pass
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"❌ Channel metadata refresher error: {e}")
+                await asyncio.sleep(self.interval)
+
+    async def refresh(self) -> int:
+        """Fetches one batch of requested and stale channels; returns how many were looked up."""
+        channel_ids = list(self._requested)[:self.batch_size]
+        self._requested.difference_update(channel_ids)
+        if len(channel_ids) < self.batch_size:
+            stale = await database.get_stale_channel_ids(database.utc_timestamp(delay=-self.max_age), self.batch_size)
+            channel_ids += [channel_id for channel_id in stale if channel_id not in channel_ids][:self.batch_size - len(channel_ids)]
+
+        entries, failed = [], []
+        for channel_id in channel_ids:
+            try:
+                chat = await self.bot.get_chat(channel_id)
+                entries.append((channel_id, chat.title, chat.username, chat.type))
+            except Exception as e:
+                logging.warning(f"Could not refresh channel {channel_id}: {e}")
+                failed.append(channel_id)
+        await database.save_channel_meta_batch(entries)
+        await database.touch_channel_meta(failed)
+        self.refreshed += len(entries)
+        self.failed += len(failed)
+        if channel_ids:
+            logging.info(f"🏷️ Refreshed {len(entries)} channel titles ({len(failed)} failed)")
+        return len(channel_ids)
+
+    def stats(self) -> dict:
+        return {'refreshed': self.refreshed, 'failed': self.failed, 'requested': len(self._requested)}
+
+
+channel_meta_refresher = ChannelMetaRefresher()
@@ -0,0 +1,123 @@
+import asyncio
+import logging
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+
+from utils.retry import ERROR_PERMANENT, classify_error
+
+
+@dataclass
+class FanOutResult:
+    """Outcome of the send to a single target."""
+    target: Any
+    message_id: Optional[int] = None
+    latency: float = 0.0
+    error: Optional[BaseException] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    @property
+    def error_class(self) -> Optional[str]:
+        return type(self.error).__name__ if self.error is not None else None
+
+    @property
+    def permanent(self) -> bool:
+        """True when the target failed for a reason retrying cannot fix (bot kicked, chat not found...)."""
+        return self.error is not None and classify_error(self.error) == ERROR_PERMANENT
+
+
+@dataclass
+class FanOutReport:
+    """Per-target results of a fan-out, in the order the targets were given."""
+    results: List[FanOutResult] = field(default_factory=list)
+    elapsed: float = 0.0
+
+    @property
+    def succeeded(self) -> List[FanOutResult]:
+        return [r for r in self.results if r.ok]
+
+    @property
+    def failed(self) -> List[FanOutResult]:
+        return [r for r in self.results if not r.ok]
+
+    @property
+    def sent_count(self) -> int:
+        return sum(1 for r in self.results if r.ok)
+
+    @property
+    def failed_count(self) -> int:
+        return len(self.results) - self.sent_count
+
+    def error_counts(self) -> Dict[str, int]:
+        """Number of failures per exception class."""
+        return dict(Counter(r.error_class for r in self.results if not r.ok))
+
+    def max_latency(self) -> float:
+        return max((r.latency for r in self.results), default=0.0)
+
+
+async def fan_out(targets: Iterable[Any], send: Callable[[Any], Awaitable[Any]],
+                  concurrency: Optional[int] = None,
+                  progress: Optional[Callable[[int, int], Awaitable[Any]]] = None,
+                  progress_interval: float = 3.0) -> FanOutReport:
+    """
+    Runs `send(target)` for every target with at most `concurrency` sends in flight.
+
+    A failing target never aborts the batch: its exception is stored in the
+    result and the remaining targets are still sent. The message id is taken
+    from the returned object (Message or MessageId) when there is one. While
+    it runs, `progress(done, total)` is awaited every `progress_interval`
+    seconds; its errors are ignored.
+    """
+    if concurrency is None:
+        from config import FANOUT_CONCURRENCY
+        concurrency = FANOUT_CONCURRENCY
+
+    results = [FanOutResult(target=target) for target in targets]
+    if not results:
+        return FanOutReport()
+
+    pending = iter(results)
+    done = 0
+
+    async def worker():
+        nonlocal done
+        # Workers pull from a shared iterator so only `concurrency` coroutines exist,
+        # however many targets there are.
+        for result in pending:
+            started = time.perf_counter()
+            try:
+                sent = await send(result.target)
+                result.message_id = getattr(sent, 'message_id', None)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                result.error = e
+            result.latency = time.perf_counter() - started
+            done += 1
+
+    async def report_progress():
+        while True:
+            await asyncio.sleep(progress_interval)
+            try:
+                await progress(done, len(results))
+            except Exception as e:
+                logging.debug(f"Fan-out progress callback failed: {e}")
+
+    started = time.perf_counter()
+    reporter = asyncio.create_task(report_progress()) if progress is not None else None
+    try:
+        await asyncio.gather(*(worker() for _ in range(max(1, min(concurrency, len(results))))))
+    finally:
+        if reporter is not None:
+            reporter.cancel()
+            await asyncio.gather(reporter, return_exceptions=True)
+    report = FanOutReport(results=results, elapsed=time.perf_counter() - started)
+
+    if report.failed_count:
+        logging.warning(f"⚠️ Fan-out finished with {report.failed_count}/{len(results)} failures: {report.error_counts()}")
+    return report
@@ -0,0 +1,99 @@
+import asyncio
+import logging
+import time
+from typing import Callable, Optional
+
+import database
+
+LEADER_LEASE = 'scheduler_leader'
+
+
+class LeaderLease:
+    """
+    Elects one replica to poll Telegram and run the schedulers.
+
+    Every replica shares the database and the outbox, but only the holder of
+    the `scheduler_leader` lease fires jobs and receives updates (Telegram
+    allows one getUpdates consumer per bot). The holder renews the lease every
+    third of its TTL; a standby retries at the same pace and takes over once
+    the lease expires or is released on shutdown. A leader that cannot renew
+    before its lease runs out steps down through `on_lost`, because another
+    replica may already have taken over.
+    """
+
+    def __init__(self):
+        self.holder: Optional[str] = None
+        self.ttl = 30.0
+        self.is_leader = False
+        self.takeovers = 0
+        self._task: Optional[asyncio.Task] = None
+        self._renewed_at = 0.0
+
+    @property
+    def interval(self) -> float:
+        return self.ttl / 3
+
+    async def acquire(self, holder: str, ttl: float):
+        """Waits until this replica holds the lease."""
+        self.holder = holder
+        self.ttl = ttl
+        logged = False
+        while not await self._try_acquire():
+            if not logged:
+                lease = await database.get_lease(LEADER_LEASE)
+                logging.info(f"👑 Standing by: {lease['holder'] if lease else 'another replica'} is the scheduler leader")
+                logged = True
+            await asyncio.sleep(self.interval)
+        self.is_leader = True
+        self.takeovers += 1
+        logging.info(f"👑 {holder} is now the scheduler leader")
+
+    def keep_alive(self, on_lost: Callable[[], None]):
+        """Renews the lease in the background and calls `on_lost` once if it cannot be kept."""
+        self._task = asyncio.create_task(self._heartbeat(on_lost))
+
+    async def _try_acquire(self) -> bool:
+        try:
+            acquired = await database.acquire_lease(LEADER_LEASE, self.holder, self.ttl)
+        except Exception as e:
+            logging.error(f"❌ Leader lease error: {e}")
+            return False
+        if acquired:
+            self._renewed_at = time.monotonic()
+        return acquired
+
+    async def _heartbeat(self, on_lost: Callable[[], None]):
+        while self.is_leader:
+            await asyncio.sleep(self.interval)
+            try:
+                if await database.acquire_lease(LEADER_LEASE, self.holder, self.ttl):
+                    self._renewed_at = time.monotonic()
+                    continue
+                reason = "another replica holds it"
+            except Exception as e:
+                # Keep trying while the lease is surely still ours, with one interval to spare
+                if time.monotonic() - self._renewed_at < self.ttl - self.interval:
+                    logging.error(f"❌ Could not renew the leader lease, retrying: {e}")
+                    continue
+                reason = f"it could not be renewed in time ({e})"
+            self.is_leader = False
+            logging.error(f"👑 Lost the scheduler leader lease, stepping down: {reason}")
+            on_lost()
+
+    async def release(self):
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        if self.is_leader:
+            self.is_leader = False
+            try:
+                await database.release_lease(LEADER_LEASE, self.holder)
+            except Exception as e:
+                logging.error(f"❌ Could not release the leader lease: {e}")
+
+    def stats(self) -> dict:
+        return {'holder': self.holder, 'is_leader': self.is_leader, 'takeovers': self.takeovers}
+
+
+leader_lease = LeaderLease()
@@ -0,0 +1,213 @@
+import bisect
+import logging
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from aiohttp import web
+
+
+class Counter:
+    """A monotonically increasing count, optionally split by one label."""
+
+    def __init__(self, name: str, help: str, label: Optional[str] = None):
+        self.name = name
+        self.help = help
+        self.label = label
+        self.values: Dict[Optional[str], float] = {}
+
+    def inc(self, amount: float = 1, label: Optional[str] = None):
+        self.values[label] = self.values.get(label, 0) + amount
+
+    def total(self) -> float:
+        return sum(self.values.values())
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for label, value in sorted(self.values.items(), key=lambda item: item[0] or ''):
+            labels = f'{{{self.label}="{label}"}}' if self.label and label is not None else ''
+            lines.append(f"{self.name}{labels} {value:g}")
+        return lines
+
+
+class Histogram:
+    """Cumulative bucket counts plus sum and count, in the Prometheus layout."""
+
+    def __init__(self, name: str, help: str, buckets: Sequence[float]):
+        self.name = name
+        self.help = help
+        self.buckets = sorted(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # the last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-quantile; None without samples, inf past the last bucket."""
+        if not self.count:
+            return None
+        rank, seen = q * self.count, 0
+        for bound, count in zip(self.buckets + [float('inf')], self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f'{self.name}_bucket{{le="{bound:g}"}} {cumulative}')
+        lines.append(f'{self.name}_bucket{{le="+Inf"}} {self.count}')
+        lines.append(f"{self.name}_sum {self.sum:g}")
+        lines.append(f"{self.name}_count {self.count}")
+        return lines
+
+
+class RateMeter:
+    """Events per second over a sliding window of one-second slots."""
+
+    def __init__(self, window: int = 60):
+        self.window = window
+        self._slots: deque = deque()  # (second, count), oldest first
+
+    def mark(self, count: int = 1):
+        second = int(time.monotonic())
+        if self._slots and self._slots[-1][0] == second:
+            self._slots[-1][1] += count
+        else:
+            self._slots.append([second, count])
+            while self._slots[0][0] <= second - self.window:
+                self._slots.popleft()
+
+    def rate(self, seconds: Optional[int] = None) -> float:
+        """Average events per second over the last `seconds` (at most the window)."""
+        seconds = min(seconds or self.window, self.window)
+        since = int(time.monotonic()) - seconds
+        return sum(count for second, count in self._slots if second > since) / seconds
+
+
+LAG_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900, 3600)
+
+# Time from a delivery being due (scheduled time, enqueue time or retry time) to its send starting
+delivery_lag = Histogram('captain_delivery_lag_seconds', 'Delay between a delivery being due and its send starting', LAG_BUCKETS)
+# Time from an APScheduler job's run time to it finishing; misfire_grace_time hides up to an hour of this
+job_lag = Histogram('captain_scheduler_job_lag_seconds', 'Delay between a scheduler job run time and its completion', LAG_BUCKETS)
+misfires = Counter('captain_scheduler_misfires_total', 'Scheduled sends dropped for being too late', 'source')
+# Sending Bot API requests (send, copy, forward, edit), marked by the rate limiter middleware
+send_rate = RateMeter()
+
+
+def parse_utc(timestamp: str) -> datetime:
+    """Reads both ISO timestamps and the database's 'YYYY-MM-DD HH:MM:SS' UTC format."""
+    dt = datetime.fromisoformat(timestamp)
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+
+def instrument_scheduler(scheduler):
+    """Records job lag and misfires of an APScheduler instance."""
+    from apscheduler.events import EVENT_JOB_ERROR, EVENT_JOB_EXECUTED, EVENT_JOB_MISSED
+
+    def listener(event):
+        if event.code == EVENT_JOB_MISSED:
+            misfires.inc(label='apscheduler')
+            logging.warning(f"⏭️ Scheduler job {event.job_id} missed its run time {event.scheduled_run_time}")
+            return
+        lag = (datetime.now(timezone.utc) - event.scheduled_run_time).total_seconds()
+        job_lag.observe(max(0.0, lag))
+        if lag > 60:
+            logging.warning(f"🐢 Scheduler job {event.job_id} ran {lag:.0f}s late")
+
+    scheduler.add_listener(listener, EVENT_JOB_EXECUTED | EVENT_JOB_ERROR | EVENT_JOB_MISSED)
+
+
+async def get_queue_depth_by_minute(minutes: int = 15) -> List[Tuple[datetime, int]]:
+    """Deliveries of scheduled posts due in each of the next `minutes` minutes."""
+    from utils.slots import get_minute_forecast
+    return await get_minute_forecast(datetime.now(timezone.utc), minutes)
+
+
+def _samples(name: str, kind: str, help: str, samples: List[Tuple[str, float]]) -> List[str]:
+    lines = [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+    lines += [f"{name}{labels} {value:g}" for labels, value in samples]
+    return lines
+
+
+async def render_prometheus() -> str:
+    """All scheduler and delivery metrics in the Prometheus text format."""
+    import database
+    from utils.outbox import outbox_worker
+    from utils.ratelimit import rate_limiter
+    from utils.retry import retry_middleware
+    from utils.recurrence import recurring_dispatcher
+    from utils.leader import leader_lease
+
+    lines = []
+    for metric in (delivery_lag, job_lag, misfires):
+        lines += metric.render()
+
+    limiter = rate_limiter.stats()
+    retries = retry_middleware.stats()
+    worker = outbox_worker.stats()
+    lines += _samples('captain_api_sends_total', 'counter', 'Sending Bot API requests (send, copy, forward, edit)',
+                      [('', limiter['requests'])])
+    lines += _samples('captain_sends_per_second', 'gauge', 'Sending Bot API requests per second over the last minute',
+                      [('', send_rate.rate())])
+    lines += _samples('captain_send_retries_total', 'counter', 'Bot API requests retried, given up, or not retried because they may have gone out',
+                      [('{result="retried"}', retries['retries']), ('{result="gave_up"}', retries['gave_up']),
+                       ('{result="ambiguous"}', retries['ambiguous'])])
+    lines += _samples('captain_rate_limiter_pauses_total', 'counter', 'Flood-control pauses applied to rate limiter lanes',
+                      [('', limiter['pauses'])])
+    lines += _samples('captain_outbox_deliveries_total', 'counter', 'Outbox deliveries handled by this process',
+                      [(f'{{result="{result}"}}', worker[result]) for result in ('delivered', 'retried', 'failed')])
+    lines += _samples('captain_outbox_worker_queue', 'gauge', 'Deliveries held in memory by the outbox worker',
+                      [('{state="queued"}', worker['queued']), ('{state="inflight"}', worker['inflight']),
+                       ('{state="staged"}', worker['staged'])])
+    lines += _samples('captain_scheduler_leader', 'gauge', 'Whether this replica holds the scheduler leader lease',
+                      [('', int(leader_lease.is_leader))])
+    lines += _samples('captain_recurring_fires_total', 'counter', 'Recurring post occurrences handled by this process',
+                      [(f'{{result="{result}"}}', count) for result, count in recurring_dispatcher.stats().items()])
+
+    outbox = await database.get_outbox_stats()
+    lines += _samples('captain_outbox_rows', 'gauge', 'Outbox rows by status',
+                      [(f'{{status="{status}"}}', count) for status, count in sorted(outbox.items())])
+    depth = await get_queue_depth_by_minute(60)
+    lines += _samples('captain_scheduled_deliveries_due', 'gauge', 'Scheduled deliveries due within the next window',
+                      [(f'{{window="{window}m"}}', sum(count for _, count in depth[:window])) for window in (1, 5, 15, 60)])
+    lines += _samples('captain_dead_letters', 'gauge', 'Deliveries in the dead-letter table',
+                      [('', sum(row['count'] for row in await database.get_dead_letter_summary()))])
+    return "\n".join(lines) + "\n"
+
+
+class MetricsServer:
+    """Serves GET /metrics for scraping; disabled unless METRICS_PORT is set."""
+
+    def __init__(self):
+        self._runner: Optional[web.AppRunner] = None
+
+    async def start(self, port: int, host: str = '0.0.0.0'):
+        if not port or self._runner is not None:
+            return
+        app = web.Application()
+        app.router.add_get('/metrics', self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        logging.info(f"📈 Metrics endpoint listening on {host}:{port}/metrics")
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        return web.Response(text=await render_prometheus(), content_type='text/plain', charset='utf-8')
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+metrics_server = MetricsServer()
@@ -0,0 +1,330 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Set, Tuple
+
+from aiogram import Bot
+
+import database
+from texts import get_text
+from keyboards import get_sent_post_keyboard
+from utils import metrics
+from utils.albums import build_media_group
+from utils.channel_health import recheck_unhealthy
+from utils.retry import ERROR_PERMANENT, ERROR_RETRY_AFTER, caller_retries, classify_error
+
+
+class OutboxWorker:
+    """
+    Drains the `outbox` table with a pool of worker coroutines.
+
+    A single loop claims due deliveries in batches (leasing them in the same
+    UPDATE), keeps the in-memory queue topped up and writes results back in
+    one transaction per flush. Workers copy the post to the target channel.
+    When every delivery of a batch is finished the owner gets one report.
+
+    Scheduled posts can also be staged ahead of time: their deliveries are
+    already leased and sit in memory until a timer hands them to the workers.
+    """
+
+    def __init__(self):
+        self.bot: Optional[Bot] = None
+        self.instance_id: Optional[str] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._tasks: List[asyncio.Task] = []
+        self._sent: List[Tuple[int, List[int], str, int]] = []
+        self._retry: List[Tuple[int, str, str]] = []
+        self._failed: List[Tuple[int, str, str, str]] = []
+        self._finished_batches: Set[str] = set()
+        self._ready: Deque[Tuple[database.OutboxDelivery, Optional[float]]] = deque()
+        self._timers: Dict[int, asyncio.TimerHandle] = {}
+        self._next_timer = 0
+        self._lateness: Deque[float] = deque(maxlen=1000)
+        self.staged = 0
+        self._last_flush = 0.0
+        self._last_maintenance = 0.0
+        self.inflight = 0
+        self.claimed = 0
+        self.delivered = 0
+        self.retried = 0
+        self.failed = 0
+        self.skipped = 0
+
+    def start(self, bot: Bot, workers: Optional[int] = None):
+        """Starts the claim loop and the worker pool."""
+        if self._tasks:
+            return
+        from config import OUTBOX_WORKERS, OUTBOX_BATCH_SIZE, OUTBOX_POLL_INTERVAL, OUTBOX_LEASE_SECONDS, \
+            OUTBOX_MAX_ATTEMPTS, OUTBOX_RETRY_BASE_DELAY, OUTBOX_RETENTION_DAYS, INSTANCE_ID
+        self.bot = bot
+        self.instance_id = INSTANCE_ID
+        self.batch_size = OUTBOX_BATCH_SIZE
+        self.poll_interval = OUTBOX_POLL_INTERVAL
+        self.lease_seconds = OUTBOX_LEASE_SECONDS
+        self.max_attempts = OUTBOX_MAX_ATTEMPTS
+        self.retry_base_delay = OUTBOX_RETRY_BASE_DELAY
+        self.retention_days = OUTBOX_RETENTION_DAYS
+        self._queue = asyncio.Queue(maxsize=self.batch_size * 2)
+        self._wake = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._run())]
+        self._tasks += [asyncio.create_task(self._work()) for _ in range(workers or OUTBOX_WORKERS)]
+        logging.info(f"📮 Outbox worker started with {len(self._tasks) - 1} senders")
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    def stage(self, deliveries: List[database.OutboxDelivery], due_at: float):
+        """Hands leased deliveries to the senders at `due_at` (epoch seconds) without touching the database."""
+        loop = asyncio.get_running_loop()
+        self.staged += len(deliveries)
+        self._next_timer += 1
+        self._timers[self._next_timer] = loop.call_at(
+            loop.time() + max(0.0, due_at - time.time()), self._release, self._next_timer, deliveries, due_at
+        )
+
+    def _release(self, timer: int, deliveries: List[database.OutboxDelivery], due_at: float):
+        del self._timers[timer]
+        self.staged -= len(deliveries)
+        # Straight into the queue while there is room, so the claim loop is not on the critical path
+        for delivery in deliveries:
+            if self._queue.full():
+                self._ready.append((delivery, due_at))
+            else:
+                self._queue.put_nowait((delivery, due_at))
+        self.wake()
+
+    def wake(self):
+        """Makes the claim loop look for new deliveries right away."""
+        if self._wake is not None:
+            self._wake.set()
+
+    async def stop(self):
+        """Stops claiming and sending; unfinished deliveries are requeued on the next start."""
+        tasks, self._tasks = self._tasks, []
+        # Staged deliveries stay leased in the database and are requeued for their time on the next start
+        for handle in self._timers.values():
+            handle.cancel()
+        self._timers.clear()
+        self._ready.clear()
+        self.staged = 0
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        try:
+            await self._flush()
+        except Exception as e:
+            logging.error(f"❌ Could not record outbox results on shutdown: {e}")
+
+    async def _run(self):
+        # Nothing in this replica is sending yet, so whatever it still holds was cut off by a restart;
+        # other replicas' live leases are left alone
+        requeued = await database.requeue_outbox_leases(claimed_by=self.instance_id)
+        if requeued:
+            logging.info(f"📮 Requeued {requeued} interrupted outbox deliveries")
+
+        # Not `while True`: on Python 3.11 wait_for() can swallow a cancel that races its timeout,
+        # so stop() also clears _tasks and the loop ends on its next pass
+        while self._tasks:
+            try:
+                self._wake.clear()
+                now = time.monotonic()
+                if len(self._sent) + len(self._retry) + len(self._failed) >= self.batch_size or now - self._last_flush >= 0.2:
+                    await self._flush()
+                if now - self._last_maintenance >= 60:
+                    await self._maintenance()
+
+                while self._ready and not self._queue.full():
+                    self._queue.put_nowait(self._ready.popleft())
+
+                claimed = []
+                room = self._queue.maxsize - self._queue.qsize()
+                if room >= self.batch_size and not self._ready:
+                    claimed = await database.claim_outbox_batch(room, self.lease_seconds, self.instance_id)
+                    for delivery in await self.skip_unhealthy(claimed):
+                        self._queue.put_nowait((delivery, None))
+                    self.claimed += len(claimed)
+
+                if not claimed:
+                    busy = self.inflight or self._queue.qsize() or self._ready or self._sent or self._retry or self._failed
+                    try:
+                        await asyncio.wait_for(self._wake.wait(), 0.2 if busy else self.poll_interval)
+                    except asyncio.TimeoutError:
+                        pass
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"❌ Outbox loop error: {e}")
+                await asyncio.sleep(self.poll_interval)
+
+    async def skip_unhealthy(self, deliveries: List[database.OutboxDelivery]) -> List[database.OutboxDelivery]:
+        """
+        Fails deliveries to channels whose last health check found the bot unable
+        to post, without sending, and returns the rest. Verdicts older than
+        CHANNEL_AUDIT_RECHECK_AGE are confirmed first as far as the audit rate
+        allows. Skipped deliveries land in the dead letters under
+        ChannelUnhealthy, to be retried once the bot is fixed.
+        """
+        from config import CHANNEL_AUDIT_RECHECK_AGE
+        unhealthy = await database.get_unhealthy_channels(sorted({d.target_channel_id for d in deliveries}))
+        if unhealthy:
+            unhealthy = await recheck_unhealthy(self.bot, unhealthy, min_age=CHANNEL_AUDIT_RECHECK_AGE)
+        if not unhealthy:
+            return deliveries
+        kept = []
+        for delivery in deliveries:
+            health = unhealthy.get(delivery.target_channel_id)
+            if health is None:
+                kept.append(delivery)
+                continue
+            status, last_error, _ = health
+            self._failed.append((delivery.id, 'ChannelUnhealthy', ERROR_PERMANENT,
+                                 f"Skipped, channel is {status}: {last_error or '-'}"[:500]))
+            self._finished_batches.add(delivery.batch_id)
+            self.failed += 1
+            self.skipped += 1
+        logging.warning(f"🩺 Skipped {len(deliveries) - len(kept)} deliveries to unhealthy channels")
+        return kept
+
+    async def _work(self):
+        while True:
+            delivery, due_at = await self._queue.get()
+            if due_at is not None:
+                self._lateness.append(time.time() - due_at)
+            else:
+                due_at = metrics.parse_utc(delivery.next_attempt_at).timestamp()
+            metrics.delivery_lag.observe(max(0.0, time.time() - due_at))
+            self.inflight += 1
+            try:
+                await self._deliver(delivery, due_at)
+            finally:
+                self.inflight -= 1
+                self._queue.task_done()
+                self._wake.set()
+
+    async def _deliver(self, delivery: database.OutboxDelivery, due_at: float):
+        # Sent once per attempt: the session does not retry, so the outbox alone decides
+        # when a delivery is tried again and a sender is never parked in a flood wait
+        try:
+            with caller_retries():
+                album = await database.get_album(delivery.post_chat_id, delivery.post_message_id)
+                if album:
+                    # One request for the whole album, so it stays grouped in the channel
+                    sent = await self.bot.send_media_group(
+                        chat_id=delivery.target_channel_id,
+                        media=build_media_group(album, delivery.caption or None)
+                    )
+                    message_ids = [message.message_id for message in sent]
+                else:
+                    sent = await self.bot.copy_message(
+                        chat_id=delivery.target_channel_id,
+                        from_chat_id=delivery.post_chat_id,
+                        message_id=delivery.post_message_id,
+                        caption=delivery.caption or None,
+                        parse_mode="HTML"
+                    )
+                    message_ids = [sent.message_id]
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"[:500]
+            error_kind = classify_error(e)
+            if error_kind == ERROR_PERMANENT or delivery.attempts >= self.max_attempts:
+                logging.error(f"❌ Delivery {delivery.id} to channel {delivery.target_channel_id} failed: {error}")
+                self._failed.append((delivery.id, type(e).__name__, error_kind, error))
+                self._finished_batches.add(delivery.batch_id)
+                self.failed += 1
+            else:
+                delay = self.retry_base_delay * 2 ** (delivery.attempts - 1)
+                if error_kind == ERROR_RETRY_AFTER:
+                    delay = max(delay, e.retry_after)
+                logging.warning(f"🔁 Delivery {delivery.id} to channel {delivery.target_channel_id} will be retried in {delay:.0f}s: {error}")
+                self._retry.append((delivery.id, database.utc_timestamp(delay=delay), error))
+                self.retried += 1
+            return
+
+        latency_ms = max(0, int((time.time() - due_at) * 1000))
+        self._sent.append((delivery.id, message_ids, database.utc_timestamp(), latency_ms))
+        self._finished_batches.add(delivery.batch_id)
+        self.delivered += 1
+        try:
+            await database.increment_channel_post_count(delivery.target_channel_id, delivery.user_id)
+        except Exception as e:
+            logging.error(f"Error incrementing channel post count for {delivery.target_channel_id}: {e}")
+
+    async def _flush(self):
+        """Writes collected results in one transaction and reports finished batches."""
+        self._last_flush = time.monotonic()
+        sent, self._sent = self._sent, []
+        retry, self._retry = self._retry, []
+        failed, self._failed = self._failed, []
+        batch_ids, self._finished_batches = self._finished_batches, set()
+        if not (sent or retry or failed):
+            return
+
+        try:
+            await database.complete_outbox_deliveries(sent, retry, failed)
+        except Exception:
+            # Keep the results for the next flush
+            self._sent[:0], self._retry[:0], self._failed[:0] = sent, retry, failed
+            self._finished_batches |= batch_ids
+            raise
+
+        for summary in await database.get_outbox_batch_summaries(list(batch_ids)):
+            if summary['open'] == 0 and await database.claim_outbox_report(summary['batch_id']):
+                await self._report(summary)
+
+    async def _report(self, summary: dict):
+        """
+        Counts the post once for its owner and sends a single delivery report,
+        with buttons to edit or delete the post in every channel it reached.
+        """
+        user_id = summary['user_id']
+        if summary['sent']:
+            await database.increment_user_post_count(user_id)
+        logging.info(f"✅ Outbox batch {summary['batch_id']} finished: {summary['sent']} sent, {summary['failed']} failed")
+        try:
+            lang = await database.get_user_language(user_id) or 'en'
+            text = get_text('broadcast_success', lang).format(count=summary['sent'])
+            if summary['failed']:
+                text += "\n" + get_text('broadcast_partial_failure', lang).format(count=summary['failed'])
+            keyboard = None
+            if summary['sent']:
+                keyboard = get_sent_post_keyboard(lang, summary['post_chat_id'], summary['post_message_id'])
+            await self.bot.send_message(user_id, text, reply_markup=keyboard)
+        except Exception as e:
+            logging.warning(f"Could not send delivery report to user {user_id}: {e}")
+
+    async def _maintenance(self):
+        self._last_maintenance = time.monotonic()
+        requeued = await database.requeue_outbox_leases()
+        if requeued:
+            logging.warning(f"📮 Requeued {requeued} outbox deliveries with expired leases")
+        pruned = await database.prune_outbox(self.retention_days)
+        if pruned:
+            logging.info(f"🗑️ Pruned {pruned} finished outbox deliveries")
+
+    def stats(self) -> dict:
+        """Returns in-memory queue, throughput and scheduled-send lateness counters."""
+        return {
+            'queued': self._queue.qsize() if self._queue else 0,
+            'inflight': self.inflight,
+            'claimed': self.claimed,
+            'delivered': self.delivered,
+            'retried': self.retried,
+            'failed': self.failed,
+            'skipped': self.skipped,
+            'staged': self.staged + len(self._ready),
+            'lateness_p50_ms': self._lateness_percentile(0.5),
+            'lateness_p99_ms': self._lateness_percentile(0.99),
+        }
+
+    def _lateness_percentile(self, q: float) -> Optional[float]:
+        """Delay between a staged post's scheduled time and the start of its send, over the last 1000 sends."""
+        if not self._lateness:
+            return None
+        samples = sorted(self._lateness)
+        return samples[min(len(samples) - 1, int(len(samples) * q))] * 1000
+
+
+outbox_worker = OutboxWorker()
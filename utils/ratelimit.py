@@ -0,0 +1,194 @@
+import asyncio
+import logging
+import time
+from typing import Dict, Optional
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods import Response, SendMediaGroup, TelegramMethod
+from aiogram.methods.base import TelegramType
+
+from utils.metrics import send_rate
+
+# Method classes whose calls post, change or delete messages in a chat and count against Telegram's limits
+LIMITED_METHOD_PREFIXES = ('Send', 'Copy', 'Forward', 'Edit', 'Delete')
+
+
+class TokenBucket:
+    """
+    A token bucket that refills `rate` tokens per second up to `capacity`.
+
+    `reserve()` takes a token immediately, letting the balance go negative,
+    and tells the caller how long to sleep until the reservation is covered.
+    Callers are therefore served in arrival order without a lock. `pause()`
+    stops the refill for a while, e.g. after Telegram asked us to retry later.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        # `updated` lies in the future while the bucket is paused
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def reserve(self, tokens: float = 1) -> float:
+        """
+        Takes `tokens` tokens and returns how many seconds the caller has to
+        wait. Only the first one has to be covered; the rest are a debt later
+        callers wait off, so an album is not held back for its own size.
+        """
+        now = time.monotonic()
+        self._refill(now)
+        self.tokens -= 1
+        covered_at = self.updated + max(0.0, -self.tokens) / self.rate
+        self.tokens -= tokens - 1
+        return max(0.0, covered_at - now)
+
+    def try_take(self) -> bool:
+        """Takes a token only if one is available right now, for callers that would rather skip than wait."""
+        self._refill(time.monotonic())
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+    def pause(self, seconds: float):
+        """Hands out no new tokens for the next `seconds`."""
+        now = time.monotonic()
+        self._refill(now)
+        self.tokens = min(self.tokens, 0)
+        self.updated = max(self.updated, now + seconds)
+
+    def is_idle(self) -> bool:
+        """True when the bucket is full again, i.e. forgetting it loses nothing."""
+        self._refill(time.monotonic())
+        return self.tokens >= self.capacity
+
+
+class RateLimiter:
+    """
+    Global and per-chat token buckets shared by every send path.
+
+    Private chats get `per_chat_rate` messages per second; groups and channels
+    (negative chat ids) get `per_group_per_minute` messages per minute. Every
+    request also takes a token from the global bucket.
+
+    Without explicit rates, RATE_LIMIT_GLOBAL and RATE_LIMIT_PER_GROUP_PER_MINUTE
+    are limits of the whole bot, split evenly between its REPLICAS since each
+    has its own buckets and all of them may send to the same channel. Sends
+    only the leader makes (sent-post edits and deletes, answers to users) get
+    just that share of a channel's per-minute budget too.
+    """
+
+    # Idle per-chat buckets are dropped once there are more than this many
+    MAX_IDLE_BUCKETS = 10000
+
+    def __init__(self, global_rate: Optional[float] = None, per_chat_rate: Optional[float] = None,
+                 per_group_per_minute: Optional[float] = None):
+        from config import RATE_LIMIT_GLOBAL, RATE_LIMIT_PER_CHAT, RATE_LIMIT_PER_GROUP_PER_MINUTE, REPLICAS
+        replicas = max(1, REPLICAS)
+        global_rate = global_rate or RATE_LIMIT_GLOBAL / replicas
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.per_chat_rate = per_chat_rate or RATE_LIMIT_PER_CHAT
+        self.per_group_rate = (per_group_per_minute or RATE_LIMIT_PER_GROUP_PER_MINUTE / replicas) / 60
+        self.chat_buckets: Dict[int, TokenBucket] = {}
+        self.waiting = 0
+        self.max_waiting = 0
+        self.requests = 0
+        self.delayed = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.pauses = 0
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self.chat_buckets) >= self.MAX_IDLE_BUCKETS:
+                self._prune()
+            if chat_id < 0:
+                bucket = TokenBucket(self.per_group_rate, 1)
+            else:
+                bucket = TokenBucket(self.per_chat_rate, 1)
+            self.chat_buckets[chat_id] = bucket
+        return bucket
+
+    def _prune(self):
+        for chat_id in [c for c, b in self.chat_buckets.items() if b.is_idle()]:
+            del self.chat_buckets[chat_id]
+
+    async def acquire(self, chat_id: Optional[int] = None, messages: int = 1) -> float:
+        """Waits until `messages` messages may be sent to `chat_id`; returns the time spent waiting."""
+        self.requests += 1
+        wait = 0.0
+        self.waiting += 1
+        self.max_waiting = max(self.max_waiting, self.waiting)
+        try:
+            # The chat lane first, so a busy chat does not hold global tokens while it waits
+            if isinstance(chat_id, int):
+                chat_wait = self._chat_bucket(chat_id).reserve(messages)
+                if chat_wait > 0:
+                    await asyncio.sleep(chat_wait)
+                    wait += chat_wait
+            global_wait = self.global_bucket.reserve(messages)
+            if global_wait > 0:
+                await asyncio.sleep(global_wait)
+                wait += global_wait
+        finally:
+            self.waiting -= 1
+
+        if wait > 0:
+            self.delayed += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+        return wait
+
+    def pause(self, chat_id: Optional[int], seconds: float):
+        """Pauses one chat's lane, or the global lane when there is no chat id."""
+        self.pauses += 1
+        if isinstance(chat_id, int):
+            self._chat_bucket(chat_id).pause(seconds)
+        else:
+            self.global_bucket.pause(seconds)
+
+    def stats(self) -> dict:
+        """Returns queue depth and wait-time metrics."""
+        return {
+            'requests': self.requests,
+            'delayed': self.delayed,
+            'queue_depth': self.waiting,
+            'max_queue_depth': self.max_waiting,
+            'avg_wait_ms': (self.total_wait / self.delayed * 1000) if self.delayed else 0.0,
+            'max_wait_ms': self.max_wait * 1000,
+            'chat_buckets': len(self.chat_buckets),
+            'pauses': self.pauses,
+        }
+
+
+class RateLimitMiddleware(BaseRequestMiddleware):
+    """Bot session middleware that makes every sending request wait for the rate limiter."""
+
+    def __init__(self, limiter: RateLimiter):
+        self.limiter = limiter
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        if type(method).__name__.startswith(LIMITED_METHOD_PREFIXES):
+            # Every part of an album counts against the limits
+            messages = len(method.media) if isinstance(method, SendMediaGroup) else 1
+            send_rate.mark(messages)
+            wait = await self.limiter.acquire(getattr(method, 'chat_id', None), messages)
+            if wait > 1:
+                logging.debug(f"⏳ {type(method).__name__} to {getattr(method, 'chat_id', None)} waited {wait:.2f}s for the rate limiter")
+        return await make_request(bot, method)
+
+
+rate_limiter = RateLimiter()
@@ -0,0 +1,213 @@
+import asyncio
+import logging
+from datetime import datetime, time, timedelta, timezone
+from typing import Iterable, List, Optional, Tuple
+
+import jdatetime
+from aiogram import Bot
+from pytz import timezone as pytz_timezone
+
+import database
+from texts import get_text
+from utils.metrics import misfires
+from utils.outbox import outbox_worker
+
+KINDS = ('daily', 'weekly', 'monthly')
+
+# Jalali weekdays as jdatetime numbers them: 0 is Saturday
+WEEKDAY_NAMES = {
+    'fa': ["شنبه", "یکشنبه", "دوشنبه", "سه‌شنبه", "چهارشنبه", "پنجشنبه", "جمعه"],
+    'en': ["Saturday", "Sunday", "Monday", "Tuesday", "Wednesday", "Thursday", "Friday"],
+}
+
+# Same tolerance as one-shot jobs: an occurrence more than this late is skipped, not sent
+MISFIRE_GRACE_SECONDS = 3600
+
+TEHRAN = pytz_timezone('Asia/Tehran')
+
+
+def format_weekdays(weekdays: Iterable[int]) -> str:
+    return ','.join(str(day) for day in sorted(set(weekdays)))
+
+
+def parse_weekdays(weekdays: Optional[str]) -> List[int]:
+    return [int(day) for day in weekdays.split(',')] if weekdays else []
+
+
+def _jalali_month_length(day: jdatetime.date) -> int:
+    if day.month <= 6:
+        return 31
+    if day.month <= 11:
+        return 30
+    return 30 if day.isleap() else 29
+
+
+def next_occurrence(kind: str, time_of_day: str, weekdays: Optional[str], month_day: Optional[int],
+                    after: datetime) -> datetime:
+    """
+    The first fire time (UTC) strictly after `after` for a rule firing at
+    `time_of_day` (HH:MM, Tehran) every day, on the given Jalali weekdays, or on
+    a Jalali day of the month (the last day in months that are shorter).
+    """
+    hour, minute = map(int, time_of_day.split(':'))
+    days = set(parse_weekdays(weekdays))
+    day = after.astimezone(TEHRAN).date()
+    # A monthly rule matches at least once in any two consecutive months
+    for _ in range(64):
+        jalali = jdatetime.date.fromgregorian(date=day)
+        if kind == 'daily':
+            matches = True
+        elif kind == 'weekly':
+            matches = jalali.weekday() in days
+        else:
+            matches = jalali.day == min(month_day, _jalali_month_length(jalali))
+        if matches:
+            fire = TEHRAN.localize(datetime.combine(day, time(hour, minute))).astimezone(timezone.utc)
+            if fire > after:
+                return fire
+        day += timedelta(days=1)
+    raise ValueError(f"Recurrence {kind} {weekdays or month_day} at {time_of_day} never fires")
+
+
+def describe(kind: str, time_of_day: str, weekdays: Optional[str], month_day: Optional[int], lang: str) -> str:
+    """Human-readable form of a rule, e.g. 'every week on Saturday, Monday at 20:00'."""
+    if kind == 'weekly':
+        names = WEEKDAY_NAMES.get(lang, WEEKDAY_NAMES['en'])
+        separator = '، ' if lang == 'fa' else ', '
+        days = separator.join(names[day] for day in parse_weekdays(weekdays))
+        return get_text('recurrence_weekly', lang).format(days=days, time=time_of_day)
+    if kind == 'monthly':
+        return get_text('recurrence_monthly', lang).format(day=month_day, time=time_of_day)
+    return get_text('recurrence_daily', lang).format(time=time_of_day)
+
+
+class RecurringDispatcher:
+    """
+    Fires recurring post rules from their indexed `next_fire_utc`.
+
+    Each rule is one row however often it repeats: when it is due the loop
+    queues its deliveries in the outbox and moves `next_fire_utc` to the next
+    occurrence in the same transaction, then sleeps until the earliest rule is
+    due. Occurrences missed while the bot was down are sent once if they are
+    within MISFIRE_GRACE_SECONDS, otherwise skipped. Quotas are checked again
+    at every occurrence: channels over their monthly limit, or every channel
+    when the owner is over theirs, are left out and the owner is told.
+    """
+
+    def __init__(self):
+        self.bot: Optional[Bot] = None
+        self._task: Optional[asyncio.Task] = None
+        self._wake: Optional[asyncio.Event] = None
+        self.fired = 0
+        self.skipped = 0
+        self.over_quota = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self, bot: Bot, batch_size: int = 100, max_sleep: float = 60):
+        if self.running:
+            return
+        self.bot = bot
+        self.batch_size = batch_size
+        self.max_sleep = max_sleep
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+        logging.info("🔁 Recurring post dispatcher started")
+
+    def wake(self):
+        """Makes the loop re-read the earliest fire time, e.g. after a rule was added."""
+        if self._wake is not None:
+            self._wake.set()
+
+    async def stop(self):
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+    async def _run(self):
+        while self.running:  # see OutboxWorker._run
+            try:
+                self._wake.clear()
+                now = datetime.now(timezone.utc)
+                due = await database.get_due_recurring_posts(now.isoformat(), self.batch_size)
+                if due:
+                    await self._fire(due, now)
+                    if len(due) == self.batch_size:
+                        continue
+
+                next_fire = await database.get_next_recurring_fire()
+                timeout = self.max_sleep
+                if next_fire is not None:
+                    timeout = min(timeout, (datetime.fromisoformat(next_fire) - datetime.now(timezone.utc)).total_seconds())
+                try:
+                    await asyncio.wait_for(self._wake.wait(), max(0.0, timeout))
+                except asyncio.TimeoutError:
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"❌ Recurring dispatcher error: {e}")
+                await asyncio.sleep(5)
+
+    async def _fire(self, due: List[database.RecurringPost], now: datetime):
+        on_time = {rule.rule_id for rule in due
+                   if (now - datetime.fromisoformat(rule.next_fire_utc)).total_seconds() <= MISFIRE_GRACE_SECONDS}
+        targets = await database.get_recurring_post_targets(list(on_time))
+        fires = []
+        notices = []
+        for rule in due:
+            fire_time = datetime.fromisoformat(rule.next_fire_utc)
+            next_fire = next_occurrence(rule.kind, rule.time_of_day, rule.weekdays, rule.month_day, max(now, fire_time))
+            channel_ids = []
+            if rule.rule_id in on_time:
+                user_id, rule_channels = targets.get(rule.rule_id, (None, []))
+                channel_ids, over_quota = await self._within_quota(user_id, rule_channels)
+                if over_quota:
+                    logging.warning(f"🚫 Recurring post {rule.rule_id} skips {len(over_quota)} channels over quota")
+                    notices.append((user_id, rule, len(over_quota)))
+                if channel_ids:
+                    self.fired += 1
+                else:
+                    self.over_quota += 1
+            else:
+                self.skipped += 1
+                misfires.inc(label='recurring')
+                logging.warning(f"⏭️ Skipped recurring post {rule.rule_id} due at {rule.next_fire_utc}, next at {next_fire}")
+            fires.append((rule.rule_id, rule.next_fire_utc, next_fire.isoformat(), channel_ids))
+
+        queued = await database.fire_recurring_posts(fires)
+        if queued:
+            outbox_worker.wake()
+        logging.info(f"🔁 Fired {sum(1 for fire in fires if fire[3])} recurring posts ({queued} deliveries)")
+        for user_id, rule, count in notices:
+            await self._notify_over_quota(user_id, rule, count)
+
+    @staticmethod
+    async def _within_quota(user_id: int, channel_ids: List[int]) -> Tuple[List[int], List[int]]:
+        """Splits a rule's channels into those its owner may still post to this month and those over quota."""
+        can_send, _ = await database.can_user_send_post(user_id)
+        if not can_send:
+            return [], list(channel_ids)
+        allowed, over_quota = [], []
+        for channel_id in channel_ids:
+            can_send, _ = await database.can_channel_send_post(channel_id, user_id)
+            (allowed if can_send else over_quota).append(channel_id)
+        return allowed, over_quota
+
+    async def _notify_over_quota(self, user_id: int, rule: database.RecurringPost, count: int):
+        try:
+            lang = await database.get_user_language(user_id) or 'en'
+            text = get_text('recurring_over_quota', lang).format(
+                rule=describe(rule.kind, rule.time_of_day, rule.weekdays, rule.month_day, lang), count=count)
+            await self.bot.send_message(user_id, text)
+        except Exception as e:
+            logging.warning(f"Could not tell user {user_id} about recurring post {rule.rule_id} over quota: {e}")
+
+    def stats(self) -> dict:
+        return {'fired': self.fired, 'skipped': self.skipped, 'over_quota': self.over_quota}
+
+
+recurring_dispatcher = RecurringDispatcher()
@@ -0,0 +1,174 @@
+import asyncio
+import logging
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import (
+    TelegramBadRequest,
+    TelegramEntityTooLarge,
+    TelegramForbiddenError,
+    TelegramMigrateToChat,
+    TelegramNetworkError,
+    TelegramNotFound,
+    TelegramRetryAfter,
+    TelegramServerError,
+    TelegramUnauthorizedError,
+)
+from aiogram.methods import GetUpdates, Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+
+from utils.ratelimit import LIMITED_METHOD_PREFIXES, RateLimiter, rate_limiter
+
+ERROR_RETRY_AFTER = 'retry_after'
+ERROR_TRANSIENT = 'transient'
+ERROR_PERMANENT = 'permanent'
+
+# Methods that post a new message: repeating one after an ambiguous failure can post it twice
+NON_IDEMPOTENT_METHOD_PREFIXES = ('Send', 'Copy', 'Forward')
+
+# aiohttp errors raised before a connection to the API existed. aiogram wraps
+# them in TelegramNetworkError with only the class name left in the message.
+NOT_CONNECTED_ERRORS = ('ClientConnectorError', 'ClientProxyConnectionError', 'UnixClientConnectorError',
+                        'ClientSSLError', 'ClientConnectorSSLError', 'ClientConnectorCertificateError')
+
+_caller_retries: ContextVar[bool] = ContextVar('caller_retries', default=False)
+
+
+def classify_error(error: BaseException) -> str:
+    """
+    Sorts a send failure into ERROR_RETRY_AFTER (flood control), ERROR_TRANSIENT
+    (network and server errors worth retrying) or ERROR_PERMANENT (bot kicked,
+    chat not found, malformed request...), which must never be retried.
+    """
+    if isinstance(error, TelegramRetryAfter):
+        return ERROR_RETRY_AFTER
+    if isinstance(error, (TelegramForbiddenError, TelegramNotFound, TelegramBadRequest,
+                          TelegramUnauthorizedError, TelegramMigrateToChat, TelegramEntityTooLarge)):
+        return ERROR_PERMANENT
+    if isinstance(error, (TelegramNetworkError, TelegramServerError, asyncio.TimeoutError, ConnectionError)):
+        return ERROR_TRANSIENT
+    return ERROR_PERMANENT
+
+
+def never_reached_telegram(error: BaseException) -> bool:
+    """
+    True when a failed request provably was not carried out: flood control
+    rejected it, or no connection to the API could be opened. A timeout or a
+    dropped connection is ambiguous, since the message may have gone out.
+    """
+    if isinstance(error, TelegramRetryAfter):
+        return True
+    if isinstance(error, ConnectionRefusedError):
+        return True
+    return isinstance(error, TelegramNetworkError) and error.message.startswith(NOT_CONNECTED_ERRORS)
+
+
+@contextmanager
+def caller_retries():
+    """
+    Requests made inside go out once: the session does not retry them and the
+    caller owns attempts and backoff, as the outbox does. Flood control still
+    pauses the rate limiter lane so other requests wait it out.
+    """
+    token = _caller_retries.set(True)
+    try:
+        yield
+    finally:
+        _caller_retries.reset(token)
+
+
+class RetryMiddleware(BaseRequestMiddleware):
+    """
+    Bot session middleware that retries failed requests.
+
+    On TelegramRetryAfter the affected chat's lane (or the global lane) of the
+    rate limiter is paused for `retry_after` seconds and the request is queued
+    again behind it. Transient network/server errors are retried with bounded
+    exponential backoff and jitter, except that a request posting a new
+    message is only retried when it never reached Telegram (see
+    never_reached_telegram). Permanent errors are raised immediately, and
+    requests made under caller_retries() are never retried here.
+    """
+
+    def __init__(self, limiter: Optional[RateLimiter] = None, max_attempts: Optional[int] = None,
+                 base_delay: Optional[float] = None, max_delay: Optional[float] = None,
+                 max_retry_after: Optional[float] = None):
+        from config import SEND_MAX_ATTEMPTS, SEND_RETRY_BASE_DELAY, SEND_RETRY_MAX_DELAY, SEND_MAX_RETRY_AFTER
+        self.limiter = limiter
+        self.max_attempts = max_attempts or SEND_MAX_ATTEMPTS
+        self.base_delay = base_delay or SEND_RETRY_BASE_DELAY
+        self.max_delay = max_delay or SEND_RETRY_MAX_DELAY
+        self.max_retry_after = max_retry_after or SEND_MAX_RETRY_AFTER
+        self.retries = 0
+        self.flood_waits = 0
+        self.gave_up = 0
+        self.ambiguous = 0
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        # Long polling has its own backoff in the dispatcher
+        if isinstance(method, GetUpdates):
+            return await make_request(bot, method)
+
+        chat_id = getattr(method, 'chat_id', None)
+        limited = type(method).__name__.startswith(LIMITED_METHOD_PREFIXES)
+        attempt = 1
+        while True:
+            try:
+                return await make_request(bot, method)
+            except Exception as e:
+                kind = classify_error(e)
+                if _caller_retries.get():
+                    if kind == ERROR_RETRY_AFTER and self.limiter is not None and limited:
+                        self.flood_waits += 1
+                        self.limiter.pause(chat_id, e.retry_after)
+                    raise
+                if (kind == ERROR_TRANSIENT and type(method).__name__.startswith(NON_IDEMPOTENT_METHOD_PREFIXES)
+                        and not never_reached_telegram(e)):
+                    # The message may already be in the chat; retrying could post it twice
+                    self.ambiguous += 1
+                    raise
+                if kind == ERROR_PERMANENT or attempt >= self.max_attempts:
+                    if kind != ERROR_PERMANENT:
+                        self.gave_up += 1
+                    raise
+
+                if kind == ERROR_RETRY_AFTER:
+                    if e.retry_after > self.max_retry_after:
+                        self.gave_up += 1
+                        raise
+                    self.flood_waits += 1
+                    logging.warning(f"🚧 Flood control on {type(method).__name__} to {chat_id}, pausing {e.retry_after}s (attempt {attempt})")
+                    if self.limiter is not None and limited:
+                        # The rate limiter middleware below makes the retry wait for the paused lane
+                        self.limiter.pause(chat_id, e.retry_after)
+                    else:
+                        await asyncio.sleep(e.retry_after)
+                else:
+                    delay = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+                    delay *= random.uniform(0.5, 1.0)
+                    logging.warning(f"🔁 {type(method).__name__} to {chat_id} failed with {type(e).__name__}, retrying in {delay:.1f}s (attempt {attempt})")
+                    await asyncio.sleep(delay)
+
+                self.retries += 1
+                attempt += 1
+
+    def stats(self) -> dict:
+        """Returns retry counters."""
+        return {
+            'retries': self.retries,
+            'flood_waits': self.flood_waits,
+            'gave_up': self.gave_up,
+            'ambiguous': self.ambiguous,
+        }
+
+
+retry_middleware = RetryMiddleware(rate_limiter)
@@ -1,70 +1,270 @@
+import asyncio
+import heapq
 import logging
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
 from aiogram import Bot
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+
 import database
+from utils.outbox import outbox_worker
+
+_catchup_task: Optional[asyncio.Task] = None
+
 
-async def send_scheduled_post(job_id: str, bot: Bot):
+async def send_scheduled_post(job_id: str, bot: Bot, run_date: Optional[datetime] = None):
     """
-    This function is executed by the scheduler.
-    It retrieves post details from the DB and sends the post.
+    This function is executed by the scheduler, once per scheduled post.
+    It moves the post's deliveries to all target channels into the outbox,
+    whose workers send them and send the user one consolidated report.
+
+    When `run_date` is given the job runs PREFIRE_LEAD_SECONDS early and only
+    stages the deliveries, so at `run_date` just the API calls remain.
     """
     logging.info(f"🕒 Executing scheduled job: {job_id}")
-    
+
     try:
-        post_data = await database.get_scheduled_post(job_id)
+        if run_date is not None and outbox_worker.running:
+            queued = await stage_scheduled_posts({job_id: run_date.timestamp()})
+        else:
+            queued = await database.enqueue_scheduled_batch(job_id)
+            outbox_worker.wake()
 
-        if not post_data:
+        if not queued:
             logging.error(f"❌ Could not find scheduled post with job_id: {job_id}")
             return
 
-        # Unpack data from the database record
-        _, user_id, post_chat_id, post_message_id, target_channel_id, caption, scheduled_time = post_data
-        
-        logging.info(f"📤 Sending scheduled post: user={user_id}, channel={target_channel_id}, message={post_message_id}")
-
-        # Send the post with the caption that already includes footer (if any)
-        await bot.copy_message(
-            chat_id=target_channel_id,
-            from_chat_id=post_chat_id,
-            message_id=post_message_id,
-            caption=caption if caption else None,
-            parse_mode="HTML"
-        )
-        
-        # Increment user's post count for scheduled posts too
-        await database.increment_user_post_count(user_id)
-        
-        # Also increment channel post count (channel-based system)
-        try:
-            await database.increment_channel_post_count(target_channel_id, user_id)
-        except Exception as e:
-            logging.error(f"Error incrementing channel post count for scheduled post: {e}")
-        
-        logging.info(f"✅ Successfully sent scheduled post from job {job_id} to channel {target_channel_id}")
-        
-        # Notify user about successful delivery
-        try:
-            user_lang = await database.get_user_language(user_id) or 'en'
-            success_msg = "✅ پست زمان‌بندی شده شما با موفقیت ارسال شد!" if user_lang == 'fa' else "✅ Your scheduled post was sent successfully!"
-            await bot.send_message(user_id, success_msg)
-        except Exception as notify_error:
-            logging.warning(f"Could not notify user {user_id} about successful delivery: {notify_error}")
+        logging.info(f"📮 Queued scheduled post from job {job_id} for delivery to {queued} channels")
 
     except Exception as e:
-        logging.error(f"❌ Failed to send scheduled post for job {job_id}: {e}")
-        
-        # Try to notify user about the failure
+        logging.error(f"❌ Failed to queue scheduled post for job {job_id}: {e}")
+
+
+def schedule_post_job(scheduler: AsyncIOScheduler, job_id: str, run_date: datetime, bot: Bot):
+    """Registers the job that fires a scheduled post with whichever dispatcher is running."""
+    if post_dispatcher.running:
+        post_dispatcher.add(job_id, run_date)
+        return
+    from config import PREFIRE_LEAD_SECONDS
+    scheduler.add_job(
+        send_scheduled_post,
+        trigger='date',
+        run_date=run_date - timedelta(seconds=PREFIRE_LEAD_SECONDS),
+        args=[job_id, bot, run_date if PREFIRE_LEAD_SECONDS else None],
+        id=job_id,
+        misfire_grace_time=3600,  # Allow to run up to 1h late
+        max_instances=1,  # Prevent duplicate execution
+        replace_existing=True
+    )
+
+
+async def rehydrate_scheduled_posts(scheduler: AsyncIOScheduler, bot: Bot) -> dict:
+    """
+    Re-registers the jobs of every pending scheduled post after a restart.
+
+    The scheduler keeps jobs in memory only, while `scheduled_batches` is durable,
+    so the table is the source of truth: future posts get their job back, and
+    posts that became due while the bot was down are caught up in throttled
+    batches in the background instead of all at once.
+    """
+    global _catchup_task
+    started = time.perf_counter()
+    rows = await database.get_pending_scheduled_batches()
+    loaded = time.perf_counter()
+
+    now = datetime.now(timezone.utc)
+    cutoff = now.isoformat()
+    past_due = 0
+    for job_id, scheduled_time_utc in rows:
+        run_date = datetime.fromisoformat(scheduled_time_utc)
+        if run_date <= now:
+            past_due += 1
+            continue
+        schedule_post_job(scheduler, job_id, run_date, bot)
+    finished = time.perf_counter()
+
+    stats = {
+        'pending': len(rows),
+        'registered': len(rows) - past_due,
+        'past_due': past_due,
+        'query_ms': (loaded - started) * 1000,
+        'register_ms': (finished - loaded) * 1000,
+    }
+    logging.info(f"♻️ Rehydrated {stats['registered']} scheduled posts in {(finished - started):.2f}s "
+                 f"(query {stats['query_ms']:.0f}ms), {past_due} past due")
+
+    if past_due and (_catchup_task is None or _catchup_task.done()):
+        _catchup_task = asyncio.create_task(catch_up_past_due_posts(cutoff))
+    return stats
+
+
+async def stage_scheduled_posts(due_at: Dict[str, float]) -> int:
+    """
+    Moves the given posts into the outbox already leased and hands their
+    deliveries to the outbox worker, to be sent at their epoch time in `due_at`.
+    Returns the number of deliveries staged.
+    """
+    deliveries = await database.stage_scheduled_batches(list(due_at), outbox_worker.lease_seconds, outbox_worker.instance_id)
+    deliveries = await outbox_worker.skip_unhealthy(deliveries)
+    by_batch = defaultdict(list)
+    for delivery in deliveries:
+        by_batch[delivery.batch_id].append(delivery)
+    for batch_id, batch in by_batch.items():
+        outbox_worker.stage(batch, due_at[batch_id])
+    return len(deliveries)
+
+
+async def catch_up_past_due_posts(due_before: str, batch_size: Optional[int] = None,
+                                  interval: Optional[float] = None) -> int:
+    """Moves posts that were due before `due_before` into the outbox, one throttled batch at a time."""
+    if batch_size is None or interval is None:
+        from config import SCHEDULE_CATCHUP_BATCH_SIZE, SCHEDULE_CATCHUP_INTERVAL
+        batch_size = batch_size or SCHEDULE_CATCHUP_BATCH_SIZE
+        interval = SCHEDULE_CATCHUP_INTERVAL if interval is None else interval
+
+    total = 0
+    while True:
         try:
-            if 'user_id' in locals():
-                user_lang = await database.get_user_language(user_id) or 'en'
-                error_msg = f"❌ خطا در ارسال پست زمان‌بندی شده: {str(e)}" if user_lang == 'fa' else f"❌ Error sending scheduled post: {str(e)}"
-                await bot.send_message(user_id, error_msg)
-        except Exception as notify_error:
-            logging.warning(f"Could not notify user about delivery failure: {notify_error}")
-
-    finally:
-        # Clean up the database
+            queued = await database.enqueue_due_scheduled_batches(due_before, batch_size)
+        except Exception as e:
+            logging.error(f"❌ Scheduled post catch-up failed after {total} posts: {e}")
+            return total
+        total += queued
+        if queued:
+            outbox_worker.wake()
+        if queued < batch_size:
+            break
+        await asyncio.sleep(interval)
+
+    logging.info(f"⏩ Caught up {total} past-due scheduled posts")
+    return total
+
+
+class PagedDispatcher:
+    """
+    Fires scheduled posts from a min-heap that holds only the next page of posts.
+
+    APScheduler keeps a Job object per pending post, so memory and add_job cost
+    grow with the backlog. Here `scheduled_batches` stays the only full copy:
+    the dispatcher pages posts due within `window` seconds into the heap in
+    (scheduled_time_utc, batch_id) order through a keyset cursor, never holding
+    more than about `page_size` of them, and fires due posts in bulk.
+    """
+
+    def __init__(self):
+        self.bot: Optional[Bot] = None
+        self._heap: List[Tuple[float, str, str]] = []
+        self._cursor: Tuple[str, str] = ('', '')
+        self._task: Optional[asyncio.Task] = None
+        self._wake: Optional[asyncio.Event] = None
+        self.fired = 0
+        self.pages = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self, bot: Bot, window: Optional[float] = None, page_size: Optional[int] = None):
+        """Starts the dispatch loop; posts that became due while the bot was down are caught up first."""
+        if self.running:
+            return
+        from config import SCHEDULER_WINDOW_SECONDS, SCHEDULER_PAGE_SIZE, PREFIRE_LEAD_SECONDS
+        self.bot = bot
+        self.window = window or SCHEDULER_WINDOW_SECONDS
+        self.page_size = page_size or SCHEDULER_PAGE_SIZE
+        self.lead = PREFIRE_LEAD_SECONDS
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._run(datetime.now(timezone.utc).isoformat()))
+        logging.info(f"🎡 Paged dispatcher started (window {self.window:.0f}s, page {self.page_size})")
+
+    def wake(self):
+        if self._wake is not None:
+            self._wake.set()
+
+    async def stop(self):
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+    def add(self, batch_id: str, run_date: datetime):
+        """Takes a newly scheduled post; posts beyond the cursor are paged in when their time comes."""
+        key = (run_date.isoformat(), batch_id)
+        if key <= self._cursor:
+            heapq.heappush(self._heap, (run_date.timestamp(), key[0], batch_id))
+            self.wake()
+
+    async def _run(self, cutoff: str):
+        await catch_up_past_due_posts(cutoff)
+        self._cursor = (cutoff, '')
+
+        while self.running:  # see OutboxWorker._run
+            try:
+                self._wake.clear()
+                if len(self._heap) < self.page_size // 2:
+                    await self._page_in()
+
+                now = time.time()
+                due = []
+                while self._heap and self._heap[0][0] <= now + self.lead and len(due) < 500:
+                    due.append(heapq.heappop(self._heap))
+                if due:
+                    await self._fire(due)
+                    continue
+
+                # Sleep until the next post is due, but look for new pages well within the window
+                timeout = self.window / 4
+                if self._heap:
+                    timeout = min(timeout, self._heap[0][0] - self.lead - now)
+                try:
+                    await asyncio.wait_for(self._wake.wait(), max(0.0, timeout))
+                except asyncio.TimeoutError:
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"❌ Paged dispatcher error: {e}")
+                await asyncio.sleep(1)
+
+    async def _page_in(self):
+        horizon = datetime.fromtimestamp(time.time() + self.window, timezone.utc).isoformat()
+        limit = self.page_size - len(self._heap)
+        rows = await database.get_scheduled_batches_page(self._cursor, horizon, limit)
+        for batch_id, scheduled_time_utc in rows:
+            heapq.heappush(self._heap, (datetime.fromisoformat(scheduled_time_utc).timestamp(), scheduled_time_utc, batch_id))
+        if rows:
+            self._cursor = (rows[-1][1], rows[-1][0])
+            self.pages += 1
+        if len(rows) < limit:
+            # Everything up to the horizon is in memory, so add() must take posts up to it
+            self._cursor = max(self._cursor, (horizon, '\U0010ffff'))
+
+    async def _fire(self, due: List[Tuple[float, str, str]]):
         try:
-            await database.delete_scheduled_post(job_id)
-            logging.info(f"🗑️ Cleaned up scheduled post {job_id} from database")
-        except Exception as cleanup_error:
-            logging.error(f"❌ Failed to cleanup scheduled post {job_id}: {cleanup_error}")
\ No newline at end of file
+            if self.lead and outbox_worker.running:
+                queued = await stage_scheduled_posts({batch_id: due_at for due_at, _, batch_id in due})
+            else:
+                queued = await database.enqueue_scheduled_batches([batch_id for _, _, batch_id in due])
+                outbox_worker.wake()
+        except Exception as e:
+            logging.error(f"❌ Failed to queue {len(due)} scheduled posts, retrying shortly: {e}")
+            retry_at = time.time() + 5
+            for _, scheduled_time_utc, batch_id in due:
+                heapq.heappush(self._heap, (retry_at, scheduled_time_utc, batch_id))
+            return
+        self.fired += len(due)
+        logging.info(f"📮 Dispatched {len(due)} scheduled posts ({queued} deliveries)")
+
+    def stats(self) -> dict:
+        return {
+            'in_memory': len(self._heap),
+            'fired': self.fired,
+            'pages': self.pages,
+            'cursor': self._cursor[0],
+        }
+
+
+post_dispatcher = PagedDispatcher()
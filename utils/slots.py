@@ -0,0 +1,83 @@
+import math
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Tuple
+
+import database
+
+
+def _channel_spacing() -> int:
+    """Whole seconds between two deliveries to one channel at RATE_LIMIT_PER_GROUP_PER_MINUTE."""
+    from config import RATE_LIMIT_PER_GROUP_PER_MINUTE
+    return max(1, math.ceil(60 / RATE_LIMIT_PER_GROUP_PER_MINUTE))
+
+
+async def pick_fire_time(requested: datetime, channel_ids: List[int]) -> datetime:
+    """
+    Returns when a post scheduled for `requested` should actually fire.
+
+    Scheduling only takes HH:MM, so posts pile up on the same second. The post
+    keeps its time while that second has room for its deliveries (the send
+    rate of all replicas together); otherwise it moves to the first second
+    within SCHEDULE_JITTER_SECONDS that has room, or the least loaded one. It
+    never fires early, and fires at least one per-channel interval after any
+    post already placed in the window for one of its channels, so per-channel
+    order is kept and the channel's own rate limit is not hit.
+    """
+    from config import SCHEDULE_JITTER_SECONDS, RATE_LIMIT_GLOBAL
+    capacity = RATE_LIMIT_GLOBAL
+    jitter = int(SCHEDULE_JITTER_SECONDS)
+    if jitter <= 0:
+        return requested
+
+    start = requested.astimezone(timezone.utc)
+    end = start + timedelta(seconds=jitter + 1)
+    load = Counter()
+    for scheduled_time_utc, deliveries in await database.get_scheduled_load(start.isoformat(), end.isoformat()):
+        load[int((datetime.fromisoformat(scheduled_time_utc) - start).total_seconds())] += deliveries
+
+    # Posts just before the requested second still need the spacing
+    spacing = _channel_spacing()
+    first = 0
+    last = await database.get_last_scheduled_time_for_channels(
+        (start - timedelta(seconds=spacing)).isoformat(), end.isoformat(), channel_ids)
+    if last is not None:
+        first = max(0, int((datetime.fromisoformat(last) - start).total_seconds()) + spacing)
+    if first > jitter:
+        return start + timedelta(seconds=first)
+
+    offsets = range(first, jitter + 1)
+    offset = next((o for o in offsets if load[o] + len(channel_ids) <= capacity), None)
+    if offset is None:
+        offset = min(offsets, key=lambda o: (load[o], o))
+    return start + timedelta(seconds=offset)
+
+
+async def get_minute_forecast(start: datetime, minutes: int) -> List[Tuple[datetime, int]]:
+    """Deliveries already scheduled in each minute from `start` (rounded down) on, as (minute, deliveries)."""
+    start = start.astimezone(timezone.utc).replace(second=0, microsecond=0)
+    end = start + timedelta(minutes=minutes)
+    load = Counter()
+    for scheduled_time_utc, deliveries in await database.get_scheduled_load(start.isoformat(), end.isoformat()):
+        load[datetime.fromisoformat(scheduled_time_utc).replace(second=0, microsecond=0)] += deliveries
+    return [(minute, load[minute]) for minute in (start + timedelta(minutes=i) for i in range(minutes))]
+
+
+async def check_slot(requested: datetime, around: int = 15, suggestions: int = 3) -> Tuple[int, Optional[List[datetime]]]:
+    """
+    Returns the deliveries already scheduled in the requested minute and, when
+    that reaches SCHEDULE_BUSY_SLOT_DELIVERIES, the least crowded future minutes
+    within `around` minutes of it, closest first. Suggestions are None otherwise.
+    """
+    from config import SCHEDULE_BUSY_SLOT_DELIVERIES
+    requested = requested.astimezone(timezone.utc).replace(second=0, microsecond=0)
+    forecast = await get_minute_forecast(requested - timedelta(minutes=around), 2 * around + 1)
+    busy = dict(forecast)[requested]
+    if busy < SCHEDULE_BUSY_SLOT_DELIVERIES:
+        return busy, None
+
+    now = datetime.now(timezone.utc)
+    quiet = [(load, abs(minute - requested), minute) for minute, load in forecast
+             if minute > now and load < SCHEDULE_BUSY_SLOT_DELIVERIES]
+    quiet.sort()
+    return busy, sorted((minute for _, _, minute in quiet[:suggestions]), key=lambda minute: abs(minute - requested))